@@ -1,23 +1,100 @@
 #!/usr/bin/env python3
-"""Archive CI logs by gzipping all uncompressed files in ci-logs directory."""
+"""Archive CI logs by compressing (gzip or zstd) all uncompressed files in a ci-logs directory.
 
-import argparse
-import gzip
-import os
-import sys
+--preset picks the compression level for throughput or ratio (--level sets
+it explicitly). Files are compressed in parallel on a process pool (all
+cores by default), streamed in chunks and written to a temporary file that
+atomically replaces the original, so a crash never leaves a truncated log
+behind.
 
-# Gzip magic bytes
-GZIP_MAGIC = b"\x1f\x8b"
+Archived files are recorded in a journal (path, size, mtime) in the archive
+directory, and each run directory whose files are all compressed gets an
+archived marker. Later invocations skip marked runs without listing them
+and trust journaled files without opening them, so archiving scales with
+the number of new files rather than the size of the history.
 
+With --codec zstd --dictionary, files are compressed with a zstd dictionary
+trained on a sample of build logs and junit files and stored in the
+archive directory, which suits the many small, similar logs of CI runs.
 
-def is_gzipped(filepath: str) -> bool:
-    """Check if a file is already gzip compressed by reading magic bytes."""
-    try:
-        with open(filepath, "rb") as f:
-            magic = f.read(2)
-            return magic == GZIP_MAGIC
-    except (IOError, OSError):
-        return False
+With --seekable, files are written as independently compressed 1 MiB frames
+with a seek table, so classify-failures.py can read ranges and tails of a
+log without decompressing it from the start.
+
+With --bundle, each run directory is packed into a single indexed ZIP file
+(see run_bundle.py) that classify-failures.py reads members from directly,
+which cuts the inode count of a synced tree by orders of magnitude.
+
+With --dedup, files with identical (decompressed) content are stored once:
+each file is hashed and hardlinked to <directory>/.objects/<sha256>, so
+readers see ordinary files while the data exists on disk only once.
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from log_codecs import (
+    ARCHIVED_MARKER,
+    CODECS,
+    DEFAULT_DICTIONARY_SIZE,
+    DICTIONARY_DIR,
+    LEVEL_RANGES,
+    codec_available,
+    codec_install_hint,
+    detect_file_codec,
+    latest_dictionary,
+    load_dictionary,
+    open_compressed_writer,
+    open_decompressed,
+    save_dictionary,
+    train_dictionary,
+)
+from log_baseline import BASELINES_DIR
+from run_bundle import BUNDLE_SUFFIX, write_bundle
+
+CHUNK_SIZE = 1024 * 1024
+
+# Compression levels per preset: throughput vs. ratio
+PRESETS = {
+    "fast": {"gzip": 1, "zstd": 1},
+    "balanced": {"gzip": 6, "zstd": 3},
+    "max": {"gzip": 9, "zstd": 19},
+}
+DEFAULT_PRESET = "balanced"
+
+JOURNAL_NAME = ".archive-journal.jsonl"
+
+# Extensions never compressed: already compressed, and (without
+# --include-binary) binary formats that don't compress well
+COMPRESSED_EXTENSIONS = {".gz", ".gzip", ".zst"}
+BINARY_EXTENSIONS = {".webm", ".png", ".jpg", ".jpeg", ".gif", ".mp4", ".zip"}
+
+# Dictionary training: files sampled and bytes read from the start of each
+DICTIONARY_SAMPLE_NAMES = {"build-log.txt", "junit-results.xml"}
+DICTIONARY_SAMPLE_FILES = 500
+DICTIONARY_SAMPLE_BYTES = 64 * 1024
+MIN_DICTIONARY_SAMPLES = 10
+
+# Content-addressed store for --dedup
+OBJECT_DIR = ".objects"
+DEDUP_MIN_SIZE = 512  # smaller files aren't worth a hash
+
+# Directories of the logs directory that hold no logs
+NON_LOG_DIRS = (DICTIONARY_DIR, OBJECT_DIR, BASELINES_DIR)
+
+
+def is_compressed(filepath: str) -> bool:
+    """Check if a file is already compressed (gzip or zstd) by reading magic bytes."""
+    return detect_file_codec(filepath) is not None
 
 
 def get_file_size(filepath: str) -> int:
@@ -28,65 +105,422 @@ def get_file_size(filepath: str) -> int:
         return 0
 
 
-def gzip_file(filepath: str) -> tuple[bool, int, int]:
+def compress_file(
+    filepath: str,
+    codec: str = "gzip",
+    level: int = 6,
+    dictionary_path: str | None = None,
+    seekable: bool = False,
+) -> tuple[bool, int, int, str | None]:
     """
-    Gzip a file in place.
+    Compress a file in place, keeping its name, mode and modification time.
+
+    The file is streamed in chunks into a temporary file next to it, which
+    then replaces the original atomically. dictionary_path (zstd only)
+    names a trained dictionary to compress with; seekable writes frames
+    with a seek table for random access.
 
     Returns:
-        tuple of (success, original_size, compressed_size)
+        tuple of (success, original_size, compressed_size, error_message)
     """
+    tmp_path = f"{filepath}.{os.getpid()}.part"
     try:
         original_size = get_file_size(filepath)
 
-        with open(filepath, "rb") as f:
-            data = f.read()
-
-        with gzip.open(filepath, "wb", compresslevel=9) as f:
-            f.write(data)
+        dictionary = load_dictionary(dictionary_path) if dictionary_path else None
+        with open(filepath, "rb") as src, open_compressed_writer(tmp_path, codec, level, dictionary, seekable) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        shutil.copystat(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
 
         compressed_size = get_file_size(filepath)
-        return True, original_size, compressed_size
+        return True, original_size, compressed_size, None
     except Exception as e:
-        print(f"Error gzipping {filepath}: {e}")
-        return False, 0, 0
+        return False, 0, 0, str(e)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ArchiveJournal:
+    """Files known to be compressed, keyed by path relative to the archive directory.
 
+    Stored as JSON lines ({"path", "size", "mtime"}, mtime in nanoseconds)
+    and only read once a file outside a marked run needs checking. A file
+    whose size and mtime match its entry is trusted without opening it;
+    compress_file keeps the mtime, so entries written after compressing
+    stay valid. New entries are appended; the file is rewritten when it
+    holds mostly superseded lines.
+    """
 
-def find_uncompressed_files(directory: str, skip_extensions: set[str] | None = None) -> list[str]:
+    def __init__(self, directory: str, reset: bool = False):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_NAME)
+        self.reset = reset
+        self._entries: dict[str, tuple[int, int]] | None = {} if reset else None
+        self._lines = 0
+        self._new: dict[str, tuple[int, int]] = {}
+
+    def _load(self) -> dict[str, tuple[int, int]]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self._entries[entry["path"]] = (entry["size"], entry["mtime"])
+                        except (ValueError, KeyError):
+                            continue  # e.g. a line cut short by a crash
+                        self._lines += 1
+            except FileNotFoundError:
+                pass
+        return self._entries
+
+    def _key(self, filepath: str) -> str:
+        return os.path.relpath(filepath, self.directory)
+
+    def is_archived(self, filepath: str, st: os.stat_result) -> bool:
+        """Check whether a file is journaled as compressed and unchanged since."""
+        return self._load().get(self._key(filepath)) == (st.st_size, st.st_mtime_ns)
+
+    def add(self, filepath: str, st: os.stat_result) -> None:
+        """Record a file as compressed."""
+        key = self._key(filepath)
+        self._load()[key] = self._new[key] = (st.st_size, st.st_mtime_ns)
+
+    def save(self) -> None:
+        """Append the new entries, or rewrite the journal if it's mostly stale."""
+        if not self._new and not self.reset:
+            return
+        entries = self._load()
+        rewrite = self.reset or self._lines + len(self._new) > 2 * len(entries) + 1000
+        records = entries if rewrite else self._new
+        lines = "".join(
+            json.dumps({"path": path, "size": size, "mtime": mtime}) + "\n"
+            for path, (size, mtime) in records.items()
+        )
+        if rewrite:
+            tmp_path = f"{self.path}.{os.getpid()}.part"
+            with open(tmp_path, "w") as f:
+                f.write(lines)
+            os.replace(tmp_path, self.path)
+            self._lines = len(records)
+        else:
+            with open(self.path, "a") as f:
+                f.write(lines)
+            self._lines += len(records)
+        self._new = {}
+        self.reset = False
+
+
+@dataclass
+class ArchiveScan:
+    """Result of find_uncompressed_files."""
+    files: list[str] = field(default_factory=list)  # files to compress
+    seen: list[str] = field(default_factory=list)  # all non-empty files outside marked runs
+    # Run directories that weren't marked yet -> their files to compress
+    runs: dict[str, list[str]] = field(default_factory=dict)
+    archived_runs: int = 0  # runs skipped because of their marker
+    journaled: int = 0  # files trusted from the journal
+    checked: int = 0  # files opened to read their magic bytes
+
+
+def is_run_directory(path: str) -> bool:
+    """Check whether path looks like <pr>/<job>/<run-id> (numeric PR and run ID)."""
+    parts = os.path.abspath(path).split(os.sep)
+    return len(parts) >= 3 and parts[-1].isdigit() and parts[-3].isdigit()
+
+
+def find_uncompressed_files(
+    directory: str,
+    skip_extensions: set[str] | None = None,
+    journal: ArchiveJournal | None = None,
+    rescan: bool = False,
+) -> ArchiveScan:
     """
-    Find all files that are not gzip compressed.
+    Find all files that are not compressed.
+
+    Run directories with an archived marker are skipped entirely, and files
+    whose journal entry matches their size and mtime aren't opened. Files
+    found to be compressed already are added to the journal.
 
     Args:
         directory: Directory to scan
         skip_extensions: File extensions to skip (e.g., {'.gz', '.webm', '.png'})
+        journal: Journal of archived files (None to check every file)
+        rescan: Ignore archived markers
 
     Returns:
-        List of file paths that are not gzip compressed
+        ArchiveScan with the file paths that are not compressed
     """
     if skip_extensions is None:
         skip_extensions = set()
 
-    uncompressed_files = []
+    scan = ArchiveScan()
+
+    def walk(path: str, run: str | None) -> None:
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            return
+
+        if run is None and is_run_directory(path):
+            if not rescan and any(entry.name == ARCHIVED_MARKER for entry in entries):
+                scan.archived_runs += 1
+                return
+            run = path
+            scan.runs[run] = []
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in NON_LOG_DIRS:
+                    walk(entry.path, run)
+                continue
+            if entry.name.startswith(".") or entry.name.endswith(".part"):
+                continue  # bookkeeping (journal, markers) or a download/compression in progress
+
+            # Skip empty files
+            st = entry.stat(follow_symlinks=False)
+            if st.st_size == 0:
+                continue
+            scan.seen.append(entry.path)
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
             # Skip files with certain extensions
-            _, ext = os.path.splitext(filename)
+            _, ext = os.path.splitext(entry.name)
             if ext.lower() in skip_extensions:
                 continue
 
-            filepath = os.path.join(root, filename)
-
-            # Skip if already gzipped
-            if is_gzipped(filepath):
+            if journal is not None and journal.is_archived(entry.path, st):
+                scan.journaled += 1
                 continue
 
-            # Skip empty files
-            if get_file_size(filepath) == 0:
+            # Skip if already compressed (e.g. by download-ci-logs.py --compress)
+            scan.checked += 1
+            if is_compressed(entry.path):
+                if journal is not None:
+                    journal.add(entry.path, st)
                 continue
 
-            uncompressed_files.append(filepath)
+            scan.files.append(entry.path)
+            if run is not None:
+                scan.runs[run].append(entry.path)
+
+    walk(directory, None)
+    return scan
+
+
+def find_run_directories(directory: str) -> list[str]:
+    """Find run directories below directory, without descending into them."""
+    runs = []
+    for root, dirs, _ in os.walk(directory):
+        if is_run_directory(root):
+            runs.append(root)
+            dirs[:] = []
+        else:
+            dirs[:] = [d for d in dirs if d not in NON_LOG_DIRS]
+    return runs
+
+
+def bundle_run(run_dir: str, level: int) -> tuple[bool, int, int, int, str | None]:
+    """
+    Pack a run directory into its bundle.
+
+    Returns:
+        tuple of (success, files, original_size, bundle_size, error_message)
+    """
+    try:
+        result = write_bundle(run_dir, level)
+        return True, result.files, result.original_size, result.bundle_size, None
+    except Exception as e:
+        return False, 0, 0, 0, str(e)
+
+
+def bundle_runs(directory: str, level: int, workers: int, dry_run: bool) -> None:
+    """Pack every run directory below directory into a bundle."""
+    run_dirs = find_run_directories(directory)
+    print(f"Found {len(run_dirs)} run directories to bundle")
+    if dry_run:
+        for run_dir in run_dirs:
+            print(f"  would bundle: {run_dir}")
+        return
+
+    files = total_original = total_bundled = errors = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(bundle_run, run_dir, level): run_dir for run_dir in run_dirs}
+        for i, future in enumerate(as_completed(futures), 1):
+            run_dir = futures[future]
+            success, count, original_size, bundle_size, error = future.result()
+            if success:
+                files += count
+                total_original += original_size
+                total_bundled += bundle_size
+                print(f"[{i}/{len(run_dirs)}] Bundled: {run_dir} ({count} files, "
+                      f"{format_size(original_size)} -> {format_size(bundle_size)})")
+            else:
+                print(f"Error bundling {run_dir}: {error}")
+                errors += 1
+    print(f"Bundled {len(run_dirs) - errors} runs ({files} files, "
+          f"{format_size(total_original)} -> {format_size(total_bundled)}), {errors} errors")
+
+
+def hash_file(filepath: str) -> tuple[str | None, str | None]:
+    """
+    Hash a file's decompressed content, so copies compressed differently still match.
+
+    Returns:
+        tuple of (sha256 hex digest, error_message)
+    """
+    try:
+        digest = hashlib.sha256()
+        with open_decompressed(filepath) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest(), None
+    except Exception as e:
+        return None, str(e)
+
+
+def link_to_store(filepath: str, digest: str, store: str) -> int:
+    """Make filepath a hardlink to the stored object with its content, storing it if new.
+
+    The link replaces the file atomically. If the object can't take more
+    links, this file becomes the object for later copies.
+
+    Returns: bytes saved (the size of the file if it was a duplicate)
+    """
+    obj = os.path.join(store, digest[:2], digest)
+    st = os.stat(filepath)
+    try:
+        obj_st = os.stat(obj)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        os.link(filepath, obj)
+        return 0
+    if (obj_st.st_dev, obj_st.st_ino) == (st.st_dev, st.st_ino):
+        return 0
+
+    tmp_path = f"{filepath}.{os.getpid()}.part"
+    try:
+        os.link(obj, tmp_path)
+    except OSError as e:
+        if e.errno != errno.EMLINK:
+            raise
+        tmp_obj = f"{obj}.{os.getpid()}.part"
+        os.link(filepath, tmp_obj)
+        os.replace(tmp_obj, obj)
+        return 0
+    os.replace(tmp_path, filepath)
+    return st.st_size
+
 
-    return uncompressed_files
+def store_summary(store: str) -> tuple[int, int, int]:
+    """Remove objects no file links to any more and total up the store.
+
+    Returns: (objects, bytes stored, bytes saved by all links)
+    """
+    objects = stored = saved = 0
+    for root, _, files in os.walk(store):
+        for name in files:
+            obj = os.path.join(root, name)
+            st = os.stat(obj)
+            if st.st_nlink <= 1:
+                os.remove(obj)
+                continue
+            objects += 1
+            stored += st.st_size
+            saved += st.st_size * (st.st_nlink - 2)  # one link is the store's own
+    return objects, stored, saved
+
+
+def dedup_files(directory: str, scan: ArchiveScan, journal: ArchiveJournal, workers: int) -> None:
+    """Hardlink the scanned files with identical content to shared objects and report the savings."""
+    store = os.path.join(directory, OBJECT_DIR)
+    candidates = []
+    for filepath in scan.seen:
+        if filepath.endswith(BUNDLE_SUFFIX):
+            # A bundle holds a whole run and never matches another file
+            continue
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            continue
+        # Files with other links are in the store already
+        if st.st_nlink == 1 and st.st_size >= DEDUP_MIN_SIZE:
+            candidates.append(filepath)
+    print(f"Deduplicating {len(candidates)} files on {workers} worker(s)...")
+
+    linked = saved = errors = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(hash_file, filepath): filepath for filepath in candidates}
+        for future in as_completed(futures):
+            filepath = futures[future]
+            digest, error = future.result()
+            try:
+                if digest is None:
+                    raise OSError(error)
+                was_archived = journal.is_archived(filepath, os.stat(filepath))
+                file_saved = link_to_store(filepath, digest, store)
+            except OSError as e:
+                print(f"Error deduplicating {filepath}: {e}")
+                errors += 1
+                continue
+            if file_saved:
+                linked += 1
+                saved += file_saved
+                if was_archived:
+                    # The link carries the object's mtime
+                    journal.add(filepath, os.stat(filepath))
+
+    objects, stored, total_saved = store_summary(store)
+    print(f"Deduplicated {linked} files, saving {format_size(saved)} ({errors} errors)")
+    print(f"Object store: {objects} objects, {format_size(stored)} stored, "
+          f"{format_size(total_saved)} saved in total")
+
+
+def mark_archived(run_dir: str) -> None:
+    """Write the archived marker into a run directory."""
+    with open(os.path.join(run_dir, ARCHIVED_MARKER), "w") as f:
+        json.dump({"archived_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}, f)
+        f.write("\n")
+
+
+def collect_dictionary_samples(directory: str, limit: int = DICTIONARY_SAMPLE_FILES) -> list[bytes]:
+    """Read the start of a random sample of build logs and junit files (compressed or not)."""
+    candidates = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in NON_LOG_DIRS]
+        candidates.extend(os.path.join(root, name) for name in files if name in DICTIONARY_SAMPLE_NAMES)
+
+    samples = []
+    for filepath in random.sample(candidates, min(limit, len(candidates))):
+        try:
+            with open_decompressed(filepath) as f:
+                data = f.read(DICTIONARY_SAMPLE_BYTES)
+        except (IOError, OSError):
+            continue
+        if data:
+            samples.append(data)
+    return samples
+
+
+def prepare_dictionary(directory: str, retrain: bool, dict_size: int) -> str:
+    """Return the dictionary to compress with, training and storing one if needed."""
+    existing = latest_dictionary(directory)
+    if existing is not None and not retrain:
+        print(f"Using zstd dictionary {existing}")
+        return str(existing)
+
+    print(f"Training a {format_size(dict_size)} zstd dictionary...")
+    samples = collect_dictionary_samples(directory)
+    if len(samples) < MIN_DICTIONARY_SAMPLES:
+        print(f"Error: need at least {MIN_DICTIONARY_SAMPLES} build logs or junit files to train a dictionary, "
+              f"found {len(samples)}")
+        sys.exit(1)
+    path = save_dictionary(directory, train_dictionary(samples, dict_size))
+    print(f"Trained on {len(samples)} files ({format_size(sum(map(len, samples)))}), saved to {path}")
+    return str(path)
 
 
 def format_size(size_bytes: int) -> str:
@@ -98,9 +532,21 @@ def format_size(size_bytes: int) -> str:
     return f"{size_bytes:.1f} TB"
 
 
+def finish_archive(journal: ArchiveJournal, scan: ArchiveScan, failed: set[str]) -> None:
+    """Save the journal and mark the scanned runs whose files all compressed."""
+    journal.save()
+    marked = 0
+    for run_dir, files in scan.runs.items():
+        if not failed.intersection(files):
+            mark_archived(run_dir)
+            marked += 1
+    if marked:
+        print(f"Marked {marked} run(s) as archived")
+
+
 def main():
     parser = argparse.ArgumentParser(
-        description="Archive CI logs by gzipping all uncompressed files."
+        description="Archive CI logs by compressing all uncompressed files."
     )
     parser.add_argument(
         "directory",
@@ -119,26 +565,116 @@ def main():
         action="store_true",
         help="Include binary formats that don't compress well (.webm, .png, .jpg, .jpeg, .gif, .mp4, .zip)",
     )
+    parser.add_argument(
+        "--codec",
+        choices=CODECS,
+        default="gzip",
+        help="Compression codec (default: gzip; zstd requires the zstandard package)",
+    )
+    parser.add_argument(
+        "--preset",
+        choices=list(PRESETS),
+        default=DEFAULT_PRESET,
+        help="Throughput vs. ratio: fast, balanced or max "
+             f"(default: {DEFAULT_PRESET}; gzip levels 1/6/9, zstd 1/3/19)",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=None,
+        help="Explicit compression level (overrides --preset)",
+    )
+    parser.add_argument(
+        "--workers",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel compression processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--dictionary",
+        action="store_true",
+        help=f"Compress with a zstd dictionary stored in <directory>/{DICTIONARY_DIR}, "
+             "training one on a sample of build logs and junit files if there is none (requires --codec zstd)",
+    )
+    parser.add_argument(
+        "--train-dictionary",
+        action="store_true",
+        help="Train a new dictionary even if one exists (implies --dictionary)",
+    )
+    parser.add_argument(
+        "--dictionary-size",
+        type=int,
+        default=DEFAULT_DICTIONARY_SIZE,
+        help=f"Size of a newly trained dictionary in bytes (default: {DEFAULT_DICTIONARY_SIZE})",
+    )
+    parser.add_argument(
+        "--seekable",
+        action="store_true",
+        help="Write independently compressed frames with a seek table, for reading ranges and tails",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Pack each run directory into a single <run-id>.bundle.zip (deflate, at the gzip level) "
+             "and remove the directory",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help=f"Store files with identical content once, as hardlinks to <directory>/{OBJECT_DIR}, "
+             "and report the bytes saved",
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Ignore the journal and archived markers, check every file again and rebuild the journal",
+    )
     args = parser.parse_args()
 
     if not os.path.isdir(args.directory):
         print(f"Error: {args.directory} is not a directory")
         sys.exit(1)
 
+    if not codec_available(args.codec):
+        print(f"Error: {codec_install_hint(args.codec)}")
+        sys.exit(1)
+    level = args.level if args.level is not None else PRESETS[args.preset][args.codec]
+    low, high = LEVEL_RANGES[args.codec]
+    if not low <= level <= high:
+        print(f"Error: --level for {args.codec} must be between {low} and {high}")
+        sys.exit(1)
+    if args.bundle and args.codec != "gzip":
+        print("Error: bundles are deflate-compressed ZIP files; --bundle requires --codec gzip")
+        sys.exit(1)
+    use_dictionary = args.dictionary or args.train_dictionary
+    if use_dictionary and args.codec != "zstd":
+        print("Error: --dictionary requires --codec zstd")
+        sys.exit(1)
+
     # Extensions to skip - these are already compressed or binary
-    skip_extensions = {".gz", ".gzip"}
+    skip_extensions = set(COMPRESSED_EXTENSIONS)
     if not args.include_binary:
-        skip_extensions.update({".webm", ".png", ".jpg", ".jpeg", ".gif", ".mp4", ".zip"})
+        skip_extensions.update(BINARY_EXTENSIONS)
 
-    print(f"Scanning {args.directory} for uncompressed files...")
-    uncompressed_files = find_uncompressed_files(args.directory, skip_extensions)
-    print(f"Found {len(uncompressed_files)} uncompressed files")
+    if args.bundle:
+        print(f"Bundling runs in {args.directory}...")
+        bundle_runs(args.directory, level, args.workers, args.dry_run)
 
-    if not uncompressed_files:
-        print("Nothing to compress.")
-        return
+    print(f"Scanning {args.directory} for uncompressed files...")
+    journal = ArchiveJournal(args.directory, reset=args.rescan)
+    scan = find_uncompressed_files(args.directory, skip_extensions, journal, rescan=args.rescan)
+    uncompressed_files = scan.files
+    print(
+        f"Found {len(uncompressed_files)} uncompressed files "
+        f"({scan.archived_runs} archived run(s) skipped, {scan.journaled} journaled file(s) trusted, "
+        f"{scan.checked} file(s) checked)"
+    )
 
     if args.dry_run:
+        if not uncompressed_files:
+            print("Nothing to compress.")
+            return
         print("\nDry run - would compress:")
         total_size = 0
         for filepath in uncompressed_files:
@@ -148,25 +684,53 @@ def main():
         print(f"\nTotal: {len(uncompressed_files)} files, {format_size(total_size)}")
         return
 
+    if not uncompressed_files:
+        print("Nothing to compress.")
+        if args.dedup:
+            dedup_files(args.directory, scan, journal, args.workers)
+        finish_archive(journal, scan, set())
+        return
+
+    dictionary_path = None
+    if use_dictionary:
+        dictionary_path = prepare_dictionary(args.directory, args.train_dictionary, args.dictionary_size)
+
+    print(f"Compressing with {args.codec} level {level} on {args.workers} worker(s)...")
+
+    failed: set[str] = set()
     success_count = 0
     error_count = 0
     total_original = 0
     total_compressed = 0
 
-    for i, filepath in enumerate(uncompressed_files, 1):
-        success, original_size, compressed_size = gzip_file(filepath)
-        if success:
-            success_count += 1
-            total_original += original_size
-            total_compressed += compressed_size
-            savings = original_size - compressed_size
-            pct = (savings / original_size * 100) if original_size > 0 else 0
-            print(
-                f"[{i}/{len(uncompressed_files)}] Compressed: {filepath} "
-                f"({format_size(original_size)} -> {format_size(compressed_size)}, -{pct:.0f}%)"
-            )
-        else:
-            error_count += 1
+    # Largest files first, so a big log doesn't end up alone at the end
+    uncompressed_files.sort(key=get_file_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(compress_file, filepath, args.codec, level, dictionary_path, args.seekable): filepath
+            for filepath in uncompressed_files
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            filepath = futures[future]
+            success, original_size, compressed_size, error = future.result()
+            if success:
+                success_count += 1
+                total_original += original_size
+                total_compressed += compressed_size
+                journal.add(filepath, os.stat(filepath))
+                savings = original_size - compressed_size
+                pct = (savings / original_size * 100) if original_size > 0 else 0
+                print(
+                    f"[{i}/{len(uncompressed_files)}] Compressed: {filepath} "
+                    f"({format_size(original_size)} -> {format_size(compressed_size)}, -{pct:.0f}%)"
+                )
+            else:
+                print(f"Error compressing {filepath}: {error}")
+                error_count += 1
+                failed.add(filepath)
+    if args.dedup:
+        dedup_files(args.directory, scan, journal, args.workers)
+    finish_archive(journal, scan, failed)
 
     print(f"\nDone!")
     print(f"  Compressed: {success_count} files")
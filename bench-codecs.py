@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compression codecs and gzip backends on real CI logs.
+
+Samples build-log.txt and junit-results.xml files from a downloaded ci-logs
+tree, compresses them the way archive-logs.py would (gzip, zstd, zstd with
+a dictionary trained on the sample) and measures how fast each installed
+decompression backend reads them back: the standard library's zlib, isal
+and zlib-ng for gzip, zstandard for zstd. The fastest gzip backend is
+picked automatically by log_codecs.py; set CI_LOGS_GZIP_BACKEND to
+override it.
+
+Usage:
+    ./bench-codecs.py
+    ./bench-codecs.py ./ci-logs --files 500 --repeat 5
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from log_codecs import (
+    DEFAULT_LEVELS,
+    GZIP_BACKEND_ENV,
+    GZIP_BACKENDS,
+    available_gzip_backends,
+    codec_available,
+    gzip_backend,
+    read_decompressed,
+    train_dictionary,
+    zstandard,
+)
+
+SAMPLE_NAMES = {"build-log.txt", "junit-results.xml"}
+MIN_DICTIONARY_SAMPLES = 10
+
+
+def collect_samples(directory: Path, limit: int, seed: int = 0) -> list[bytes]:
+    """Read (decompressed) build logs and junit files, a random sample of at most limit files."""
+    paths = []
+    for root, dirs, filenames in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        paths.extend(Path(root) / filename for filename in filenames if filename in SAMPLE_NAMES)
+    random.Random(seed).shuffle(paths)
+    samples = []
+    for path in paths[:limit]:
+        try:
+            samples.append(read_decompressed(path))
+        except (OSError, EOFError):
+            continue
+    return samples
+
+
+def best_time(decompress, blobs: list[bytes], repeat: int) -> float:
+    """Return the fastest of repeat passes decompressing all blobs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for blob in blobs:
+            decompress(blob)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark compression codecs and gzip backends on downloaded CI logs"
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default="ci-logs",
+        help="Directory with downloaded logs to sample (default: ci-logs)",
+    )
+    parser.add_argument("--files", type=int, default=200, help="Files to sample (default: 200)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes per backend, the fastest counts (default: 3)")
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Error: {directory} is not a directory")
+        sys.exit(1)
+
+    print(f"Sampling build logs and junit files from {directory}...")
+    samples = collect_samples(directory, args.files)
+    if not samples:
+        print(f"Error: no {' or '.join(sorted(SAMPLE_NAMES))} files found")
+        sys.exit(1)
+    total = sum(len(sample) for sample in samples)
+    print(f"  {len(samples)} files, {total / 1e6:.1f} MB")
+
+    # (codec, backend, compressed blobs, decompress function)
+    candidates = []
+    gzip_blobs = [gzip.compress(sample, compresslevel=DEFAULT_LEVELS["gzip"]) for sample in samples]
+    for name in available_gzip_backends():
+        candidates.append(("gzip", name, gzip_blobs, GZIP_BACKENDS[name].decompress))
+    if codec_available("zstd"):
+        compressor = zstandard.ZstdCompressor(level=DEFAULT_LEVELS["zstd"])
+        decompressor = zstandard.ZstdDecompressor()
+        zstd_blobs = [compressor.compress(sample) for sample in samples]
+        candidates.append(("zstd", "zstandard", zstd_blobs, decompressor.decompress))
+        if len(samples) >= MIN_DICTIONARY_SAMPLES:
+            dictionary = train_dictionary(samples)
+            compressor = zstandard.ZstdCompressor(level=DEFAULT_LEVELS["zstd"], dict_data=dictionary)
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+            dict_blobs = [compressor.compress(sample) for sample in samples]
+            candidates.append(("zstd+dict", "zstandard", dict_blobs, decompressor.decompress))
+    else:
+        print("  zstd skipped: pip install zstandard")
+    missing = [name for name in GZIP_BACKENDS if name not in available_gzip_backends()]
+    if missing:
+        print(f"  gzip backends not installed: {', '.join(missing)}")
+
+    rows = []
+    for codec, backend, blobs, decompress in candidates:
+        seconds = best_time(decompress, blobs, args.repeat)
+        compressed = sum(len(blob) for blob in blobs)
+        rows.append((codec, backend, total / compressed, total / 1e6 / seconds if seconds else 0.0))
+
+    print()
+    print(f"{'Codec':<10} {'Backend':<10} {'Ratio':>7} {'Decompress MB/s':>16}")
+    print("-" * 46)
+    for codec, backend, ratio, mb_s in rows:
+        print(f"{codec:<10} {backend:<10} {ratio:>6.1f}x {mb_s:>16.1f}")
+
+    fastest_gzip = max((row for row in rows if row[0] == "gzip"), key=lambda row: row[3])
+    print()
+    print(f"Fastest gzip backend: {fastest_gzip[1]} (in use: {gzip_backend()}; "
+          f"override with {GZIP_BACKEND_ENV}={fastest_gzip[1]})")
+    fastest = max(rows, key=lambda row: row[3])
+    if fastest[0] != "gzip":
+        print(f"Fastest codec: {fastest[0]} "
+              f"(archive-logs.py --codec zstd{' --dictionary' if fastest[0] == 'zstd+dict' else ''})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark download-ci-logs.py and download-junit-reports.py against a local
+GCS stand-in (gcs_standin.py) instead of the public bucket.
+
+Generates a synthetic bucket shaped like the Prow artifacts (PRs, runs,
+build logs, junit results, many small artifact files), serves it with
+configurable latency and error injection, runs each downloader as a
+subprocess pointed at it via STORAGE_EMULATOR_HOST, and reports files/s,
+MB/s and listing latency.
+
+Usage:
+    ./bench-downloads.py
+    ./bench-downloads.py --prs 50 --latency-ms 30 --jitter-ms 20 --error-rate 0.01
+    ./bench-downloads.py --tools ci-logs --ci-logs-args "--exclude-media --compress gzip"
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from gcs_standin import start_server
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BUCKET_NAME = "test-platform-results"
+BUCKET_PREFIX = "pr-logs/pull/redhat-developer_rhdh"
+JOB_NAME = "pull-ci-redhat-developer-rhdh-main-e2e-ocp-helm"
+STEP_DIR = "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm"
+FIRST_RUN_ID = 1999000000000000000
+RUN_ID_STEP = 4194304 * 1000  # ~1s apart in snowflake terms
+
+TOOLS = {
+    "ci-logs": "download-ci-logs.py",
+    "junit": "download-junit-reports.py",
+}
+
+LOG_LINES = [
+    "INFO[2026-01-10T08:00:00Z] Running step e2e-ocp-helm-redhat-developer-rhdh-ocp-helm.",
+    "+ oc apply -f /tmp/configmap.yaml",
+    "configmap/app-config-rhdh created",
+    "Waiting for deployment rhdh-backstage to become ready...",
+    "deployment.apps/rhdh-backstage condition met",
+    "Running 45 tests using 3 workers",
+    "  ✓  1 [showcase] › e2e/catalog-timestamp.spec.ts:30:3 › Test timestamp column (12.3s)",
+]
+
+
+def generate_dataset(root: Path, prs: int, runs: int, small_files: int, log_kb: int, seed: int = 0) -> tuple[int, int]:
+    """Write a synthetic bucket under root. Returns (file_count, total_bytes)."""
+    rng = random.Random(seed)
+    bucket = root / BUCKET_NAME
+    file_count = 0
+    total_bytes = 0
+    run_id = FIRST_RUN_ID
+    start_time = int(time.time()) - prs * runs * 60
+
+    def write(path: Path, data: bytes) -> None:
+        nonlocal file_count, total_bytes
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        file_count += 1
+        total_bytes += len(data)
+
+    for pr in range(4000, 4000 + prs):
+        for _ in range(runs):
+            run_id += RUN_ID_STEP
+            start_time += 60
+            run_dir = bucket / BUCKET_PREFIX / str(pr) / JOB_NAME / str(run_id)
+            result = rng.choice(["SUCCESS", "FAILURE", "ABORTED"])
+            log = "\n".join(rng.choice(LOG_LINES) for _ in range(log_kb * 1024 // 60)).encode()
+
+            write(run_dir / "started.json", json.dumps({"timestamp": start_time}).encode())
+            write(run_dir / "finished.json", json.dumps({"timestamp": start_time + 3000, "result": result}).encode())
+            write(run_dir / "prowjob.json", json.dumps({"status": {"state": result.lower()}}).encode())
+            write(run_dir / "build-log.txt", log[: len(log) // 4])
+            write(run_dir / STEP_DIR / "build-log.txt", log)
+            write(run_dir / STEP_DIR / "artifacts/reporting/OVERALL_RESULT.txt", b"0\n" if result == "SUCCESS" else b"1\n")
+            for suite in ("showcase", "showcase-rbac"):
+                junit = f'<testsuites tests="45" failures="{0 if result == "SUCCESS" else 2}"></testsuites>'
+                write(run_dir / STEP_DIR / "artifacts" / suite / "junit-results.xml", junit.encode())
+                write(run_dir / STEP_DIR / "artifacts" / suite / "video.webm", rng.randbytes(64 * 1024))
+            for i in range(small_files):
+                write(run_dir / "artifacts/build-resources" / f"resource-{i}.json",
+                      json.dumps({"kind": "Pod", "index": i, "pad": "x" * rng.randint(200, 4000)}).encode())
+    return file_count, total_bytes
+
+
+def directory_size(path: Path) -> tuple[int, int]:
+    """Return (file_count, total_bytes) below path."""
+    files = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, filename))
+    return files, size
+
+
+def run_tool(tool: str, endpoint: str, output_dir: Path, max_workers: int, extra_args: list[str]) -> tuple[float, int, str]:
+    """Run a downloader against the stand-in. Returns (seconds, returncode, output tail)."""
+    script = SCRIPT_DIR / TOOLS[tool]
+    if tool == "junit":
+        cmd = [sys.executable, str(script), str(output_dir), str(max_workers), *extra_args]
+    else:
+        cmd = [sys.executable, str(script), str(output_dir), "--max-workers", str(max_workers), *extra_args]
+    if not any(arg.startswith(("--listing-cache", "--no-listing-cache")) for arg in extra_args):
+        # Listings cached by an earlier run would leave nothing to measure
+        cmd.append("--no-listing-cache")
+    env = dict(os.environ, STORAGE_EMULATOR_HOST=endpoint)
+    start = time.monotonic()
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    elapsed = time.monotonic() - start
+    tail = "\n".join((proc.stdout + proc.stderr).strip().splitlines()[-15:])
+    return elapsed, proc.returncode, tail
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the downloaders against a local GCS stand-in"
+    )
+    parser.add_argument("--prs", type=int, default=20, help="Synthetic PRs (default: 20)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per PR (default: 3)")
+    parser.add_argument("--small-files", type=int, default=30, help="Small artifact files per run (default: 30)")
+    parser.add_argument("--log-kb", type=int, default=256, help="Size of each step build log in KB (default: 256)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Added latency per request (default: 20)")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Random extra latency per request (default: 10)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (default: 0)")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors (default: 503)")
+    parser.add_argument("--max-workers", type=int, default=10, help="--max-workers passed to the downloaders (default: 10)")
+    parser.add_argument("--tools", nargs="+", choices=list(TOOLS), default=list(TOOLS), help="Downloaders to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per tool (default: 1)")
+    parser.add_argument("--ci-logs-args", default="", help="Extra arguments for download-ci-logs.py (quoted)")
+    parser.add_argument("--junit-args", default="", help="Extra arguments for download-junit-reports.py (quoted)")
+    parser.add_argument("--data-dir", default=None, help="Reuse/keep the synthetic bucket here instead of a temp dir")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench-downloads-"))
+    data_root = Path(args.data_dir) if args.data_dir else work_dir / "bucket"
+
+    if (data_root / BUCKET_NAME).is_dir():
+        files, size = directory_size(data_root / BUCKET_NAME)
+        print(f"Reusing dataset at {data_root}: {files} files, {size / 1e6:.1f} MB")
+    else:
+        print(f"Generating dataset: {args.prs} PRs x {args.runs} runs...")
+        files, size = generate_dataset(data_root, args.prs, args.runs, args.small_files, args.log_kb)
+        print(f"  {files} files, {size / 1e6:.1f} MB in {data_root}")
+
+    server = start_server(
+        data_root,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    print(f"Stand-in at {server.endpoint} (latency {args.latency_ms}+{args.jitter_ms}ms, "
+          f"error rate {args.error_rate:.1%} -> {args.error_status})")
+    print("-" * 40)
+
+    extra = {"ci-logs": shlex.split(args.ci_logs_args), "junit": shlex.split(args.junit_args)}
+    rows = []
+    try:
+        for tool in args.tools:
+            for i in range(args.repeat):
+                output_dir = work_dir / f"out-{tool}-{i}"
+                server.stats.reset()
+                elapsed, returncode, tail = run_tool(tool, server.endpoint, output_dir, args.max_workers, extra[tool])
+                if returncode != 0:
+                    print(f"{tool}: exited with {returncode}:\n{tail}")
+                stats = server.stats.snapshot()
+                out_files, out_bytes = directory_size(output_dir)
+                ops = stats["ops"]
+                listing = ops.get("list", {})
+                rows.append({
+                    "tool": tool,
+                    "seconds": elapsed,
+                    "files": out_files,
+                    "mb": out_bytes / 1e6,
+                    "files_s": out_files / elapsed if elapsed else 0,
+                    "mb_s": stats["bytes_sent"] / 1e6 / elapsed if elapsed else 0,
+                    "requests": sum(op["count"] for op in ops.values()),
+                    "errors": sum(op["errors"] for op in ops.values()),
+                    "lists": listing.get("count", 0),
+                    "list_p50": listing.get("p50_ms", 0),
+                    "list_p95": listing.get("p95_ms", 0),
+                })
+                shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        server.shutdown()
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print(f"{'Tool':<9} {'Time s':>8} {'Files':>7} {'MB':>8} {'Files/s':>9} {'MB/s':>7} "
+          f"{'Reqs':>6} {'Errs':>5} {'Lists':>6} {'List p50':>9} {'List p95':>9}")
+    print("-" * 94)
+    for row in rows:
+        print(f"{row['tool']:<9} {row['seconds']:>8.2f} {row['files']:>7} {row['mb']:>8.1f} "
+              f"{row['files_s']:>9.1f} {row['mb_s']:>7.1f} {row['requests']:>6} {row['errors']:>5} "
+              f"{row['lists']:>6} {row['list_p50']:>7.1f}ms {row['list_p95']:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
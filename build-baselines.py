@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Build per-job baselines of the build log lines of successful runs.
+
+For each job, the most recent runs classify-failures.py classifies as
+TEST_SUCCESS are read and the lines printed by at least --min-runs of them
+are stored as the job's baseline (see log_baseline.py) in
+<directory>/.baselines/<job>.baseline. classify-failures.py --baselines
+then shows the lines of failed runs no successful run printed.
+
+Usage:
+    ./build-baselines.py [directory] [--max-runs N] [--min-runs N]
+"""
+
+import argparse
+import importlib.util
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from log_baseline import BASELINES_DIR, DEFAULT_MIN_RUNS, BaselineBuilder, baseline_path
+from run_bundle import BUNDLE_SUFFIX
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def load_script(filename: str, module_name: str):
+    """Import one of the sibling scripts (their file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(module_name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+classifier = load_script("classify-failures.py", "classify_failures")
+
+
+def find_job_runs(directory: Path) -> dict[str, list[tuple[str, str, Path]]]:
+    """Return the runs (run ID, PR, run directory) below <directory>/<pr>/<job>/ by job, newest first."""
+    jobs = defaultdict(list)
+    for pr_dir in directory.iterdir():
+        if not pr_dir.is_dir() or not pr_dir.name.isdigit():
+            continue
+        for job_dir in pr_dir.iterdir():
+            if not job_dir.is_dir() or not job_dir.name.startswith("pull-ci-"):
+                continue
+            run_ids = set()
+            for entry in job_dir.iterdir():
+                if entry.is_dir():
+                    run_ids.add(entry.name)
+                elif entry.name.endswith(BUNDLE_SUFFIX):
+                    run_ids.add(entry.name[:-len(BUNDLE_SUFFIX)])
+            for run_id in run_ids:
+                if run_id.isdigit():
+                    jobs[job_dir.name].append((run_id, pr_dir.name, job_dir / run_id))
+    for runs in jobs.values():
+        runs.sort(key=lambda run: int(run[0]), reverse=True)
+    return jobs
+
+
+def build_job_baseline(job_name: str, runs: list[tuple[str, str, Path]], max_runs: int) -> BaselineBuilder:
+    """Add the build logs of up to max_runs successful runs of a job to a builder."""
+    builder = BaselineBuilder()
+    for run_id, pr, run_dir in runs:
+        if builder.runs >= max_runs:
+            break
+        analysis = classifier.analyze_run(run_dir, pr, run_id, job_name=job_name)
+        if analysis.classification == classifier.Classification.TEST_SUCCESS and analysis.build_log_content:
+            builder.add_log(analysis.build_log_content)
+    return builder
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build per-job baselines of the build log lines of successful runs.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s ./ci-logs                  # Baselines from the 50 latest successful runs of each job
+  %(prog)s ./ci-logs --max-runs 200 --min-runs 3
+        """
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default="./ci-logs",
+        help="CI logs directory (default: ./ci-logs)"
+    )
+    parser.add_argument(
+        "--max-runs",
+        type=int,
+        default=50,
+        help="Successful runs per job to read, the most recent first (default: 50)"
+    )
+    parser.add_argument(
+        "--min-runs",
+        type=int,
+        default=DEFAULT_MIN_RUNS,
+        help=f"Keep lines printed by at least this many of them (default: {DEFAULT_MIN_RUNS}, "
+             "or all runs if there are fewer)"
+    )
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Error: Directory not found: {directory}", file=sys.stderr)
+        sys.exit(1)
+    (directory / BASELINES_DIR).mkdir(exist_ok=True)
+
+    jobs = find_job_runs(directory)
+    if not jobs:
+        print("No runs found.")
+        return
+
+    print(f"{'Job':<60} {'Runs':>5} {'Lines':>8} {'Size':>9} {'Time':>7}")
+    print("-" * 93)
+    for job_name in sorted(jobs):
+        start = time.monotonic()
+        builder = build_job_baseline(job_name, jobs[job_name], args.max_runs)
+        if not builder.runs:
+            print(f"{job_name:<60} {'no successful runs':>31}")
+            continue
+        baseline = builder.build(args.min_runs)
+        path = baseline_path(directory, job_name)
+        baseline.save(path)
+        print(f"{job_name:<60} {baseline.runs:>5} {len(baseline):>8} "
+              f"{path.stat().st_size / 1024:>7.1f}KB {time.monotonic() - start:>6.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Download CI logs and classify runs in one streaming pass.
+
+download-ci-logs.py reports each run as soon as its classifier inputs
+(build log, job status, junit results) are on disk, and a pool of classifier
+workers analyzes it while the rest of the sync continues. The summary and
+markdown report are produced once the downloads finish, so the end-to-end
+time is close to the download time alone.
+
+With --in-memory, only each run's classifier inputs are fetched, into memory
+buffers, and nothing is written to disk (apart from the report).
+
+Usage:
+    ./ci-pipeline.py [output_directory] [download options] [--ai] [--baselines] [-o NAME]
+    ./ci-pipeline.py --in-memory --max-prs 20
+"""
+
+import argparse
+import importlib.util
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from run_retention import TIER_RESULTS_ONLY, result_path, retention_tier
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+CLASSIFY_WORKERS = 4
+
+
+def load_script(filename: str, module_name: str):
+    """Import one of the sibling scripts (their file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(module_name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    downloader = load_script("download-ci-logs.py", "download_ci_logs")
+    classifier = load_script("classify-failures.py", "classify_failures")
+
+    parser = argparse.ArgumentParser(
+        description="Download CI logs and classify runs as they arrive"
+    )
+    downloader.add_download_arguments(parser)
+    parser.add_argument(
+        "--classify-workers",
+        type=int,
+        default=CLASSIFY_WORKERS,
+        help=f"Parallel classifier workers (default: {CLASSIFY_WORKERS})",
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Fetch only the classifier inputs into memory and classify without writing logs to disk",
+    )
+    parser.add_argument(
+        "--ai",
+        action="store_true",
+        help="Use Gemini AI to analyze infrastructure failures and determine root causes",
+    )
+    parser.add_argument(
+        "--ai-token-budget",
+        type=int,
+        default=classifier.DEFAULT_TOKEN_BUDGET,
+        metavar="TOKENS",
+        help="With --ai, send at most about this many tokens of each build log "
+             f"(default: {classifier.DEFAULT_TOKEN_BUDGET})",
+    )
+    parser.add_argument(
+        "--baselines",
+        action="store_true",
+        help="Compare the build logs of infrastructure failures against the baselines "
+             "of successful runs built by build-baselines.py",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="Base name for report file (saved to reports/ with timestamp suffix)",
+    )
+    args = parser.parse_args()
+
+    ai_client = classifier.init_gemini_client() if args.ai else None
+    baselines = classifier.BaselineStore(Path(args.output_dir)) if args.baselines else None
+
+    classifier.print_header()
+
+    lock = threading.Lock()
+    results = []
+    start = time.monotonic()
+    first_result_at: list[float] = []
+
+    def classify(pr: str, job_name: str, run_id: str, run) -> None:
+        analysis = None
+        if isinstance(run, Path) and retention_tier(run) == TIER_RESULTS_ONLY:
+            # Retired by retain-logs.py: only the stored result is left
+            analysis = classifier.load_run_result(result_path(run))
+        if analysis is None:
+            analysis = classifier.analyze_run(
+                run, pr, run_id, job_name=job_name, ai_client=ai_client, ai_token_budget=args.ai_token_budget,
+                baselines=baselines
+            )
+        with lock:
+            if not first_result_at:
+                first_result_at.append(time.monotonic() - start)
+            classifier.print_run_result(analysis)
+            results.append(analysis)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.classify_workers) as classify_pool:
+        def on_run_ready(pr: str, job_name: str, run_id: str, run_path: Path) -> None:
+            futures.append(classify_pool.submit(classify, pr, job_name, run_id, run_path))
+
+        def on_run_fetched(pr: str, job_name: str, run_id: str, location: str,
+                           files: dict[str, bytes], listing: list[str]) -> None:
+            source = classifier.MemoryRunSource(location, files, listing)
+            futures.append(classify_pool.submit(classify, pr, job_name, run_id, source))
+
+        if args.in_memory:
+            downloader.run_downloads(args, on_run_fetched=on_run_fetched)
+        else:
+            downloader.run_downloads(args, on_run_ready=on_run_ready)
+        download_time = time.monotonic() - start
+
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error classifying run: {e}")
+
+    total_time = time.monotonic() - start
+
+    # Build the summary in the same order analyze_directory uses
+    summary = classifier.Summary()
+    for analysis in sorted(results, key=lambda a: (int(a.pr_number), a.job_name, a.run_id)):
+        classifier.add_to_summary(summary, analysis)
+
+    classifier.print_summary(summary, ai_analyze=args.ai)
+    classifier.save_markdown_report(summary, ai_analyze=args.ai, output_file=args.output)
+
+    print()
+    if first_result_at:
+        print(f"First classification after: {first_result_at[0]:.1f}s")
+    print(f"Download time: {download_time:.1f}s | End-to-end time: {total_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
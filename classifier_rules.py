@@ -0,0 +1,203 @@
+"""Classification rules of classify-failures.py, loaded from a TOML file.
+
+The rules file (classifier-rules.toml by default, see its header for the
+format) holds tables of rules that are tried in order, the first matching
+rule deciding the outcome: build log indicators, infrastructure failure
+categories and junit error types. Rules are compiled once per file and
+keep statistics while they're used: how often each was evaluated, matched
+and decided the outcome (first match), and the time spent matching, so
+dead and expensive rules are easy to spot.
+"""
+
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:  # a dependency on 3.10, but not installed
+        tomllib = None
+
+from log_prefilter import LogPattern, LogScan
+
+DEFAULT_RULES_FILE = Path(__file__).resolve().parent / "classifier-rules.toml"
+RULE_TABLES = ["timeout", "error", "interrupt", "infra", "junit"]
+JUNIT_FIELDS = ["text", "message"]
+RULE_KEYS = {
+    "name", "regex", "literals", "multiline", "ignore_case", "dotall",
+    "category", "detail", "detail_regex", "detail_literals", "detail_multiline",
+    "field", "error_type",
+}
+DEFAULT_DETAIL = "{0:.80}"
+
+
+class Rule:
+    """A compiled rule, with its statistics."""
+
+    def __init__(self, table: str, spec: dict):
+        self.table = table
+        self.name = spec["name"]
+        flags = (re.IGNORECASE if spec.get("ignore_case") else 0) | (re.DOTALL if spec.get("dotall") else 0)
+        self.pattern = LogPattern(spec["regex"], spec.get("literals", []), flags, spec.get("multiline", False))
+        self.category = spec.get("category")
+        self.field = spec.get("field", "text")
+        self.error_type = spec.get("error_type")
+        self.detail = spec.get("detail", DEFAULT_DETAIL)
+        self.detail_pattern = None
+        if "detail_regex" in spec:
+            self.detail_pattern = LogPattern(
+                spec["detail_regex"], spec.get("detail_literals", []), flags, spec.get("detail_multiline", False)
+            )
+
+        self.evaluations = 0
+        self.hits = 0
+        self.first_matches = 0
+        self.seconds = 0.0
+
+    def format_detail(self, match: re.Match, scan: LogScan) -> Optional[str]:
+        """Return the infra failure detail for a match of this rule."""
+        if self.detail_pattern is not None:
+            match = scan.search(self.detail_pattern)
+            if match is None:
+                return None
+        return format_match(self.detail, match)
+
+    def format_error_type(self, match: re.Match) -> str:
+        return format_match(self.error_type, match)
+
+
+def format_match(template: str, match: re.Match) -> str:
+    """Format a template with {0} the whole match and {1}, {2}, ... its groups."""
+    return template.format(match.group(0), *match.groups())
+
+
+class RuleSet:
+    """The rules of one file, by table.
+
+    With count_all, every rule of a table is evaluated even after the first
+    match, so hit counts also show rules shadowed by earlier ones.
+    """
+
+    def __init__(self, path: Path, tables: dict[str, list[Rule]]):
+        self.path = path
+        self.tables = tables
+        self.count_all = False
+        self._lock = threading.Lock()
+
+    def _first_match(self, table: str, search: Callable[[Rule], Optional[re.Match]]) -> Optional[tuple[Rule, re.Match]]:
+        found = None
+        for rule in self.tables[table]:
+            if found is not None and not self.count_all:
+                break
+            start = time.perf_counter()
+            match = search(rule)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                rule.evaluations += 1
+                rule.seconds += elapsed
+                if match is not None:
+                    rule.hits += 1
+                    if found is None:
+                        rule.first_matches += 1
+            if match is not None and found is None:
+                found = (rule, match)
+        return found
+
+    def match_log(self, table: str, scan: LogScan) -> Optional[tuple[Rule, re.Match]]:
+        """Return the first rule of a build log table that matches, and its match."""
+        return self._first_match(table, lambda rule: scan.search(rule.pattern))
+
+    def match_fields(self, table: str, fields: dict[str, str]) -> Optional[tuple[Rule, re.Match]]:
+        """Return the first rule of a table that matches its field of fields, and its match."""
+        return self._first_match(table, lambda rule: rule.pattern.regex.search(fields[rule.field]))
+
+    def rules(self) -> list[Rule]:
+        return [rule for table in RULE_TABLES for rule in self.tables[table]]
+
+    def print_stats(self) -> None:
+        """Print each rule's statistics, most expensive first, and the rules that never matched."""
+        rules = sorted(self.rules(), key=lambda rule: rule.seconds, reverse=True)
+        print(f"Rule statistics ({self.path})")
+        print(f"{'Table':<10} {'Rule':<30} {'Evaluated':>9} {'Hits':>7} {'First':>7} {'Time ms':>9}")
+        print("-" * 77)
+        for rule in rules:
+            print(f"{rule.table:<10} {rule.name:<30} {rule.evaluations:>9} {rule.hits:>7} "
+                  f"{rule.first_matches:>7} {rule.seconds * 1000:>9.1f}")
+        dead = [rule.name for rule in rules if rule.evaluations and not rule.hits]
+        if dead:
+            print(f"Never matched: {', '.join(sorted(dead))}")
+        shadowed = [rule.name for rule in rules if rule.hits and not rule.first_matches]
+        if shadowed:
+            print(f"Only matched after an earlier rule: {', '.join(sorted(shadowed))}")
+
+
+@lru_cache(maxsize=None)
+def load_rules(path: Path = DEFAULT_RULES_FILE) -> RuleSet:
+    """Load and compile a rules file (once per path).
+
+    Raises ValueError for a malformed file or rule, naming the rule.
+    """
+    if tomllib is None:
+        raise ValueError("reading rules files on Python < 3.11 requires the tomli package: pip install tomli")
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ValueError(f"cannot read rules file {path}: {e}")
+
+    unknown = set(data) - set(RULE_TABLES)
+    if unknown:
+        raise ValueError(f"{path}: unknown rule tables: {', '.join(sorted(unknown))}")
+    tables = {}
+    names = set()
+    for table in RULE_TABLES:
+        tables[table] = []
+        for spec in data.get(table, []):
+            name = spec.get("name", "<unnamed>")
+            try:
+                if "name" not in spec or "regex" not in spec:
+                    raise ValueError("name and regex are required")
+                if name in names:
+                    raise ValueError("duplicate name")
+                if set(spec) - RULE_KEYS:
+                    raise ValueError(f"unknown keys: {', '.join(sorted(set(spec) - RULE_KEYS))}")
+                rule = Rule(table, spec)
+                if table == "infra" and not rule.category:
+                    raise ValueError("category is required")
+                if table == "junit":
+                    if rule.field not in JUNIT_FIELDS:
+                        raise ValueError(f"field must be one of {', '.join(JUNIT_FIELDS)}")
+                    if not rule.error_type:
+                        raise ValueError("error_type is required")
+                    format_match(rule.error_type, _dummy_match(rule.pattern))
+                if table == "infra":
+                    pattern = rule.detail_pattern or rule.pattern
+                    format_match(rule.detail, _dummy_match(pattern))
+            except (re.error, KeyError, IndexError, ValueError, TypeError) as e:
+                raise ValueError(f"{path}: {table} rule {name}: {e}")
+            names.add(name)
+            tables[table].append(rule)
+    return RuleSet(Path(path), tables)
+
+
+class _DummyMatch:
+    """Stands in for a match of a pattern to check a format template against its groups."""
+
+    def __init__(self, groups: int):
+        self._groups = groups
+
+    def group(self, index: int) -> str:
+        return ""
+
+    def groups(self) -> tuple[str, ...]:
+        return ("",) * self._groups
+
+
+def _dummy_match(pattern: LogPattern) -> _DummyMatch:
+    return _DummyMatch(pattern.regex.groups)
@@ -19,20 +19,36 @@ AI Analysis Requirements:
 """
 
 import argparse
-import gzip
 import json
 import os
 import re
 import sys
 import time
 import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
 from typing import Optional, Tuple, List, Dict
 
+from classifier_rules import DEFAULT_RULES_FILE, RuleSet, load_rules
+from log_codecs import (
+    BytesReader,
+    MissingDecoderError,
+    RandomAccessReader,
+    RangeReader,
+    decompress_bytes,
+    read_decompressed,
+)
+from log_baseline import Baseline, BaselineStore, novel_excerpt
+from log_context import DEFAULT_TOKEN_BUDGET, select_context
+from log_prefilter import LogPattern, LogScan
+from run_bundle import BUNDLE_SUFFIX, RunBundle, bundle_path, run_dir_of
+from run_retention import RESULT_SUFFIX
+from template_miner import TemplateMiner, candidate_rule
+
 # Prow base URL for job links
 PROW_BASE_URL = "https://prow.ci.openshift.org/view/gs/test-platform-results/pr-logs/pull/redhat-developer_rhdh"
 # GitHub PR base URL
@@ -110,6 +126,7 @@ class BuildLogAnalysis:
     interrupt_message: str = ""
     infra_failure_category: Optional[InfraFailureCategory] = None
     infra_failure_detail: str = ""
+    match_offsets: List[int] = field(default_factory=list)  # Where the rules above matched, for the AI context
 
 
 @dataclass
@@ -159,6 +176,8 @@ class RunAnalysis:
     build_log_analysis: Optional[BuildLogAnalysis] = None
     build_log_content: Optional[str] = None  # Store for AI analysis
     ai_analysis: Optional[AIRootCauseAnalysis] = None
+    novel_line_count: Optional[int] = None  # Build log lines not in the job's baseline (see log_baseline.py)
+    novel_lines: List[str] = field(default_factory=list)  # Excerpt of them
     
     classification: Classification = Classification.UNKNOWN
     reason: str = ""
@@ -188,46 +207,45 @@ class Summary:
     analyzed_prs: set = field(default_factory=set)  # Unique PR numbers analyzed
 
 
-# Gzip magic bytes
-GZIP_MAGIC = b"\x1f\x8b"
+def _decode_text(data: bytes) -> str:
+    """Decode file content as text with universal newlines, as text-mode open() would."""
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
 
 
-def is_gzipped(filepath: Path) -> bool:
-    """Check if a file is gzip compressed by reading magic bytes."""
-    try:
-        with open(filepath, "rb") as f:
-            magic = f.read(2)
-            return magic == GZIP_MAGIC
-    except (IOError, OSError):
-        return False
+_reported_decoders: set = set()
 
 
-def read_file_text(filepath: Path) -> Optional[str]:
-    """Read a text file, automatically detecting and handling gzip compression."""
-    if not filepath.exists():
-        return None
+def report_missing_decoder(error: MissingDecoderError) -> None:
+    """Print a missing zstandard package or zstd dictionary once per process.
 
-    try:
-        if is_gzipped(filepath):
-            with gzip.open(filepath, "rt", encoding="utf-8", errors="replace") as f:
-                return f.read()
-        else:
-            return filepath.read_text(encoding="utf-8", errors="replace")
-    except (IOError, OSError):
+    Files that can't be decompressed are then treated as missing, which
+    would otherwise pass unnoticed and change the classification. The
+    report isn't repeated for later runs (e.g. in ci-pipeline.py).
+    """
+    if error.missing in _reported_decoders:
+        return
+    _reported_decoders.add(error.missing)
+    print(f"Error: {error} (files needing the {error.missing} are treated as missing)", file=sys.stderr)
+
+
+def read_file_text(filepath: Path) -> Optional[str]:
+    """Read a text file, automatically detecting and handling gzip/zstd compression."""
+    data = read_file_bytes(filepath)
+    if data is None:
         return None
+    return _decode_text(data)
 
 
 def read_file_bytes(filepath: Path) -> Optional[bytes]:
-    """Read a file as bytes, automatically detecting and handling gzip compression."""
+    """Read a file as bytes, automatically detecting and handling gzip/zstd compression."""
     if not filepath.exists():
         return None
 
     try:
-        if is_gzipped(filepath):
-            with gzip.open(filepath, "rb") as f:
-                return f.read()
-        else:
-            return filepath.read_bytes()
+        return read_decompressed(filepath)
+    except MissingDecoderError as e:
+        report_missing_decoder(e)
+        return None
     except (IOError, OSError):
         return None
 
@@ -239,16 +257,180 @@ def count_files(directory: Path, extension: str) -> int:
     return len(list(directory.rglob(f"*{extension}")))
 
 
+# Run-relative locations of the files the classifier reads
+E2E_STEP_DIR = "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm"
+ARTIFACTS_BASE = f"{E2E_STEP_DIR}/artifacts"
+BUILD_LOG_CANDIDATES = [f"{E2E_STEP_DIR}/build-log.txt", "build-log.txt"]
+# Build log lines shown by the single run analysis
+DETAIL_TAIL_LINES = 15
+
+
+class RunSource(ABC):
+    """Storage-agnostic access to the files of a single CI run.
+
+    Paths are relative to the run directory and use forward slashes,
+    e.g. "finished.json" or "artifacts/.../showcase/junit-results.xml".
+    """
+
+    @abstractmethod
+    def read_bytes(self, relative_path: str) -> Optional[bytes]:
+        """Return the (decompressed) file content, or None if missing/unreadable."""
+
+    @abstractmethod
+    def exists(self, relative_path: str) -> bool:
+        """Check if a file or directory exists in the run."""
+
+    @abstractmethod
+    def count_files(self, relative_dir: str, extension: str) -> int:
+        """Count files with a specific extension below a run directory."""
+
+    @abstractmethod
+    def path(self, relative_path: str = "") -> Path:
+        """Return a path identifying the file, for display and reports."""
+
+    def read_text(self, relative_path: str) -> Optional[str]:
+        """Return the (decompressed) file content as text, or None if missing."""
+        data = self.read_bytes(relative_path)
+        if data is None:
+            return None
+        return _decode_text(data)
+
+    def open_reader(self, relative_path: str) -> Optional[RangeReader]:
+        """Return a reader for byte/line ranges of the (decompressed) file, or None if missing."""
+        data = self.read_bytes(relative_path)
+        return None if data is None else BytesReader(data)
+
+    def read_range(self, relative_path: str, start: int, end: Optional[int] = None) -> Optional[bytes]:
+        """Return bytes [start, end) of the (decompressed) file, or None if missing."""
+        try:
+            reader = self.open_reader(relative_path)
+            return None if reader is None else reader.read_range(start, end)
+        except MissingDecoderError as e:
+            report_missing_decoder(e)
+            return None
+        except (IOError, OSError):
+            return None
+
+    def read_tail(self, relative_path: str, lines: int) -> Optional[str]:
+        """Return the last lines of a file as text, or None if missing."""
+        try:
+            reader = self.open_reader(relative_path)
+            return None if reader is None else _decode_text(reader.read_tail_lines(lines))
+        except MissingDecoderError as e:
+            report_missing_decoder(e)
+            return None
+        except (IOError, OSError):
+            return None
+
+    def read_context(self, relative_path: str, offset: int, before: int = 5, after: int = 5) -> Optional[str]:
+        """Return the line at a byte offset with surrounding lines as text, or None if missing."""
+        try:
+            reader = self.open_reader(relative_path)
+            return None if reader is None else _decode_text(reader.read_lines_around(offset, before, after))
+        except MissingDecoderError as e:
+            report_missing_decoder(e)
+            return None
+        except (IOError, OSError):
+            return None
+
+
+class LocalRunSource(RunSource):
+    """A run directory on local disk (files may be gzip/zstd compressed).
+
+    If the run was packed by archive-logs.py --bundle, files are read from
+    its bundle; files in the run directory take precedence.
+    """
+
+    def __init__(self, run_path: Path):
+        self.run_path = run_path
+        self.bundle = RunBundle.open(run_path)
+
+    def read_bytes(self, relative_path: str) -> Optional[bytes]:
+        filepath = self.run_path / relative_path
+        if self.bundle is not None and not filepath.exists():
+            return self.bundle.read(relative_path)
+        return read_file_bytes(filepath)
+
+    def open_reader(self, relative_path: str) -> Optional[RangeReader]:
+        # Seekable archives (archive-logs.py --seekable) only decompress the requested range
+        filepath = self.run_path / relative_path
+        if not filepath.is_file():
+            return super().open_reader(relative_path) if self.bundle is not None else None
+        return RandomAccessReader(filepath)
+
+    def exists(self, relative_path: str) -> bool:
+        if (self.run_path / relative_path).exists():
+            return True
+        return self.bundle is not None and self.bundle.exists(relative_path)
+
+    def count_files(self, relative_dir: str, extension: str) -> int:
+        count = count_files(self.run_path / relative_dir, extension)
+        if self.bundle is not None:
+            count += sum(
+                1 for name in self.bundle.list(relative_dir)
+                if name.endswith(extension) and not (self.run_path / name).exists()
+            )
+        return count
+
+    def path(self, relative_path: str = "") -> Path:
+        return self.run_path / relative_path if relative_path else self.run_path
+
+
+class MemoryRunSource(RunSource):
+    """A run held entirely in memory, e.g. fetched straight from GCS.
+
+    Args:
+        location: Where the run came from (e.g. "bucket/pr-logs/.../<run-id>")
+        files: Content of the fetched files, keyed by run-relative path
+        listing: Run-relative paths of all files in the run, including ones
+            that were not fetched (used for existence checks and counts)
+    """
+
+    def __init__(self, location: str, files: Dict[str, bytes], listing: Optional[List[str]] = None):
+        self.location = location
+        self.files = files
+        self.listing = set(listing or []) | set(files)
+
+    def read_bytes(self, relative_path: str) -> Optional[bytes]:
+        data = self.files.get(relative_path)
+        if data is None:
+            return None
+        try:
+            return decompress_bytes(data)
+        except MissingDecoderError as e:
+            report_missing_decoder(e)
+            return None
+        except (IOError, OSError):
+            return None
+
+    def exists(self, relative_path: str) -> bool:
+        prefix = relative_path.rstrip("/") + "/"
+        return relative_path in self.listing or any(name.startswith(prefix) for name in self.listing)
+
+    def count_files(self, relative_dir: str, extension: str) -> int:
+        prefix = relative_dir.rstrip("/") + "/"
+        return sum(1 for name in self.listing if name.startswith(prefix) and name.endswith(extension))
+
+    def path(self, relative_path: str = "") -> Path:
+        return Path(self.location) / relative_path if relative_path else Path(self.location)
+
+
 def parse_junit(junit_path: Path, pr_number: str = "", run_id: str = "", suite_type: str = "") -> Optional[JUnitStats]:
     """Parse junit-results.xml and extract statistics including individual failures."""
     if not junit_path.exists():
         return None
 
+    # Read file content (handles gzip/zstd automatically)
+    return parse_junit_content(read_file_text(junit_path), pr_number, run_id, suite_type)
+
+
+def parse_junit_content(content: Optional[str], pr_number: str = "", run_id: str = "", suite_type: str = "") -> Optional[JUnitStats]:
+    """Parse junit-results.xml content and extract statistics including individual failures."""
+    if not content:
+        return None
+
+    rules = classification_rules()
     try:
-        # Read file content (handles gzip automatically)
-        content = read_file_text(junit_path)
-        if not content:
-            return None
         root = ET.fromstring(content)
 
         stats = JUnitStats(
@@ -269,17 +451,11 @@ def parse_junit(junit_path: Path, pr_number: str = "", run_id: str = "", suite_t
                     test_name = testcase.get('name', 'unknown')
                     failure_message = failure.get('message', '')
 
-                    # Extract error type from failure text
+                    # Extract error type from failure text (junit rules of the rules file)
                     failure_text = failure.text or ""
                     error_type = "Unknown"
-                    if "TimeoutError" in failure_text or "Timeout" in failure_message:
-                        error_type = "TimeoutError"
-                    elif "Error:" in failure_text:
-                        error_match = re.search(r'(Error|AssertionError|TypeError|ReferenceError):', failure_text)
-                        if error_match:
-                            error_type = error_match.group(1)
-                    elif "expect(" in failure_text:
-                        error_type = "AssertionError"
+                    if found := rules.match_fields("junit", {"text": failure_text, "message": failure_message}):
+                        error_type = found[0].format_error_type(found[1])
 
                     stats.failed_tests.append(TestCaseFailure(
                         test_name=test_name,
@@ -298,7 +474,11 @@ def parse_junit(junit_path: Path, pr_number: str = "", run_id: str = "", suite_t
 
 def read_overall_result(result_path: Path) -> Optional[int]:
     """Read OVERALL_RESULT.txt and return the status code."""
-    content = read_file_text(result_path)
+    return parse_overall_result(read_file_text(result_path))
+
+
+def parse_overall_result(content: Optional[str]) -> Optional[int]:
+    """Parse OVERALL_RESULT.txt content and return the status code."""
     if not content:
         return None
 
@@ -309,13 +489,17 @@ def read_overall_result(result_path: Path) -> Optional[int]:
 
 
 def read_build_log(log_path: Path) -> Optional[str]:
-    """Read build log content, handling gzip compression if needed."""
+    """Read build log content, handling compression if needed."""
     return read_file_text(log_path)
 
 
 def read_json_file(json_path: Path) -> Optional[dict]:
-    """Read a JSON file, handling gzip compression if needed."""
-    content = read_file_text(json_path)
+    """Read a JSON file, handling compression if needed."""
+    return parse_json(read_file_text(json_path))
+
+
+def parse_json(content: Optional[str]) -> Optional[dict]:
+    """Parse JSON file content, returning None if missing or invalid."""
     if not content:
         return None
 
@@ -325,19 +509,18 @@ def read_json_file(json_path: Path) -> Optional[dict]:
         return None
 
 
-def get_job_status(run_path: Path) -> JobStatus:
+def get_job_status(run: "Path | RunSource") -> JobStatus:
     """Extract job status from finished.json and prowjob.json."""
+    source = run if isinstance(run, RunSource) else LocalRunSource(run)
     status = JobStatus()
     
     # Check finished.json (primary source for result)
-    finished_json_path = run_path / "finished.json"
-    finished_data = read_json_file(finished_json_path)
+    finished_data = parse_json(source.read_text("finished.json"))
     if finished_data:
         status.result = finished_data.get("result", "").upper()
     
     # Check prowjob.json (has more detailed state info)
-    prowjob_json_path = run_path / "prowjob.json"
-    prowjob_data = read_json_file(prowjob_json_path)
+    prowjob_data = parse_json(source.read_text("prowjob.json"))
     if prowjob_data:
         prow_status = prowjob_data.get("status", {})
         status.state = prow_status.get("state", "")
@@ -372,18 +555,28 @@ def init_gemini_client():
     return genai.Client(api_key=api_key)
 
 
-def analyze_with_ai(client, build_log_content: str) -> AIRootCauseAnalysis:
+def analyze_with_ai(
+    client,
+    build_log_content: str,
+    log_analysis: Optional[BuildLogAnalysis] = None,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    baseline: Optional[Baseline] = None,
+) -> AIRootCauseAnalysis:
     """Use Gemini AI to analyze a build log and determine root cause.
     
+    Only the parts of the log around the rule matches of log_analysis, error
+    lines and unusual lines are sent, up to token_budget tokens (see
+    log_context.py). With the job's baseline, lines successful runs also
+    printed are left out first.
+
     Uses the google-genai library: https://googleapis.github.io/python-genai/
     """
-    # Truncate log if too long (keep start and end)
-    max_chars = 30000
-    if len(build_log_content) > max_chars:
-        # Keep first 5000 chars (setup/clone) and last 25000 chars (error/timeout)
-        head_chars = 5000
-        tail_chars = 25000
-        build_log_content = build_log_content[:head_chars] + "\n... [middle truncated] ...\n" + build_log_content[-tail_chars:]
+    anchors = log_analysis.match_offsets if log_analysis else []
+    log_description = "excerpts around the errors; omitted lines are marked"
+    if baseline is not None:
+        build_log_content, anchors = baseline.reduce(build_log_content, anchors)
+        log_description = f"only lines not printed by successful runs of this job, {log_description}"
+    build_log_content = select_context(build_log_content, anchors, token_budget)
     
     prompt = f"""You are an expert SRE analyzing CI build logs for Red Hat Developer Hub (RHDH) on OpenShift.
 The Playwright E2E tests never started, indicating an infrastructure or environment setup failure.
@@ -412,7 +605,7 @@ Respond in this exact JSON format (no markdown):
   "confidence": "<high|medium|low>"
 }}
 
-BUILD LOG (truncated):
+BUILD LOG ({log_description}):
 {build_log_content}
 """
     
@@ -445,165 +638,83 @@ BUILD LOG (truncated):
         )
 
 
+# Playwright test execution: "Running X tests using Y workers"
+RUNNING_TESTS_PATTERN = LogPattern(r'Running (\d+) tests? using (\d+) workers?', [" using "])
+
+# Rules for the build log indicators, infra failure categories and junit
+# error types (see classifier_rules.py); set by use_rules()
+_rules: Optional[RuleSet] = None
+
+
+def use_rules(path: Path = DEFAULT_RULES_FILE) -> RuleSet:
+    """Load the classification rules from a TOML file and use them from now on.
+
+    Raises ValueError if the file or one of its rules is invalid.
+    """
+    global _rules
+    rules = load_rules(path)
+    for rule in rules.tables["infra"]:
+        if rule.category not in InfraFailureCategory.__members__:
+            raise ValueError(f"{path}: infra rule {rule.name}: unknown category {rule.category}")
+    _rules = rules
+    return rules
+
+
+def classification_rules() -> RuleSet:
+    """Return the rules in use, loading the default rules file on first use."""
+    return _rules if _rules is not None else use_rules()
+
+
 def analyze_build_log(log_content: str) -> BuildLogAnalysis:
     """Analyze build log content and extract classification indicators."""
     analysis = BuildLogAnalysis()
+    scan = LogScan(log_content)
+    rules = classification_rules()
     
     # Check for Playwright test execution
-    # Pattern: "Running X tests using Y workers"
-    running_match = re.search(r'Running (\d+) tests? using (\d+) workers?', log_content)
+    running_match = scan.search(RUNNING_TESTS_PATTERN)
     if running_match:
         analysis.playwright_tests_started = True
         analysis.test_count = int(running_match.group(1))
         analysis.worker_count = int(running_match.group(2))
     
     # Check for timeout errors (infrastructure failure indicators)
-    timeout_patterns = [
-        r'Timed out (?:after \d+ seconds\. )?(?:waiting for [^.]+|[^.]+)',
-        r'Error: Timed out waiting for [^.]+',
-        r'timeout: \d+[ms]* exceeded',
-    ]
-    for pattern in timeout_patterns:
-        timeout_match = re.search(pattern, log_content, re.IGNORECASE)
-        if timeout_match:
-            analysis.has_timeout = True
-            analysis.timeout_message = timeout_match.group(0)[:100]  # Truncate
-            break
+    if found := rules.match_log("timeout", scan):
+        analysis.has_timeout = True
+        analysis.timeout_message = found[1].group(0)[:100]  # Truncate
+        analysis.match_offsets.append(found[1].start())
     
     # Check for error indicators
-    error_patterns = [
-        r'❌ Exited with an error',
-        r'Error: [A-Z][^.\n]{10,100}',  # Error followed by meaningful message
-        r'FATAL: [^\n]+',
-        r'error: cannot [^\n]+',
-    ]
-    for pattern in error_patterns:
-        error_match = re.search(pattern, log_content)
-        if error_match:
-            analysis.has_error = True
-            analysis.error_message = error_match.group(0)[:100]  # Truncate
-            break
+    if found := rules.match_log("error", scan):
+        analysis.has_error = True
+        analysis.error_message = found[1].group(0)[:100]  # Truncate
+        analysis.match_offsets.append(found[1].start())
     
     # Check for interrupt/abort signals (job was manually cancelled)
-    interrupt_patterns = [
-        r'Entrypoint received interrupt: terminated',
-        r'Received signal\.[^\n]*interrupt',
-        r'"msg":\s*"Received signal\."[^}]*"signal":\s*2',  # SIGINT in JSON logs
-        r'Process did not exit before \d+s grace period',
-        r'context canceled',
-        r'context deadline exceeded',
-    ]
-    for pattern in interrupt_patterns:
-        interrupt_match = re.search(pattern, log_content, re.IGNORECASE)
-        if interrupt_match:
-            analysis.has_interrupt = True
-            analysis.interrupt_message = interrupt_match.group(0)[:100]
-            break
+    if found := rules.match_log("interrupt", scan):
+        analysis.has_interrupt = True
+        analysis.interrupt_message = found[1].group(0)[:100]
+        analysis.match_offsets.append(found[1].start())
     
     # Detect specific infrastructure failure categories (if tests didn't start)
     if not analysis.playwright_tests_started:
-        _detect_infra_failure_category(analysis, log_content)
+        _detect_infra_failure_category(analysis, scan, rules)
     
     return analysis
 
 
-def _detect_infra_failure_category(analysis: BuildLogAnalysis, log_content: str) -> None:
+def _detect_infra_failure_category(analysis: BuildLogAnalysis, scan: LogScan, rules: RuleSet) -> None:
     """Detect specific infrastructure failure category from build log.
 
-    Categories based on OpenShift CI artifacts documentation:
-    https://docs.ci.openshift.org/docs/how-tos/artifacts/
+    The categories and their patterns are the infra rules of the rules file,
+    tried in order.
     """
-
-    # 1. Repository Clone Failure (check clone-log.txt indicators in build log)
-    clone_failure_patterns = [
-        r'failed to clone[^\n]*',
-        r'error: RPC failed[^\n]*',
-        r'fatal: could not read from remote repository[^\n]*',
-        r'Cloning into .* failed[^\n]*',
-        r'clonerefs.*error[^\n]*',
-        r'failed to fetch[^\n]*repository[^\n]*',
-    ]
-    for pattern in clone_failure_patterns:
-        if match := re.search(pattern, log_content, re.IGNORECASE):
-            analysis.infra_failure_category = InfraFailureCategory.CLONE_FAILURE
-            analysis.infra_failure_detail = match.group(0)[:80]
-            return
-
-    # 2. Docker Image Timeout - most common
-    if match := re.search(r'Timed out waiting for Docker image ([^\s.]+)', log_content):
-        analysis.infra_failure_category = InfraFailureCategory.DOCKER_IMAGE_TIMEOUT
-        analysis.infra_failure_detail = f"Image: {match.group(1)}"
-        return
-
-    # 3. Operator Installation Timeout
-    if match := re.search(r"Operator '([^']+)' did not reach '([^']+)'", log_content):
-        analysis.infra_failure_category = InfraFailureCategory.OPERATOR_INSTALL_TIMEOUT
-        analysis.infra_failure_detail = f"{match.group(1)} (expected: {match.group(2)})"
-        return
-    
-    # 3. Pod/Deployment Not Ready
-    if match := re.search(r"(Pod|Deployment) '([^']+)' is not ready", log_content, re.IGNORECASE):
-        analysis.infra_failure_category = InfraFailureCategory.POD_NOT_READY
-        analysis.infra_failure_detail = f"{match.group(1)}: {match.group(2)}"
-        return
-    
-    # Also check for pod timeout patterns
-    if match := re.search(r'(pod|deployment)[^\n]*(not ready|timeout|timed out)[^\n]*', log_content, re.IGNORECASE):
-        analysis.infra_failure_category = InfraFailureCategory.POD_NOT_READY
-        analysis.infra_failure_detail = match.group(0)[:80]
-        return
-    
-    # 4. Missing CRD
-    if match := re.search(r'resource mapping not found.*no matches for kind "([^"]+)"', log_content, re.DOTALL):
-        analysis.infra_failure_category = InfraFailureCategory.MISSING_CRD
-        analysis.infra_failure_detail = f"Kind: {match.group(1)}"
-        return
-    
-    if match := re.search(r'ensure CRDs are installed first', log_content):
-        analysis.infra_failure_category = InfraFailureCategory.MISSING_CRD
-        # Try to find which CRD
-        if crd_match := re.search(r'no matches for kind "([^"]+)"', log_content):
-            analysis.infra_failure_detail = f"Kind: {crd_match.group(1)}"
-        return
-    
-    # 5. Helm Install Failed
-    if match := re.search(r'Error: (INSTALLATION FAILED|UPGRADE FAILED)[^\n]*', log_content):
-        analysis.infra_failure_category = InfraFailureCategory.HELM_INSTALL_FAILED
-        analysis.infra_failure_detail = match.group(0)[:80]
-        return
-    
-    # 6. Cluster Connectivity Issues
-    connectivity_patterns = [
-        r'Unable to connect to the server[^\n]*',
-        r'connection refused[^\n]*',
-        r'no route to host[^\n]*',
-        r'dial tcp[^\n]*connection refused',
-        r'i/o timeout[^\n]*',
-    ]
-    for pattern in connectivity_patterns:
-        if match := re.search(pattern, log_content, re.IGNORECASE):
-            analysis.infra_failure_category = InfraFailureCategory.CLUSTER_CONNECTIVITY
-            analysis.infra_failure_detail = match.group(0)[:80]
-            return
-
-    # 7. Resource Quota Exceeded (from pods.json/events.json indicators in build log)
-    quota_patterns = [
-        r'exceeded quota[^\n]*',
-        r'forbidden: exceeded[^\n]*',
-        r'resource quota[^\n]*exceeded[^\n]*',
-        r'insufficient[^\n]*(cpu|memory|quota)[^\n]*',
-        r'FailedScheduling[^\n]*Insufficient[^\n]*',
-    ]
-    for pattern in quota_patterns:
-        if match := re.search(pattern, log_content, re.IGNORECASE):
-            analysis.infra_failure_category = InfraFailureCategory.RESOURCE_QUOTA_EXCEEDED
-            analysis.infra_failure_detail = match.group(0)[:80]
-            return
-
-    # 8. Script Error (generic ❌)
-    if match := re.search(r'❌ ([^\n]+)', log_content):
-        analysis.infra_failure_category = InfraFailureCategory.SCRIPT_ERROR
-        analysis.infra_failure_detail = match.group(1)[:80]
+    if found := rules.match_log("infra", scan):
+        rule, match = found
+        analysis.infra_failure_category = InfraFailureCategory[rule.category]
+        analysis.match_offsets.append(match.start())
+        if (detail := rule.format_detail(match, scan)) is not None:
+            analysis.infra_failure_detail = detail
         return
     
     # If we have a timeout or error but couldn't categorize specifically
@@ -612,64 +723,80 @@ def _detect_infra_failure_category(analysis: BuildLogAnalysis, log_content: str)
         analysis.infra_failure_detail = analysis.timeout_message or analysis.error_message
 
 
-def analyze_run(run_path: Path, pr_number: str, run_id: str, job_name: str = "", ai_client=None) -> RunAnalysis:
-    """Analyze a single CI run and classify it."""
+def diff_against_baseline(analysis: RunAnalysis, baseline: Optional[Baseline]) -> None:
+    """Record the build log lines no successful run of the job printed (count and excerpt)."""
+    if baseline is None or not analysis.build_log_content:
+        return
+    lines = baseline.novel_lines(analysis.build_log_content)
+    analysis.novel_line_count = len(lines)
+    analysis.novel_lines = novel_excerpt(lines)
+
+
+def analyze_run(
+    run: "Path | RunSource",
+    pr_number: str,
+    run_id: str,
+    job_name: str = "",
+    ai_client=None,
+    ai_token_budget: int = DEFAULT_TOKEN_BUDGET,
+    baselines: Optional[BaselineStore] = None,
+) -> RunAnalysis:
+    """Analyze a single CI run and classify it.
+
+    The run can be a local run directory or any RunSource (e.g. files held
+    in memory), so classification doesn't depend on where the files live.
+    With baselines, the build log of an infrastructure failure is compared
+    against the job's baseline (see diff_against_baseline).
+    """
+    source = run if isinstance(run, RunSource) else LocalRunSource(run)
     analysis = RunAnalysis(
         pr_number=pr_number,
         run_id=run_id,
-        run_path=run_path,
+        run_path=source.path(),
         job_name=job_name
     )
     
     # Get job status from finished.json and prowjob.json
-    analysis.job_status = get_job_status(run_path)
+    analysis.job_status = get_job_status(source)
     
     # Define artifact paths
-    artifacts_base = run_path / "artifacts" / "e2e-ocp-helm" / "redhat-developer-rhdh-ocp-helm" / "artifacts"
-    showcase_dir = artifacts_base / "showcase"
-    showcase_rbac_dir = artifacts_base / "showcase-rbac"
+    showcase_dir = f"{ARTIFACTS_BASE}/showcase"
+    showcase_rbac_dir = f"{ARTIFACTS_BASE}/showcase-rbac"
     
     # Check showcase directories
-    analysis.has_showcase = showcase_dir.exists()
-    analysis.has_showcase_rbac = showcase_rbac_dir.exists()
+    analysis.has_showcase = source.exists(showcase_dir)
+    analysis.has_showcase_rbac = source.exists(showcase_rbac_dir)
     
     # Check junit results
-    junit_showcase_path = showcase_dir / "junit-results.xml"
-    junit_rbac_path = showcase_rbac_dir / "junit-results.xml"
+    junit_showcase_path = f"{showcase_dir}/junit-results.xml"
+    junit_rbac_path = f"{showcase_rbac_dir}/junit-results.xml"
     
-    analysis.has_junit_showcase = junit_showcase_path.exists()
-    analysis.has_junit_rbac = junit_rbac_path.exists()
+    analysis.has_junit_showcase = source.exists(junit_showcase_path)
+    analysis.has_junit_rbac = source.exists(junit_rbac_path)
 
     # Parse junit files with context for failure tracking
-    analysis.junit_showcase = parse_junit(junit_showcase_path, pr_number, run_id, "showcase")
-    analysis.junit_rbac = parse_junit(junit_rbac_path, pr_number, run_id, "showcase-rbac")
+    analysis.junit_showcase = parse_junit_content(source.read_text(junit_showcase_path), pr_number, run_id, "showcase")
+    analysis.junit_rbac = parse_junit_content(source.read_text(junit_rbac_path), pr_number, run_id, "showcase-rbac")
     
     # Count artifacts
     if analysis.has_showcase:
-        analysis.webm_count_showcase = count_files(showcase_dir, ".webm")
-        analysis.png_count_showcase = count_files(showcase_dir, ".png")
+        analysis.webm_count_showcase = source.count_files(showcase_dir, ".webm")
+        analysis.png_count_showcase = source.count_files(showcase_dir, ".png")
     
     if analysis.has_showcase_rbac:
-        analysis.webm_count_rbac = count_files(showcase_rbac_dir, ".webm")
-        analysis.png_count_rbac = count_files(showcase_rbac_dir, ".png")
+        analysis.webm_count_rbac = source.count_files(showcase_rbac_dir, ".webm")
+        analysis.png_count_rbac = source.count_files(showcase_rbac_dir, ".png")
     
     # Read overall result
-    overall_result_path = artifacts_base / "reporting" / "OVERALL_RESULT.txt"
-    analysis.overall_result = read_overall_result(overall_result_path)
+    analysis.overall_result = parse_overall_result(source.read_text(f"{ARTIFACTS_BASE}/reporting/OVERALL_RESULT.txt"))
     
-    # Find build log path (check multiple locations)
-    build_log_candidates = [
-        run_path / "artifacts" / "e2e-ocp-helm" / "redhat-developer-rhdh-ocp-helm" / "build-log.txt",
-        run_path / "build-log.txt",
-    ]
-    for log_path in build_log_candidates:
-        if log_path.exists():
-            analysis.build_log_path = log_path
-            break
+    # Find build log (check multiple locations)
+    build_log_relpath = next((p for p in BUILD_LOG_CANDIDATES if source.exists(p)), None)
     
     # Analyze build log content
-    if analysis.build_log_path:
-        log_content = read_build_log(analysis.build_log_path)
+    if build_log_relpath:
+        analysis.build_log_path = source.path(build_log_relpath)
+        log_content = source.read_text(build_log_relpath)
         if log_content:
             analysis.build_log_content = log_content  # Store for AI analysis
             analysis.build_log_analysis = analyze_build_log(log_content)
@@ -677,6 +804,7 @@ def analyze_run(run_path: Path, pr_number: str, run_id: str, job_name: str = "",
     # Classify based on job status, build log content, and artifacts
     log_analysis = analysis.build_log_analysis
     job_status = analysis.job_status
+    baseline = baselines.get(job_name) if baselines is not None and job_name else None
     
     # Check for aborted job first (highest priority - job was manually cancelled)
     if job_status and job_status.is_aborted:
@@ -704,9 +832,10 @@ def analyze_run(run_path: Path, pr_number: str, run_id: str, job_name: str = "",
     elif log_analysis and (log_analysis.has_timeout or log_analysis.has_error or log_analysis.infra_failure_category):
         # Error or timeout before tests started
         analysis.classification = Classification.INFRA_FAILURE
+        diff_against_baseline(analysis, baseline)
         if ai_client and analysis.build_log_content:
             # Use AI to analyze the infrastructure failure
-            ai_result = analyze_with_ai(ai_client, analysis.build_log_content)
+            ai_result = analyze_with_ai(ai_client, analysis.build_log_content, log_analysis, ai_token_budget, baseline)
             analysis.ai_analysis = ai_result
             analysis.reason = f"{ai_result.root_cause_category}: {ai_result.root_cause_detail}" if ai_result.root_cause_detail else ai_result.root_cause_category
         elif log_analysis.infra_failure_category:
@@ -720,9 +849,10 @@ def analyze_run(run_path: Path, pr_number: str, run_id: str, job_name: str = "",
     elif log_analysis:
         # Build log exists but no clear indicators - likely infra failure
         analysis.classification = Classification.INFRA_FAILURE
+        diff_against_baseline(analysis, baseline)
         if ai_client and analysis.build_log_content:
             # Use AI to analyze the infrastructure failure
-            ai_result = analyze_with_ai(ai_client, analysis.build_log_content)
+            ai_result = analyze_with_ai(ai_client, analysis.build_log_content, log_analysis, ai_token_budget, baseline)
             analysis.ai_analysis = ai_result
             analysis.reason = f"{ai_result.root_cause_category}: {ai_result.root_cause_detail}" if ai_result.root_cause_detail else ai_result.root_cause_category
         else:
@@ -750,6 +880,61 @@ def analyze_run(run_path: Path, pr_number: str, run_id: str, job_name: str = "",
     return analysis
 
 
+def _json_default(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def save_run_result(analysis: RunAnalysis, path: Path) -> None:
+    """Store a run's classification (without the build log content) as JSON.
+
+    Used by retain-logs.py for runs whose files are deleted; analyze_directory
+    reads the stored result instead. The build log path is dropped, as the
+    log goes with the run directory.
+    """
+    data = asdict(replace(analysis, build_log_content=None, build_log_path=None))
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, default=_json_default)
+    os.replace(tmp_path, path)
+
+
+def load_run_result(path: Path) -> Optional[RunAnalysis]:
+    """Load a classification stored by save_run_result, or None if unreadable."""
+    try:
+        data = json.loads(path.read_text())
+
+        def junit(stats: Optional[dict]) -> Optional[JUnitStats]:
+            if stats is None:
+                return None
+            return JUnitStats(**{**stats, "failed_tests": [TestCaseFailure(**t) for t in stats["failed_tests"]]})
+
+        log_analysis = data["build_log_analysis"]
+        if log_analysis is not None:
+            category = log_analysis["infra_failure_category"]
+            log_analysis = BuildLogAnalysis(**{
+                **log_analysis,
+                "infra_failure_category": InfraFailureCategory(category) if category else None,
+            })
+        return RunAnalysis(**{
+            **data,
+            "run_path": Path(data["run_path"]),
+            # Stored results are of retired runs, whose build log is gone (older files still name it)
+            "build_log_path": None,
+            "job_status": JobStatus(**data["job_status"]) if data["job_status"] else None,
+            "junit_showcase": junit(data["junit_showcase"]),
+            "junit_rbac": junit(data["junit_rbac"]),
+            "build_log_analysis": log_analysis,
+            "ai_analysis": AIRootCauseAnalysis(**data["ai_analysis"]) if data["ai_analysis"] else None,
+            "classification": Classification(data["classification"]),
+        })
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
 def print_header():
     """Print the script header."""
     print(f"{Color.BOLD}╔══════════════════════════════════════════════════════════════════╗{Color.NC}")
@@ -1026,6 +1211,15 @@ def analyze_single_run_detailed(run_path: Path):
                     print(f"    → {log_analysis.infra_failure_detail}")
         else:
             print(f"  {Color.YELLOW}⚠{Color.NC} Could not parse build log")
+        
+        # Last lines of the log (only the tail is decompressed for seekable archives)
+        tail = LocalRunSource(run_path).read_tail(
+            analysis.build_log_path.relative_to(run_path).as_posix(), DETAIL_TAIL_LINES
+        )
+        if tail:
+            print(f"  Last {DETAIL_TAIL_LINES} lines:")
+            for line in tail.splitlines():
+                print(f"    {line}")
     else:
         print(f"  {Color.RED}✗{Color.NC} Build log NOT found")
     
@@ -1201,6 +1395,13 @@ def generate_summary_markdown_report(summary: Summary, ai_analyze: bool = False)
                 elif run.build_log_analysis and run.build_log_analysis.infra_failure_detail:
                     detail = f" - {run.build_log_analysis.infra_failure_detail[:60]}"
                 lines.append(f"- [PR #{run.pr_number}]({github_url}) ([job logs]({prow_url})){detail}")
+                if run.novel_lines:
+                    lines.append(f"  <details><summary>{run.novel_line_count} build log lines not seen in successful runs</summary>")
+                    lines.append("")
+                    lines.append("  ```")
+                    lines.extend(f"  {line}" for line in run.novel_lines)
+                    lines.append("  ```")
+                    lines.append("  </details>")
             lines.append("")
 
     # Aborted jobs
@@ -1336,14 +1537,27 @@ def generate_test_failure_markdown(failures: List[TestCaseFailure]) -> List[str]
     return lines
 
 
-def analyze_directory(logs_dir: Path, ai_analyze: bool = False, output_file: Optional[str] = None, pr_limit: Optional[int] = None) -> Summary:
-    """Analyze all CI runs in a directory."""
+def analyze_directory(
+    logs_dir: Path,
+    ai_analyze: bool = False,
+    output_file: Optional[str] = None,
+    pr_limit: Optional[int] = None,
+    miner: Optional[TemplateMiner] = None,
+    ai_token_budget: int = DEFAULT_TOKEN_BUDGET,
+    baselines: Optional[BaselineStore] = None,
+) -> Summary:
+    """Analyze all CI runs in a directory.
+
+    With a miner, the build logs of infrastructure failures without a known
+    category are mined for templates (see print_templates); with baselines,
+    only their lines not in the job's baseline.
+    """
     print_header()
     print(f"{Color.CYAN}Scanning directory: {logs_dir}{Color.NC}")
     if pr_limit:
         print(f"{Color.CYAN}Limiting to {pr_limit} most recent PRs{Color.NC}")
     if ai_analyze:
-        print(f"{Color.CYAN}Using AI for infrastructure failure analysis{Color.NC}")
+        print(f"{Color.CYAN}Using AI for infrastructure failure analysis (up to {ai_token_budget} log tokens per run){Color.NC}")
     print()
 
     # Initialize AI client early if needed
@@ -1371,43 +1585,113 @@ def analyze_directory(logs_dir: Path, ai_analyze: bool = False, output_file: Opt
             if not job_dir.is_dir() or not job_dir.name.startswith("pull-ci-"):
                 continue
             
-            # Find run directories
-            for run_dir in job_dir.iterdir():
-                if not run_dir.is_dir():
-                    continue
-                
-                run_id = run_dir.name
+            # Find run directories (or their bundles, see archive-logs.py --bundle,
+            # or the stored results of runs retired by retain-logs.py)
+            run_ids = set()
+            results = set()
+            for entry in job_dir.iterdir():
+                if entry.is_dir():
+                    run_ids.add(entry.name)
+                elif entry.name.endswith(BUNDLE_SUFFIX):
+                    run_ids.add(entry.name[:-len(BUNDLE_SUFFIX)])
+                elif entry.name.endswith(RESULT_SUFFIX):
+                    results.add(entry.name[:-len(RESULT_SUFFIX)])
+            
+            for run_id in sorted(run_ids | results):
                 if not run_id.isdigit():
                     continue
                 
-                analysis = analyze_run(run_dir, pr_number, run_id, job_name=job_dir.name, ai_client=ai_client)
+                run_dir = job_dir / run_id
+                analysis = None
+                if run_id not in run_ids:
+                    analysis = load_run_result(job_dir / f"{run_id}{RESULT_SUFFIX}")
+                if analysis is None:
+                    analysis = analyze_run(
+                        run_dir, pr_number, run_id, job_name=job_dir.name,
+                        ai_client=ai_client, ai_token_budget=ai_token_budget, baselines=baselines
+                    )
+                if miner is not None and is_uncategorized(analysis) and analysis.build_log_content:
+                    log_content = analysis.build_log_content
+                    baseline = baselines.get(job_dir.name) if baselines is not None else None
+                    if baseline is not None:
+                        log_content = "\n".join(baseline.novel_lines(log_content))
+                    miner.add_log(log_content, f"{pr_number}/{job_dir.name}/{run_id}")
                 print_run_result(analysis)
-
-                # Update summary
-                summary.total += 1
-                if analysis.classification == Classification.INFRA_FAILURE:
-                    summary.infra_failures += 1
-                    summary.infra_failure_runs.append(analysis)
-                elif analysis.classification == Classification.TEST_FAILURE:
-                    summary.test_failures += 1
-                    summary.test_failure_runs.append(analysis)
-                elif analysis.classification == Classification.TEST_SUCCESS:
-                    summary.test_successes += 1
-                elif analysis.classification == Classification.JOB_ABORTED:
-                    summary.job_aborted += 1
-                    summary.aborted_runs.append(analysis)
-                else:
-                    summary.unknown += 1
-
-                # Collect individual test failures from junit reports
-                if analysis.junit_showcase and analysis.junit_showcase.failed_tests:
-                    summary.all_test_failures.extend(analysis.junit_showcase.failed_tests)
-                if analysis.junit_rbac and analysis.junit_rbac.failed_tests:
-                    summary.all_test_failures.extend(analysis.junit_rbac.failed_tests)
+                add_to_summary(summary, analysis)
     
     print_summary(summary, ai_analyze=ai_analyze)
+    save_markdown_report(summary, ai_analyze=ai_analyze, output_file=output_file)
+
+    return summary
+
+
+def is_uncategorized(analysis: RunAnalysis) -> bool:
+    """Whether a run is an infrastructure failure no infra rule categorized."""
+    if analysis.classification != Classification.INFRA_FAILURE:
+        return False
+    log_analysis = analysis.build_log_analysis
+    category = log_analysis.infra_failure_category if log_analysis else None
+    return category in (None, InfraFailureCategory.UNKNOWN)
+
 
-    # Generate markdown report
+def print_templates(miner: TemplateMiner, min_runs: int, limit: int = 20) -> None:
+    """Print the most widespread templates and infra rule candidates for those in min_runs runs."""
+    print()
+    print(f"{Color.BOLD}Log templates of uncategorized infrastructure failures{Color.NC}")
+    print(f"{miner.logs_seen} logs, {miner.lines_seen} lines, {len(miner.clusters)} templates"
+          + (f" ({miner.evicted} evicted)" if miner.evicted else ""))
+    templates = miner.templates()
+    if not templates:
+        return
+    print()
+    print(f"{'Runs':>5} {'Lines':>6}  Template")
+    for cluster in templates[:limit]:
+        print(f"{cluster.runs:>5} {cluster.lines:>6}  {cluster.text[:120]}")
+
+    candidates = miner.templates(min_runs)
+    if not candidates:
+        print()
+        print(f"No template occurs in {min_runs} or more runs.")
+        return
+    print()
+    print(f"{Color.BOLD}Candidate rules for {DEFAULT_RULES_FILE.name} (templates in {min_runs}+ runs){Color.NC}")
+    for cluster in candidates[:limit]:
+        rule = candidate_rule(cluster, f"mined-{cluster.cluster_id}")
+        if rule is None:
+            continue
+        print()
+        print(f"# {cluster.runs} runs, e.g. {', '.join(cluster.example_runs)}")
+        print(f"# {cluster.example_line[:160]}")
+        print(rule)
+
+
+def add_to_summary(summary: Summary, analysis: RunAnalysis) -> None:
+    """Add a classified run to the summary statistics."""
+    summary.analyzed_prs.add(analysis.pr_number)
+    summary.total += 1
+    if analysis.classification == Classification.INFRA_FAILURE:
+        summary.infra_failures += 1
+        summary.infra_failure_runs.append(analysis)
+    elif analysis.classification == Classification.TEST_FAILURE:
+        summary.test_failures += 1
+        summary.test_failure_runs.append(analysis)
+    elif analysis.classification == Classification.TEST_SUCCESS:
+        summary.test_successes += 1
+    elif analysis.classification == Classification.JOB_ABORTED:
+        summary.job_aborted += 1
+        summary.aborted_runs.append(analysis)
+    else:
+        summary.unknown += 1
+
+    # Collect individual test failures from junit reports
+    if analysis.junit_showcase and analysis.junit_showcase.failed_tests:
+        summary.all_test_failures.extend(analysis.junit_showcase.failed_tests)
+    if analysis.junit_rbac and analysis.junit_rbac.failed_tests:
+        summary.all_test_failures.extend(analysis.junit_rbac.failed_tests)
+
+
+def save_markdown_report(summary: Summary, ai_analyze: bool = False, output_file: Optional[str] = None) -> Path:
+    """Write the markdown report to reports/ with a timestamp suffix and return its path."""
     reports_dir = Path("reports")
     reports_dir.mkdir(exist_ok=True)
 
@@ -1425,7 +1709,7 @@ def analyze_directory(logs_dir: Path, ai_analyze: bool = False, output_file: Opt
     print()
     print(f"{Color.GREEN}✓ Report saved to: {Color.BOLD}{report_file}{Color.NC}")
 
-    return summary
+    return report_file
 
 
 def main():
@@ -1440,6 +1724,9 @@ Examples:
   %(prog)s -s ./ci-logs/3843/pull-ci.../run-id/  # Single run analysis
   %(prog)s -o my-report                        # Custom base name (reports/my-report_YYYY-MM-DD_HH-MM-SS.md)
   %(prog)s --ai                                # Use AI to analyze infrastructure failures
+  %(prog)s --rules my-rules.toml --rule-stats  # Custom rules, with per-rule statistics
+  %(prog)s --mine-templates                    # Suggest rules for uncategorized infra failures
+  %(prog)s --baselines                         # Show what failed runs printed that successful ones didn't
 
 Environment Variables:
   GEMINI_API_KEY or GOOGLE_API_KEY    Required for --ai mode
@@ -1461,6 +1748,14 @@ Environment Variables:
         action='store_true',
         help='Use Gemini AI to analyze infrastructure failures and determine root causes'
     )
+    parser.add_argument(
+        '--ai-token-budget',
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        metavar='TOKENS',
+        help=f'With --ai, send at most about this many tokens of each build log, the parts around the errors '
+             f'(default: {DEFAULT_TOKEN_BUDGET})'
+    )
     parser.add_argument(
         '-o', '--output',
         type=str,
@@ -1473,23 +1768,70 @@ Environment Variables:
         default=None,
         help='Limit analysis to N most recent PRs (by PR number)'
     )
+    parser.add_argument(
+        '--rules',
+        type=Path,
+        default=DEFAULT_RULES_FILE,
+        help=f'TOML file with the classification rules (default: {DEFAULT_RULES_FILE.name} next to this script)'
+    )
+    parser.add_argument(
+        '--rule-stats',
+        action='store_true',
+        help='Evaluate every rule (not only up to the first match) and print per-rule hit counts, '
+             'first matches and matching time at the end'
+    )
+
+    parser.add_argument(
+        '--baselines',
+        action='store_true',
+        help='Compare the build logs of infrastructure failures against the baselines of successful runs '
+             'built by build-baselines.py: the report lists the novel lines, and --ai and --mine-templates '
+             'only get those'
+    )
+    parser.add_argument(
+        '--mine-templates',
+        nargs='?',
+        type=int,
+        const=3,
+        default=None,
+        metavar='MIN_RUNS',
+        help='Mine the build logs of uncategorized infrastructure failures for recurring line templates '
+             'and print candidate infra rules for those in MIN_RUNS or more runs (default: 3)'
+    )
 
     args = parser.parse_args()
     path = Path(args.path)
     
-    if not path.exists():
+    if not path.exists() and not (args.single and bundle_path(path).exists()):
         print(f"Error: Path not found: {path}", file=sys.stderr)
         sys.exit(1)
     
+    try:
+        rules = use_rules(args.rules)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    rules.count_all = args.rule_stats
+    
+    miner = TemplateMiner() if args.mine_templates is not None else None
     if args.single:
-        analyze_single_run_detailed(path)
+        analyze_single_run_detailed(run_dir_of(path))
     else:
         analyze_directory(
             path,
             ai_analyze=args.ai,
             output_file=args.output,
-            pr_limit=args.limit
+            pr_limit=args.limit,
+            miner=miner,
+            ai_token_budget=args.ai_token_budget,
+            baselines=BaselineStore(path) if args.baselines else None
         )
+        if miner is not None:
+            print_templates(miner, args.mine_templates)
+    
+    if args.rule_stats:
+        print()
+        rules.print_stats()
 
 
 if __name__ == "__main__":
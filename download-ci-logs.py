@@ -8,12 +8,45 @@ Rewritten from download-ci-logs.sh using google-cloud-storage library.
 
 import argparse
 import fnmatch
+import json
+import re
 import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Callable
 
 from google.cloud import storage
-from google.cloud.storage import transfer_manager
+
+from download_telemetry import Telemetry, add_telemetry_arguments
+from gcs_transfer import (
+    DEADLINE_MIN_THROUGHPUT,
+    DEFAULT_DEADLINE,
+    MIN_WORKERS,
+    AdaptiveConcurrency,
+    TransferPool,
+    commit_file,
+    print_failure_report,
+    write_failure_report,
+)
+from listing_cache import CachingClient, add_listing_cache_arguments, open_listing_cache
+from run_bundle import bundled_files
+from run_retention import TIER_INPUTS_ONLY, TIER_NO_MEDIA, TIER_RESULTS_ONLY, retention_tier
+from log_codecs import (
+    ARCHIVED_MARKER,
+    CODECS,
+    DEFAULT_LEVELS,
+    LEVEL_RANGES,
+    codec_available,
+    codec_install_hint,
+    is_compressible,
+    open_compressed_writer,
+)
 
 
 # Configuration
@@ -31,11 +64,29 @@ MEDIA_EXCLUDE_PATTERNS = [
     "*.png",         # Screenshots (~2.5G)
     "*.gstmp",       # Temp/staging files (~3G)
 ]
+# Files classify-failures.py reads to classify a run (relative to the run directory)
+CLASSIFIER_INPUT_PATTERNS = [
+    "build-log.txt",
+    "finished.json",
+    "prowjob.json",
+    "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/build-log.txt",
+    "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/artifacts/*/junit-results.xml",
+    "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/artifacts/reporting/OVERALL_RESULT.txt",
+]
 MAX_PRS = 200
 MAX_WORKERS = 10
+DOWNLOADS_PER_PR = 4  # blob downloads in flight per PR worker
 
+# Called as on_run_ready(pr, job_name, run_id, run_path) once a run's
+# classifier inputs are on disk
+RunReadyCallback = Callable[[str, str, str, Path], None]
+# Called as on_run_fetched(pr, job_name, run_id, location, files, listing) with
+# a run's classifier inputs held in memory ({run-relative path: content}) and
+# the run-relative paths of all files in the run
+RunFetchedCallback = Callable[[str, str, str, str, dict[str, bytes], list[str]], None]
 
-def list_prs(client: storage.Client, bucket_name: str, prefix: str, max_prs: int) -> list[str]:
+
+def list_prs(client: storage.Client, bucket_name: str, prefix: str, max_prs: int | None) -> list[str]:
     """List all PR directories from the bucket."""
     # Use delimiter to get only the top-level directories (PRs)
     blobs = client.list_blobs(bucket_name, prefix=f"{prefix}/", delimiter="/")
@@ -53,7 +104,162 @@ def list_prs(client: storage.Client, bucket_name: str, prefix: str, max_prs: int
     
     # Sort by PR number descending and limit
     pr_numbers.sort(key=int, reverse=True)
-    return pr_numbers[:max_prs]
+    return pr_numbers[:max_prs] if max_prs else pr_numbers
+
+
+def parse_time(value: str) -> float:
+    """Parse a --since/--until value into a Unix timestamp.
+
+    Accepts an ISO date or datetime ("2026-01-10", "2026-01-10T08:00",
+    local time unless an offset is given) or a relative age such as "90m",
+    "24h" or "7d" meaning that long before now.
+    """
+    if match := re.fullmatch(r"(\d+)([mhd])", value.strip()):
+        seconds = int(match.group(1)) * {"m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return time.time() - seconds
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid time '{value}' (use an ISO date/datetime or an age like 24h, 7d)"
+        )
+
+
+class RunWindow:
+    """Selects runs whose start time lies within [since, until].
+
+    Prow run IDs are monotonic in start time across all PRs and jobs, so
+    every started.json timestamp we read tells us about other runs too: a
+    run started before `since` rules out every lower run ID, one started
+    at or after `since` admits every higher run ID, and likewise for
+    `until`. These learned bounds are shared between threads and turned
+    into start/end offsets for GCS listings, so listings skip runs outside
+    the window. The remaining edges are found by binary search over a job's
+    sorted run IDs, so most runs are decided without reading their
+    started.json at all.
+    """
+
+    def __init__(self, since: float | None = None, until: float | None = None, telemetry: Telemetry | None = None):
+        self.since = since
+        self.until = until
+        self.telemetry = telemetry
+        self._lock = threading.Lock()
+        self._too_old: int | None = None    # highest run ID started before `since`
+        self._after_since: int | None = None  # lowest run ID started at/after `since`
+        self._before_until: int | None = None  # highest run ID started at/before `until`
+        self._too_new: int | None = None    # lowest run ID started after `until`
+        self.started_reads = 0
+
+    def describe(self) -> str:
+        fmt = lambda ts: datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+        since = fmt(self.since) if self.since is not None else "beginning"
+        until = fmt(self.until) if self.until is not None else "now"
+        return f"{since} .. {until}"
+
+    def _record(self, run_id: int, started: float) -> None:
+        with self._lock:
+            if self.since is not None:
+                if started < self.since:
+                    self._too_old = max(run_id, self._too_old or run_id)
+                else:
+                    self._after_since = min(run_id, self._after_since or run_id)
+            if self.until is not None:
+                if started > self.until:
+                    self._too_new = min(run_id, self._too_new or run_id)
+                else:
+                    self._before_until = max(run_id, self._before_until or run_id)
+
+    def _decide(self, run_id: int) -> tuple[bool | None, bool | None]:
+        """Return (started after since?, started before until?), None if unknown."""
+        with self._lock:
+            after_since = before_until = True
+            if self.since is not None:
+                after_since = None
+                if self._after_since is not None and run_id >= self._after_since:
+                    after_since = True
+                elif self._too_old is not None and run_id <= self._too_old:
+                    after_since = False
+            if self.until is not None:
+                before_until = None
+                if self._before_until is not None and run_id <= self._before_until:
+                    before_until = True
+                elif self._too_new is not None and run_id >= self._too_new:
+                    before_until = False
+            return after_since, before_until
+
+    def _run_started(self, client: storage.Client, bucket_name: str, run_prefix: str) -> float | None:
+        """Read the start timestamp from a run's started.json."""
+        blob = client.bucket(bucket_name).blob(f"{run_prefix}started.json")
+        start = time.monotonic()
+        error = False
+        try:
+            data = json.loads(blob.download_as_bytes())
+            return float(data["timestamp"])
+        except Exception:
+            error = True
+            return None
+        finally:
+            with self._lock:
+                self.started_reads += 1
+            if self.telemetry is not None:
+                self.telemetry.observe("read_started", time.monotonic() - start, error=error, label=blob.name)
+
+    def select_runs(self, client: storage.Client, bucket_name: str, job_prefix: str) -> list[str]:
+        """List the run IDs of a job that started within the window (newest first)."""
+        # Run IDs have a fixed number of digits, so lexicographic offsets
+        # match numeric order; the numeric checks below handle the rest
+        list_kwargs = {}
+        with self._lock:
+            if self._too_old is not None:
+                list_kwargs["start_offset"] = f"{job_prefix}{self._too_old + 1}"
+            if self._too_new is not None:
+                list_kwargs["end_offset"] = f"{job_prefix}{self._too_new}"
+        blobs = client.list_blobs(bucket_name, prefix=job_prefix, delimiter="/", **list_kwargs)
+        list(blobs)  # Consume the iterator to get prefixes
+        run_ids = sorted(
+            int(parts[-1]) for run_prefix in blobs.prefixes
+            if (parts := run_prefix.rstrip("/").split("/")) and parts[-1].isdigit()
+        )
+
+        def resolve(run_id: int) -> tuple[bool, bool]:
+            after_since, before_until = self._decide(run_id)
+            if after_since is None or before_until is None:
+                started = self._run_started(client, bucket_name, f"{job_prefix}{run_id}/")
+                if started is None:
+                    return True, True  # can't tell; keep it
+                self._record(run_id, started)
+                after_since, before_until = self._decide(run_id)
+            return bool(after_since), bool(before_until)
+
+        def first_index(predicate) -> int:
+            """Binary search for the first run ID (ascending) where predicate turns true."""
+            lo, hi = 0, len(run_ids)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if predicate(run_ids[mid]):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return lo
+
+        start = first_index(lambda run_id: resolve(run_id)[0])
+        end = first_index(lambda run_id: not resolve(run_id)[1])
+        return [str(run_id) for run_id in reversed(run_ids[start:end])]
+
+
+def list_job_blobs(
+    client: storage.Client,
+    bucket_name: str,
+    job_prefix: str,
+    run_ids: list[str] | None = None,
+) -> list[storage.Blob]:
+    """List the blobs of a job, optionally only those of the given runs."""
+    if run_ids is None:
+        return list(client.list_blobs(bucket_name, prefix=job_prefix))
+    blobs = []
+    for run_id in run_ids:
+        blobs.extend(client.list_blobs(bucket_name, prefix=f"{job_prefix}{run_id}/"))
+    return blobs
 
 
 def should_exclude(blob_name: str, patterns: list[str]) -> bool:
@@ -61,7 +267,119 @@ def should_exclude(blob_name: str, patterns: list[str]) -> bool:
     return any(fnmatch.fnmatch(blob_name, pattern) for pattern in patterns)
 
 
-def download_pr_job(
+def part_file(local_file: Path) -> Path:
+    """Return a unique temporary name next to local_file to download into."""
+    return local_file.with_name(f"{local_file.name}.{uuid.uuid4().hex[:8]}.part")
+
+
+def download_blob_compressed(blob: storage.Blob, local_file: Path, codec: str, level: int, **request_args) -> int:
+    """Stream a blob straight into a compressed local file.
+
+    The file keeps its original name; readers detect the codec by magic bytes.
+
+    Returns: number of compressed bytes written
+    """
+    tmp_file = part_file(local_file)
+    try:
+        with open_compressed_writer(tmp_file, codec, level) as f:
+            blob.download_to_file(f, **request_args)
+        commit_file(tmp_file, local_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+    return local_file.stat().st_size
+
+
+def download_blob(
+    blob: storage.Blob,
+    filename: str,
+    compress: str | None = None,
+    compress_level: int | None = None,
+    **request_args,
+) -> int:
+    """Download one blob unless the local file already exists.
+
+    Compressible blobs are compressed on the fly if compress is set. The
+    data is written to a temporary file next to the target and renamed into
+    place with commit_file(), so an interrupted download never leaves a
+    truncated file, a hedged duplicate request can't interleave with the
+    original and an attempt past its deadline doesn't write the file.
+    request_args (retry, timeout) are passed to the storage client.
+
+    Returns: number of bytes written (0 if skipped)
+    """
+    local_file = Path(filename)
+    if local_file.exists():
+        return 0
+    local_file.parent.mkdir(parents=True, exist_ok=True)
+    if compress and is_compressible(blob.name):
+        return download_blob_compressed(
+            blob, local_file, compress, compress_level or DEFAULT_LEVELS[compress], **request_args
+        )
+    tmp_file = part_file(local_file)
+    try:
+        blob.download_to_filename(str(tmp_file), **request_args)
+        commit_file(tmp_file, local_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+    return local_file.stat().st_size
+
+
+def is_classifier_input(relative_path: str) -> bool:
+    """Check if a run-relative path is one of the files the classifier reads."""
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in CLASSIFIER_INPUT_PATTERNS)
+
+
+@dataclass(eq=False)
+class PlannedFile:
+    """A listed blob, with where it goes locally and which run it belongs to."""
+    blob: storage.Blob
+    local_file: Path
+    pr: str
+    job_name: str
+    run_id: str  # empty for files outside a run directory
+    relative_path: str  # relative to the run directory
+    critical: bool  # one of the classifier inputs
+    present: bool  # already downloaded
+
+    @property
+    def size(self) -> int:
+        return self.blob.size or 0
+
+    @property
+    def run_key(self) -> tuple[str, str, str]:
+        return (self.pr, self.job_name, self.run_id)
+
+
+def is_retired(relative_path: str, tier: int) -> bool:
+    """Check if retain-logs.py dropped a run-relative path at the given tier on purpose."""
+    if tier >= TIER_RESULTS_ONLY:
+        return True
+    if tier >= TIER_INPUTS_ONLY and not is_classifier_input(relative_path):
+        return True
+    return tier >= TIER_NO_MEDIA and should_exclude(relative_path, MEDIA_EXCLUDE_PATTERNS)
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size such as "500M", "2G" or "1048576" (binary units)."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?", value.strip(), re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}' (use e.g. 500M, 2G)")
+    power = " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def format_size(size: int) -> str:
+    """Format a byte count for humans."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def list_pr_job(
     client: storage.Client,
     bucket_name: str,
     bucket_prefix: str,
@@ -69,103 +387,352 @@ def download_pr_job(
     job_name: str,
     output_dir: Path,
     exclude_patterns: list[str],
-) -> tuple[str, str, bool, int]:
-    """Download all logs for a specific PR and job.
-    
-    Returns: (pr, job_name, success, file_count)
-    """
+    run_ids: list[str] | None = None,
+) -> list[PlannedFile]:
+    """List the files of a PR job (or only the given runs) that are not excluded."""
     job_prefix = f"{bucket_prefix}/{pr}/{job_name}/"
     local_path = output_dir / pr / job_name
-    
-    # List all blobs for this job
-    blobs = list(client.list_blobs(bucket_name, prefix=job_prefix))
-    
-    if not blobs:
-        return (pr, job_name, False, 0)
-    
-    # Filter out excluded blobs
-    blobs_to_download = [
-        blob for blob in blobs
-        if not should_exclude(blob.name, exclude_patterns)
-    ]
-    
-    if not blobs_to_download:
-        return (pr, job_name, False, 0)
-    
-    # Create local directory
-    local_path.mkdir(parents=True, exist_ok=True)
-    
-    # Prepare blob-file pairs for download
-    blob_file_pairs = []
-    for blob in blobs_to_download:
+
+    files = []
+    bundled: dict[str, set[str]] = {}  # run ID -> files packed by archive-logs.py --bundle
+    tiers: dict[str, int] = {}  # run ID -> tier retain-logs.py demoted it to
+    for blob in list_job_blobs(client, bucket_name, job_prefix, run_ids):
+        if should_exclude(blob.name, exclude_patterns):
+            continue
         # Calculate relative path from job prefix
         relative_path = blob.name[len(job_prefix):]
         if not relative_path:  # Skip if it's a directory marker
             continue
-        
+        run_id, _, run_relative = relative_path.partition("/")
+        if not run_id.isdigit():
+            run_id, run_relative = "", relative_path
         local_file = local_path / relative_path
-        local_file.parent.mkdir(parents=True, exist_ok=True)
-        blob_file_pairs.append((blob, str(local_file)))
-    
-    if not blob_file_pairs:
-        return (pr, job_name, False, 0)
-    
-    # Download files using transfer manager
-    try:
-        results = transfer_manager.download_many(
-            blob_file_pairs,
-            max_workers=4,
-            skip_if_exists=True,
+        present = local_file.exists()
+        if not present and run_id:
+            if run_id not in bundled:
+                bundled[run_id] = bundled_files(local_path / run_id)
+                tiers[run_id] = retention_tier(local_path / run_id)
+            present = run_relative in bundled[run_id] or is_retired(run_relative, tiers[run_id])
+        files.append(PlannedFile(
+            blob=blob,
+            local_file=local_file,
+            pr=pr,
+            job_name=job_name,
+            run_id=run_id,
+            relative_path=run_relative,
+            critical=bool(run_id) and is_classifier_input(run_relative),
+            present=present,
+        ))
+    return files
+
+
+def schedule_downloads(
+    files: list[PlannedFile],
+    max_bytes: int | None = None,
+    run_max_bytes: int | None = None,
+) -> tuple[list[PlannedFile], list[PlannedFile]]:
+    """Order the missing files for download and apply the byte budgets.
+
+    Classifier inputs of all runs come first, then the other artifacts;
+    within each group smaller files go first. Files are admitted in that
+    order while they fit the total (max_bytes) and per-run (run_max_bytes)
+    budgets; files that don't fit are skipped, but smaller ones after them
+    may still be admitted. Budgets count object sizes in GCS, so with
+    --compress less than that ends up on disk.
+
+    Returns: (scheduled, over_budget)
+    """
+    missing = sorted((f for f in files if not f.present), key=lambda f: (not f.critical, f.size))
+    scheduled = []
+    over_budget = []
+    total = 0
+    per_run: dict[tuple[str, str, str], int] = defaultdict(int)
+    for f in missing:
+        if max_bytes is not None and total + f.size > max_bytes:
+            over_budget.append(f)
+            continue
+        if run_max_bytes is not None and per_run[f.run_key] + f.size > run_max_bytes:
+            over_budget.append(f)
+            continue
+        total += f.size
+        per_run[f.run_key] += f.size
+        scheduled.append(f)
+    return scheduled, over_budget
+
+
+class RunTracker:
+    """Calls on_run_ready for each run once its classifier inputs are on disk.
+
+    Runs with a build log are ready as soon as their scheduled classifier
+    inputs are done; runs without one only after all their scheduled files
+    are, since the classifier then falls back to counting artifacts. Runs
+    with nothing left to download are ready right away.
+    """
+
+    def __init__(
+        self,
+        files: list[PlannedFile],
+        scheduled: list[PlannedFile],
+        output_dir: Path,
+        on_run_ready: RunReadyCallback | None,
+    ):
+        self.output_dir = output_dir
+        self.on_run_ready = on_run_ready
+        self._lock = threading.Lock()
+
+        runs_with_log = {
+            f.run_key for f in files
+            if f.run_id and fnmatch.fnmatch(f.relative_path, "*build-log.txt")
+        }
+        self._pending: dict[tuple[str, str, str], int] = {f.run_key: 0 for f in files if f.run_id}
+        self._waits_for = {
+            f for f in scheduled
+            if f.run_id and (f.critical or f.run_key not in runs_with_log)
+        }
+        for f in scheduled:
+            if f in self._waits_for:
+                self._pending[f.run_key] += 1
+
+    def start(self) -> None:
+        """Report the runs that don't wait for any download."""
+        for run_key in sorted(k for k, count in self._pending.items() if count == 0):
+            self._notify(run_key)
+
+    def done(self, f: PlannedFile) -> None:
+        """Record that a scheduled file was downloaded (or failed)."""
+        if f not in self._waits_for:
+            return
+        with self._lock:
+            self._pending[f.run_key] -= 1
+            ready = self._pending[f.run_key] == 0
+        if ready:
+            self._notify(f.run_key)
+
+    def _notify(self, run_key: tuple[str, str, str]) -> None:
+        if self.on_run_ready is not None:
+            pr, job_name, run_id = run_key
+            self.on_run_ready(pr, job_name, run_id, self.output_dir / pr / job_name / run_id)
+
+
+def download_scheduled(
+    pool: TransferPool,
+    scheduled: list[PlannedFile],
+    tracker: RunTracker,
+    compress: str | None = None,
+    compress_level: int | None = None,
+) -> tuple[int, int, int]:
+    """Download the scheduled files in order on the transfer pool.
+
+    If compress is set (e.g. "gzip"), compressible files are streamed
+    straight into compressed files instead of being written uncompressed.
+
+    Per-PR download times (from the first submission to each PR's last
+    file) are recorded in the pool's telemetry.
+
+    Returns: (files_downloaded, bytes_written, files_failed)
+    """
+    # New files make an archived run incomplete again (see archive-logs.py)
+    for pr, job_name, run_id in {f.run_key for f in scheduled if f.run_id}:
+        (tracker.output_dir / pr / job_name / run_id / ARCHIVED_MARKER).unlink(missing_ok=True)
+
+    start = time.monotonic()
+    pr_done: dict[str, float] = {}
+    futures = {
+        pool.submit(
+            download_blob, f.blob, str(f.local_file), compress, compress_level,
+            label=f.blob.name, size=f.size,
+        ): f
+        for f in scheduled
+    }
+    downloaded = 0
+    written = 0
+    failed = 0
+    for future in as_completed(futures):
+        f = futures[future]
+        try:
+            written += future.result()
+            downloaded += 1
+        except Exception:
+            # Reported by the pool's failure report
+            failed += 1
+        tracker.done(f)
+        pr_done[f.pr] = time.monotonic() - start
+    if pool.telemetry is not None:
+        for pr, seconds in pr_done.items():
+            pool.telemetry.pr_timing(pr, "download", seconds)
+    return downloaded, written, failed
+
+
+def select_job_runs(
+    client: storage.Client,
+    bucket_name: str,
+    job_prefix: str,
+    window: RunWindow | None = None,
+) -> tuple[bool, list[str] | None]:
+    """Check whether a job has runs to download.
+
+    Returns: (found, run_ids) where run_ids is None for all runs
+    """
+    if window is None:
+        # Quick check if job exists by listing with max_results=1
+        return bool(list(client.list_blobs(bucket_name, prefix=job_prefix, max_results=1))), None
+    run_ids = window.select_runs(client, bucket_name, job_prefix)
+    return bool(run_ids), run_ids
+
+
+def list_pr(
+    client: storage.Client,
+    bucket_name: str,
+    bucket_prefix: str,
+    pr: str,
+    job_names: list[str],
+    output_dir: Path,
+    exclude_patterns: list[str],
+    window: RunWindow | None = None,
+) -> tuple[str, list[PlannedFile]]:
+    """List the files of all jobs of a PR (only runs within window, if given).
+
+    Returns: (pr, files)
+    """
+    files = []
+    for job_name in job_names:
+        job_prefix = f"{bucket_prefix}/{pr}/{job_name}/"
+        found, run_ids = select_job_runs(client, bucket_name, job_prefix, window)
+        if not found:
+            if window is not None:
+                print(f"PR #{pr}: Skipped - no {job_name} runs in time window")
+            else:
+                print(f"PR #{pr}: Skipped - job {job_name} not found")
+            continue
+
+        job_files = list_pr_job(
+            client, bucket_name, bucket_prefix, pr, job_name, output_dir, exclude_patterns, run_ids,
         )
-        
-        # Count successful downloads
-        success_count = sum(1 for r in results if not isinstance(r, Exception))
-        return (pr, job_name, True, success_count)
-    
-    except Exception as e:
-        print(f"  PR #{pr}: Warning: Failed to download some files for {job_name}: {e}")
+        runs = {f.run_id for f in job_files if f.run_id}
+        missing = [f for f in job_files if not f.present]
+        print(f"PR #{pr}: Found job {job_name}: {len(runs)} run(s), "
+              f"{len(missing)} of {len(job_files)} file(s) to download "
+              f"({format_size(sum(f.size for f in missing))})")
+        files.extend(job_files)
+    return (pr, files)
+
+
+def fetch_blob(blob: storage.Blob, **request_args) -> bytes:
+    """Download a blob into memory."""
+    return blob.download_as_bytes(**request_args)
+
+
+def fetch_pr_job_inputs(
+    client: storage.Client,
+    bucket_name: str,
+    bucket_prefix: str,
+    pr: str,
+    job_name: str,
+    exclude_patterns: list[str],
+    on_run_fetched: RunFetchedCallback,
+    pool: TransferPool,
+    run_ids: list[str] | None = None,
+) -> tuple[str, str, bool, int]:
+    """Fetch the classifier inputs of every run of a PR job (or the given runs) into memory.
+
+    Nothing is written to disk. on_run_fetched is called for each run as
+    soon as all of its inputs have arrived.
+
+    Returns: (pr, job_name, success, file_count)
+    """
+    job_prefix = f"{bucket_prefix}/{pr}/{job_name}/"
+    blobs = [
+        blob for blob in list_job_blobs(client, bucket_name, job_prefix, run_ids)
+        if not should_exclude(blob.name, exclude_patterns)
+    ]
+
+    listings: dict[str, list[str]] = defaultdict(list)
+    inputs: dict[str, list[tuple[storage.Blob, str]]] = defaultdict(list)
+    for blob in blobs:
+        run_id, _, run_relative = blob.name[len(job_prefix):].partition("/")
+        if not run_id.isdigit() or not run_relative:
+            continue
+        listings[run_id].append(run_relative)
+        if is_classifier_input(run_relative):
+            inputs[run_id].append((blob, run_relative))
+
+    if not listings:
         return (pr, job_name, False, 0)
 
+    files: dict[str, dict[str, bytes]] = defaultdict(dict)
+    pending = {run_id: len(inputs[run_id]) for run_id in listings}
+    fetched = 0
+
+    def emit(run_id: str) -> None:
+        on_run_fetched(pr, job_name, run_id, f"{bucket_name}/{job_prefix}{run_id}", files.pop(run_id, {}), listings[run_id])
+
+    # Runs without any classifier input can be handed over right away
+    for run_id in sorted(run_id for run_id, count in pending.items() if count == 0):
+        emit(run_id)
 
-def download_pr(
+    futures = {
+        pool.submit(fetch_blob, blob, label=blob.name, size=blob.size or 0, op="fetch"): (run_id, run_relative)
+        for run_id, run_inputs in inputs.items()
+        for blob, run_relative in run_inputs
+    }
+    for future in as_completed(futures):
+        run_id, run_relative = futures[future]
+        try:
+            files[run_id][run_relative] = future.result()
+            fetched += 1
+        except Exception:
+            # Reported by the pool's failure report; the run is classified without it
+            pass
+        pending[run_id] -= 1
+        if pending[run_id] == 0:
+            emit(run_id)
+
+    return (pr, job_name, True, fetched)
+
+
+def fetch_pr(
     client: storage.Client,
     bucket_name: str,
     bucket_prefix: str,
     pr: str,
     job_names: list[str],
-    output_dir: Path,
     exclude_patterns: list[str],
+    on_run_fetched: RunFetchedCallback,
+    pool: TransferPool,
+    window: RunWindow | None = None,
 ) -> tuple[str, bool]:
-    """Download all jobs for a PR.
-    
+    """Fetch the classifier inputs of all jobs of a PR into memory.
+
+    If window is given, only runs that started within it are fetched.
+
     Returns: (pr, found_any)
     """
     found_any = False
     
     for job_name in job_names:
         job_prefix = f"{bucket_prefix}/{pr}/{job_name}/"
-        
-        # Quick check if job exists by listing with max_results=1
-        blobs = list(client.list_blobs(bucket_name, prefix=job_prefix, max_results=1))
-        
-        if blobs:
-            print(f"PR #{pr}: Found job {job_name}, downloading runs...")
-            _, _, success, file_count = download_pr_job(
-                client, bucket_name, bucket_prefix, pr, job_name, output_dir, exclude_patterns
-            )
-            if success:
-                print(f"  PR #{pr}: Downloaded {file_count} file(s) for {job_name}")
-                found_any = True
-        else:
-            print(f"PR #{pr}: Skipped - job {job_name} not found")
+        found, run_ids = select_job_runs(client, bucket_name, job_prefix, window)
+        if not found:
+            if window is not None:
+                print(f"PR #{pr}: Skipped - no {job_name} runs in time window")
+            else:
+                print(f"PR #{pr}: Skipped - job {job_name} not found")
+            continue
+
+        print(f"PR #{pr}: Found job {job_name}, fetching classifier inputs...")
+        _, _, success, file_count = fetch_pr_job_inputs(
+            client, bucket_name, bucket_prefix, pr, job_name, exclude_patterns, on_run_fetched, pool,
+            run_ids=run_ids,
+        )
+        if success:
+            print(f"  PR #{pr}: Fetched {file_count} file(s) into memory for {job_name}")
+            found_any = True
     
     return (pr, found_any)
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Download CI logs for specific jobs from GCS"
-    )
+def add_download_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the download options (shared with ci-pipeline.py) to a parser."""
     parser.add_argument(
         "output_dir",
         nargs="?",
@@ -175,8 +742,22 @@ def main():
     parser.add_argument(
         "--max-prs",
         type=int,
-        default=MAX_PRS,
-        help=f"Maximum number of PRs to process (default: {MAX_PRS})",
+        default=None,
+        help=f"Maximum number of PRs to process, highest PR numbers first "
+             f"(default: {MAX_PRS}, or no limit with --since/--until)",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_time,
+        default=None,
+        help="Only download runs started at or after this time: ISO date/datetime "
+             "or an age like 24h, 7d (selects by run time instead of PR number)",
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_time,
+        default=None,
+        help="Only download runs started at or before this time (same formats as --since)",
     )
     parser.add_argument(
         "--max-workers",
@@ -195,8 +776,122 @@ def main():
         action="store_true",
         help="Exclude large media files (traces, videos, screenshots, tarballs) to save ~90%% storage",
     )
+    parser.add_argument(
+        "--compress",
+        choices=CODECS,
+        default=None,
+        help="Compress files while downloading (skips already-compressed types, "
+             "makes a separate archive-logs.py pass unnecessary)",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=None,
+        help="Compression level for --compress "
+             f"(default: gzip {DEFAULT_LEVELS['gzip']}, zstd {DEFAULT_LEVELS['zstd']})",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=None,
+        help=f"Maximum blob downloads in flight across all PRs "
+             f"(default: {DOWNLOADS_PER_PR} per --max-workers)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Tune the number of in-flight downloads at runtime between --min-inflight "
+             "and --max-inflight, backing off on 429/503 responses",
+    )
+    parser.add_argument(
+        "--min-inflight",
+        type=int,
+        default=MIN_WORKERS,
+        help=f"Lower bound for --adaptive (default: {MIN_WORKERS})",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE,
+        help=f"Give up on a file after this many seconds, plus one per {DEADLINE_MIN_THROUGHPUT // 1024} KB of its size, "
+             f"including retries (default: {DEFAULT_DEADLINE:g})",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request for files still downloading past the p95 "
+             "latency of similar-sized files; the first response wins",
+    )
+    parser.add_argument(
+        "--failure-report",
+        metavar="FILE",
+        default=None,
+        help="Write one JSON line per file that failed to download to FILE",
+    )
+    add_listing_cache_arguments(parser)
+    add_telemetry_arguments(parser)
+    parser.add_argument(
+        "--max-bytes",
+        type=parse_size,
+        default=None,
+        help="Stop scheduling downloads once this many bytes are planned, e.g. 20G "
+             "(classifier inputs of all runs are scheduled first)",
+    )
+    parser.add_argument(
+        "--run-max-bytes",
+        type=parse_size,
+        default=None,
+        help="Byte budget per run, e.g. 200M (skips the largest artifacts of big runs)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List what would be downloaded and print a size estimate without downloading",
+    )
+
+
+def print_estimate(files: list[PlannedFile], scheduled: list[PlannedFile], over_budget: list[PlannedFile]) -> None:
+    """Print how many files and bytes a sync would download."""
+    present = [f for f in files if f.present]
+    inputs = [f for f in scheduled if f.critical]
+    others = [f for f in scheduled if not f.critical]
+    runs = {f.run_key for f in files if f.run_id}
+    print(f"Runs: {len(runs)}")
+    print(f"Already downloaded: {len(present)} file(s), {format_size(sum(f.size for f in present))}")
+    print(f"Classifier inputs to download: {len(inputs)} file(s), {format_size(sum(f.size for f in inputs))}")
+    print(f"Other artifacts to download: {len(others)} file(s), {format_size(sum(f.size for f in others))}")
+    if over_budget:
+        print(f"Over budget (skipped): {len(over_budget)} file(s), {format_size(sum(f.size for f in over_budget))}")
+    print(f"Total to download: {len(scheduled)} file(s), {format_size(sum(f.size for f in scheduled))}")
 
-    args = parser.parse_args()
+
+def run_downloads(
+    args: argparse.Namespace,
+    on_run_ready: RunReadyCallback | None = None,
+    on_run_fetched: RunFetchedCallback | None = None,
+) -> tuple[int, int]:
+    """Download logs for all selected PRs as configured by add_download_arguments.
+
+    All PRs are listed first, then the missing files are downloaded in the
+    order chosen by schedule_downloads (classifier inputs of every run
+    first, small files first), within the --max-bytes/--run-max-bytes
+    budgets. With --dry-run, only the size estimate is printed.
+
+    on_run_ready is called once per run whose classifier inputs are on
+    disk. If on_run_fetched is given instead,
+    nothing is written to disk: each run's classifier inputs are fetched
+    into memory and passed to it.
+
+    Returns: (prs_downloaded, prs_skipped)
+    """
+    if args.compress:
+        if not codec_available(args.compress):
+            print(f"Error: {codec_install_hint(args.compress)}")
+            sys.exit(1)
+        low, high = LEVEL_RANGES[args.compress]
+        if args.compress_level is not None and not low <= args.compress_level <= high:
+            print(f"Error: --compress-level for {args.compress} must be between {low} and {high}")
+            sys.exit(1)
 
     # Build exclude patterns
     exclude_patterns = EXCLUDE_PATTERNS.copy()
@@ -206,18 +901,37 @@ def main():
     output_dir = Path(args.output_dir)
     
     print(f"Downloading logs for jobs: {', '.join(args.job_names)}")
-    print(f"Output directory: {output_dir}")
+    if on_run_fetched is not None:
+        print("Fetching classifier inputs into memory (nothing is written to disk)")
+    else:
+        print(f"Output directory: {output_dir}")
+        if args.compress:
+            level = args.compress_level or DEFAULT_LEVELS[args.compress]
+            print(f"Compressing on download: {args.compress} (level {level})")
     print("-" * 40)
     
     # Create output directory
-    output_dir.mkdir(parents=True, exist_ok=True)
+    if on_run_fetched is None and not args.dry_run:
+        output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Initialize storage client (anonymous for public bucket)
-    client = storage.Client.create_anonymous_client()
+    # Initialize storage client (anonymous for public bucket); listings go
+    # through the persistent listing cache
+    telemetry = Telemetry(keep_events=args.telemetry is not None and args.telemetry_format == "jsonl")
+    cache = open_listing_cache(args, telemetry)
+    client = CachingClient(storage.Client.create_anonymous_client(), cache)
     
+    # Select runs by time window, or the most recent PRs by number
+    window = None
+    max_prs = args.max_prs
+    if args.since is not None or args.until is not None:
+        window = RunWindow(args.since, args.until, telemetry)
+        print(f"Selecting runs started within {window.describe()}")
+    elif max_prs is None:
+        max_prs = MAX_PRS
+
     # List PRs
     print("Fetching list of PRs...")
-    pr_list = list_prs(client, BUCKET_NAME, BUCKET_PREFIX, args.max_prs)
+    pr_list = list_prs(client, BUCKET_NAME, BUCKET_PREFIX, max_prs)
     
     if not pr_list:
         print("No PRs found or unable to access bucket")
@@ -229,43 +943,130 @@ def main():
     downloaded = 0
     skipped = 0
     
-    # Process PRs in parallel
-    print(f"Running downloads in parallel (max {args.max_workers} jobs)...")
-    
+    # All workers share one pool of blob transfers
+    max_inflight = args.max_inflight or DOWNLOADS_PER_PR * args.max_workers
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveConcurrency(min_limit=args.min_inflight, max_limit=max_inflight)
+    pool = TransferPool(max_inflight, controller, deadline=args.deadline, hedge=args.hedge, telemetry=telemetry)
+    telemetry.gauge("queue_depth", lambda: pool.queued)
+    telemetry.gauge("in_flight", lambda: pool.in_flight)
+    telemetry.start()
+
+    def timed(phase: str, pr: str, fn, *fn_args):
+        start = time.monotonic()
+        try:
+            return fn(*fn_args)
+        finally:
+            telemetry.pr_timing(pr, phase, time.monotonic() - start)
+
+    # List (or, in memory mode, fetch) PRs in parallel
+    print(f"Processing PRs in parallel (max {args.max_workers} jobs)...")
+    files: list[PlannedFile] = []
     with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-        futures = {
-            executor.submit(
-                download_pr,
-                client,
-                BUCKET_NAME,
-                BUCKET_PREFIX,
-                pr,
-                args.job_names,
-                output_dir,
-                exclude_patterns,
-            ): pr
-            for pr in pr_list
-        }
+        if on_run_fetched is not None:
+            futures = {
+                executor.submit(
+                    timed, "fetch", pr, fetch_pr, client, BUCKET_NAME, BUCKET_PREFIX, pr, args.job_names,
+                    exclude_patterns, on_run_fetched, pool, window,
+                ): pr
+                for pr in pr_list
+            }
+        else:
+            futures = {
+                executor.submit(
+                    timed, "list", pr, list_pr, client, BUCKET_NAME, BUCKET_PREFIX, pr, args.job_names,
+                    output_dir, exclude_patterns, window,
+                ): pr
+                for pr in pr_list
+            }
         
         for future in as_completed(futures):
             pr = futures[future]
             try:
-                _, found_any = future.result()
-                if found_any:
+                _, result = future.result()
+                if on_run_fetched is None:
+                    files.extend(result)
+                if result:
                     downloaded += 1
                 else:
                     skipped += 1
             except Exception as e:
                 print(f"PR #{pr}: Error processing: {e}")
                 skipped += 1
+
+    if on_run_fetched is None:
+        scheduled, over_budget = schedule_downloads(files, args.max_bytes, args.run_max_bytes)
+        print("-" * 40)
+        print_estimate(files, scheduled, over_budget)
+        if not args.dry_run:
+            if controller is not None:
+                print(f"Adaptive concurrency: {controller.min_limit}-{controller.max_limit} downloads in flight")
+            else:
+                print(f"Downloading with up to {max_inflight} downloads in flight...")
+            tracker = RunTracker(files, scheduled, output_dir, on_run_ready)
+            tracker.start()
+            file_count, written, failed = download_scheduled(
+                pool, scheduled, tracker, args.compress, args.compress_level,
+            )
+            print(f"Downloaded {file_count} file(s) ({format_size(written)} on disk), {failed} failed")
+    pool.shutdown()
+    telemetry.stop()
     
     print("-" * 40)
-    print("Complete!")
+    print("Complete!" if not args.dry_run else "Dry run complete, nothing downloaded")
     print(f"PRs with job downloaded: {downloaded}")
     print(f"PRs without this job: {skipped}")
-    print(f"Logs saved to: {output_dir}")
+    if window is not None:
+        print(f"started.json reads to locate the time window: {window.started_reads}")
+    if controller is not None:
+        print(controller.summary())
+    print(cache.summary())
+    cache.close()
+    print(pool.summary())
+    print_failure_report(pool.failures)
+    if args.failure_report:
+        write_failure_report(pool.failures, args.failure_report)
+        print(f"Failure report written to: {args.failure_report}")
+    print("-" * 40)
+    telemetry.print_summary()
+    if args.telemetry:
+        telemetry.write(args.telemetry, args.telemetry_format)
+        print(f"Telemetry written to: {args.telemetry}")
+    if on_run_fetched is None and not args.dry_run:
+        print(f"Logs saved to: {output_dir}")
+
+    return downloaded, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download CI logs for specific jobs from GCS"
+    )
+    add_download_arguments(parser)
+    parser.add_argument(
+        "--run-events",
+        metavar="FILE",
+        default=None,
+        help="Append a JSON line to FILE for each run as soon as its classifier inputs are downloaded",
+    )
+
+    args = parser.parse_args()
+
+    if not args.run_events:
+        run_downloads(args)
+        return
+
+    lock = threading.Lock()
+    with open(args.run_events, "a") as events_file:
+        def write_event(pr: str, job_name: str, run_id: str, run_path: Path) -> None:
+            event = {"pr": pr, "job_name": job_name, "run_id": run_id, "run_path": str(run_path)}
+            with lock:
+                events_file.write(json.dumps(event) + "\n")
+                events_file.flush()
+
+        run_downloads(args, on_run_ready=write_event)
 
 
 if __name__ == "__main__":
     main()
-
@@ -2,28 +2,49 @@
 """
 Script to download junit-results.xml files for a specific job from GCS.
 
-Usage: python download-junit-reports.py [output_directory] [max_workers]
+Each PR is listed once (in parallel), filtered server-side to the junit
+files of all its runs, and only files that aren't on disk yet are
+downloaded, so new runs on old PRs are picked up too.
+
+Usage: python download-junit-reports.py [output_directory] [max_workers] [--adaptive]
 """
 
 import argparse
-import os
+import fnmatch
 import sys
+import time
+import uuid
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from google.cloud import storage
 
+from download_telemetry import Telemetry, add_telemetry_arguments
+from gcs_transfer import (
+    DEADLINE_MIN_THROUGHPUT,
+    DEFAULT_DEADLINE,
+    MIN_WORKERS,
+    AdaptiveConcurrency,
+    TransferPool,
+    commit_file,
+    print_failure_report,
+    write_failure_report,
+)
+from listing_cache import CachingClient, add_listing_cache_arguments, open_listing_cache
+from log_codecs import ARCHIVED_MARKER
+from run_bundle import bundled_files
+from run_retention import TIER_RESULTS_ONLY, retention_tier
+
 
 # Configuration
 BUCKET_NAME = "test-platform-results"
 PREFIX = "pr-logs/pull/redhat-developer_rhdh"
 JOB_NAME = "pull-ci-redhat-developer-rhdh-main-e2e-ocp-helm"
 
-# Known paths to junit-results.xml files (relative to run directory)
-JUNIT_PATHS = [
-    "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/artifacts/showcase/junit-results.xml",
-    "artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/artifacts/showcase-rbac/junit-results.xml",
-]
+# junit-results.xml files of all test suites (relative to the job directory,
+# the first component is the run ID). Uses GCS matchGlob syntax: * doesn't
+# cross "/".
+JUNIT_GLOB = "*/artifacts/e2e-ocp-helm/redhat-developer-rhdh-ocp-helm/artifacts/*/junit-results.xml"
 
 
 def list_pr_directories(client: storage.Client, bucket_name: str, prefix: str) -> list[str]:
@@ -51,53 +72,39 @@ def list_pr_directories(client: storage.Client, bucket_name: str, prefix: str) -
     return [str(pr) for pr in pr_numbers]
 
 
-def list_run_ids(client: storage.Client, bucket_name: str, pr: str) -> list[str]:
-    """List all run IDs for a PR/job combination."""
+def list_junit_blobs(client: storage.Client, bucket_name: str, pr: str) -> list[storage.Blob]:
+    """List the junit-results.xml files of all runs of a PR/job in one listing."""
     job_prefix = f"{PREFIX}/{pr}/{JOB_NAME}/"
-    
-    blobs = client.list_blobs(bucket_name, prefix=job_prefix, delimiter="/")
-    
-    # Consume iterator to populate prefixes
-    list(blobs)
-    
-    run_ids = []
-    for run_prefix in blobs.prefixes:
-        # run_prefix looks like: ".../1999164066400047104/"
-        run_id = run_prefix.rstrip("/").split("/")[-1]
-        run_ids.append(run_id)
-    
-    return run_ids
+    blobs = client.list_blobs(bucket_name, prefix=job_prefix, match_glob=job_prefix + JUNIT_GLOB)
+    # matchGlob is applied server-side; filter again in case a server ignores it
+    return [
+        blob for blob in blobs
+        if fnmatch.fnmatchcase(blob.name[len(job_prefix):], JUNIT_GLOB)
+    ]
 
 
-def download_file(
-    client: storage.Client,
-    bucket_name: str,
-    blob_path: str,
-    local_path: Path,
-) -> tuple[str, bool, str | None]:
+def download_file(blob: storage.Blob, local_path: Path, **request_args) -> int:
     """
     Download a single file from GCS.
     
+    The file is written to a temporary name and renamed into place with
+    commit_file(), so an interrupted download never leaves a truncated
+    file, a hedged duplicate request can't interleave with the original
+    and an attempt past its deadline doesn't write the file.
+    request_args (retry, timeout) are passed to the storage client.
+    
     Returns:
-        Tuple of (blob_path, success, error_message)
+        Number of bytes downloaded
     """
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = local_path.with_name(f"{local_path.name}.{uuid.uuid4().hex[:8]}.part")
     try:
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_path)
-        
-        # Check if blob exists
-        if not blob.exists():
-            return (blob_path, False, "Not found")
-        
-        # Create local directory if needed
-        local_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Download the file
-        blob.download_to_filename(str(local_path))
-        return (blob_path, True, None)
-        
-    except Exception as e:
-        return (blob_path, False, str(e))
+        blob.download_to_filename(str(tmp_path), **request_args)
+        commit_file(tmp_path, local_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return local_path.stat().st_size
 
 
 def main():
@@ -117,6 +124,38 @@ def main():
         default=10,
         help="Maximum parallel downloads (default: 10)",
     )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Tune the number of parallel downloads at runtime between --min-workers "
+             "and max_workers, backing off on 429/503 responses",
+    )
+    parser.add_argument(
+        "--min-workers",
+        type=int,
+        default=MIN_WORKERS,
+        help=f"Lower bound for --adaptive (default: {MIN_WORKERS})",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE,
+        help=f"Give up on a file after this many seconds, plus one per {DEADLINE_MIN_THROUGHPUT // 1024} KB of its size, "
+             f"including retries (default: {DEFAULT_DEADLINE:g})",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request for files still downloading past the p95 latency; the first response wins",
+    )
+    parser.add_argument(
+        "--failure-report",
+        metavar="FILE",
+        default=None,
+        help="Write one JSON line per file that failed to download to FILE",
+    )
+    add_listing_cache_arguments(parser)
+    add_telemetry_arguments(parser)
     args = parser.parse_args()
     
     output_dir = Path(args.output_dir)
@@ -124,14 +163,20 @@ def main():
     
     print(f"Downloading junit reports for job: {JOB_NAME}")
     print(f"Output directory: {output_dir}")
-    print(f"Max parallel downloads: {max_workers}")
+    if args.adaptive:
+        print(f"Parallel downloads: adaptive, {args.min_workers}-{max_workers}")
+    else:
+        print(f"Max parallel downloads: {max_workers}")
     print("-" * 40)
     
     # Create output directory
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Initialize GCS client (anonymous for public bucket)
-    client = storage.Client.create_anonymous_client()
+    # Initialize GCS client (anonymous for public bucket); listings go
+    # through the persistent listing cache
+    telemetry = Telemetry(keep_events=args.telemetry is not None and args.telemetry_format == "jsonl")
+    cache = open_listing_cache(args, telemetry)
+    client = CachingClient(storage.Client.create_anonymous_client(), cache)
     
     # List all PR directories
     print("Fetching list of PRs...")
@@ -147,73 +192,120 @@ def main():
     # Statistics
     downloaded = 0
     skipped = 0
-    already_exists = 0
-    
-    # Collect all download tasks
-    download_tasks: list[tuple[str, Path, str]] = []  # (blob_path, local_path, label)
-    
-    for pr in pr_list:
-        local_pr_path = output_dir / pr
-        
-        # Skip if PR directory already exists locally
-        if local_pr_path.exists():
-            print(f"PR #{pr}: Already exists locally, skipping...")
-            already_exists += 1
-            continue
-        
-        # List run IDs for this PR/job
-        run_ids = list_run_ids(client, BUCKET_NAME, pr)
-        
-        if run_ids:
-            print(f"PR #{pr}: Found job, queueing junit files...")
-            downloaded += 1
+    up_to_date = 0
+    up_to_date_runs = 0
+    downloaded_count = 0
+    failed_count = 0
+    
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveConcurrency(min_limit=args.min_workers, max_limit=max_workers)
+    pool = TransferPool(max_workers, controller, deadline=args.deadline, hedge=args.hedge, telemetry=telemetry)
+    telemetry.gauge("queue_depth", lambda: pool.queued)
+    telemetry.gauge("in_flight", lambda: pool.in_flight)
+    telemetry.start()
+    
+    def list_pr(pr: str) -> list[storage.Blob]:
+        start = time.monotonic()
+        try:
+            return list_junit_blobs(client, BUCKET_NAME, pr)
+        finally:
+            telemetry.pr_timing(pr, "list", time.monotonic() - start)
+    
+    # List PRs in parallel and queue each PR's missing files as soon as its
+    # listing arrives
+    print(f"Listing {len(pr_list)} PRs with {max_workers} workers...")
+    download_futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list_futures = {
+            executor.submit(list_pr, pr): pr
+            for pr in pr_list
+        }
+        for future in as_completed(list_futures):
+            pr = list_futures[future]
+            try:
+                blobs = future.result()
+            except Exception as e:
+                print(f"PR #{pr}: Error listing: {e}")
+                skipped += 1
+                continue
             
-            for run_id in run_ids:
-                for junit_path in JUNIT_PATHS:
-                    blob_path = f"{PREFIX}/{pr}/{JOB_NAME}/{run_id}/{junit_path}"
-                    local_path = output_dir / pr / JOB_NAME / run_id / junit_path
-                    label = f"{pr}/{run_id}/{Path(junit_path).name}"
-                    
-                    download_tasks.append((blob_path, local_path, label))
-        else:
-            skipped += 1
-    
-    # Execute downloads in parallel
-    if download_tasks:
-        print(f"\nStarting {len(download_tasks)} downloads with {max_workers} workers...")
-        
-        downloaded_count = 0
-        failed_count = 0
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            futures = {
-                executor.submit(
-                    download_file, client, BUCKET_NAME, blob_path, local_path
-                ): label
-                for blob_path, local_path, label in download_tasks
-            }
+            if not blobs:
+                skipped += 1
+                continue
             
-            # Process results as they complete
-            for future in as_completed(futures):
-                label = futures[future]
-                blob_path, success, error = future.result()
-                
-                if success:
-                    print(f"  Downloaded: {label}")
-                    downloaded_count += 1
-                else:
-                    # Only print non-"not found" errors (files might not exist)
-                    if error != "Not found":
-                        print(f"  Failed: {label} - {error}")
-                    failed_count += 1
-        
-        print(f"\nDownloaded {downloaded_count} files, {failed_count} not found/failed")
+            job_prefix = f"{PREFIX}/{pr}/{JOB_NAME}/"
+            missing = []
+            runs = set()
+            missing_runs = set()
+            bundled: dict[str, set[str]] = {}  # run ID -> files packed by archive-logs.py --bundle
+            retired = set()  # runs retain-logs.py reduced to their stored result
+            for blob in blobs:
+                relative_path = blob.name[len(job_prefix):]
+                run_id, _, run_relative = relative_path.partition("/")
+                runs.add(run_id)
+                local_path = output_dir / pr / JOB_NAME / relative_path
+                if local_path.exists():
+                    continue
+                if run_id not in bundled:
+                    run_dir = output_dir / pr / JOB_NAME / run_id
+                    bundled[run_id] = bundled_files(run_dir)
+                    if retention_tier(run_dir) >= TIER_RESULTS_ONLY:
+                        retired.add(run_id)
+                if run_id in retired or run_relative in bundled[run_id]:
+                    continue
+                missing.append((blob, local_path, f"{pr}/{run_id}/{Path(relative_path).parent.name}"))
+                missing_runs.add(run_id)
+            up_to_date_runs += len(runs - missing_runs)
+            
+            if not missing:
+                up_to_date += 1
+                continue
+            
+            print(f"PR #{pr}: Queueing {len(missing)} junit file(s) from {len(missing_runs)} "
+                  f"of {len(runs)} run(s)...")
+            downloaded += 1
+            # New files make an archived run incomplete again (see archive-logs.py)
+            for run_id in missing_runs:
+                (output_dir / pr / JOB_NAME / run_id / ARCHIVED_MARKER).unlink(missing_ok=True)
+            for blob, local_path, label in missing:
+                download_futures[
+                    pool.submit(download_file, blob, local_path, label=blob.name, size=blob.size or 0)
+                ] = label
+    
+    # Process results as they complete
+    for future in as_completed(download_futures):
+        label = download_futures[future]
+        try:
+            future.result()
+            print(f"  Downloaded: {label}")
+            downloaded_count += 1
+        except Exception:
+            # Reported by the pool's failure report
+            failed_count += 1
+    pool.shutdown()
+    telemetry.stop()
+    
+    print(f"\nDownloaded {downloaded_count} files, {failed_count} failed")
+    if controller is not None:
+        print(controller.summary())
+    print(cache.summary())
+    cache.close()
+    print(pool.summary())
+    print_failure_report(pool.failures)
+    if args.failure_report:
+        write_failure_report(pool.failures, args.failure_report)
+        print(f"Failure report written to: {args.failure_report}")
+    print("-" * 40)
+    telemetry.print_summary()
+    if args.telemetry:
+        telemetry.write(args.telemetry, args.telemetry_format)
+        print(f"Telemetry written to: {args.telemetry}")
     
     print("-" * 40)
     print("Complete!")
-    print(f"PRs downloaded: {downloaded}")
-    print(f"PRs already existed locally: {already_exists}")
+    print(f"PRs with new junit files: {downloaded}")
+    print(f"PRs already up to date: {up_to_date} ({up_to_date_runs} run(s) skipped)")
     print(f"PRs without this job: {skipped}")
     print(f"Logs saved to: {output_dir}")
 
@@ -0,0 +1,247 @@
+"""Telemetry for the GCS downloaders.
+
+Records per-request latencies by operation (list, download, fetch, ...)
+in histograms, bytes/s, queue depth and in-flight requests sampled over
+time, retries, and per-PR timings. At exit it prints a summary table and
+can write everything as JSON lines or in the OpenMetrics text format, to
+tell whether a slow sync was bound by listing, GCS latency, bandwidth or
+local disk.
+"""
+
+import argparse
+import json
+import math
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+SAMPLE_INTERVAL = 1.0
+TELEMETRY_FORMATS = ["jsonl", "openmetrics"]
+
+
+class OperationStats:
+    """Latency histogram and counters for one operation."""
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+        # Kept for exact percentiles in the summary
+        self.latencies: list[float] = []
+
+    def observe(self, seconds: float, nbytes: int, error: bool) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.total_bytes += nbytes
+        self.latencies.append(seconds)
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Telemetry:
+    """Thread-safe collector; see the module docstring.
+
+    Call start() to begin sampling the timeline and stop() at the end.
+    Gauges are callables sampled every SAMPLE_INTERVAL seconds (e.g. the
+    transfer pool's queue depth).
+    """
+
+    def __init__(self, keep_events: bool = False):
+        self.keep_events = keep_events
+        self.operations: dict[str, OperationStats] = defaultdict(OperationStats)
+        self.counters: dict[str, int] = defaultdict(int)
+        self.pr_timings: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.timeline: list[dict] = []
+        self.events: list[dict] = []
+        self._gauges: dict[str, Callable[[], int]] = {}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._sampled_bytes = 0
+
+    def observe(self, op: str, seconds: float, nbytes: int = 0, error: bool = False, label: str | None = None) -> None:
+        """Record one request."""
+        with self._lock:
+            self.operations[op].observe(seconds, nbytes, error)
+            if self.keep_events:
+                self.events.append({
+                    "type": "request",
+                    "t": round(time.monotonic() - self._start, 3),
+                    "op": op,
+                    "seconds": round(seconds, 4),
+                    "bytes": nbytes,
+                    "error": error,
+                    "object": label,
+                })
+
+    def retry(self, op: str) -> None:
+        """Record a retried request."""
+        with self._lock:
+            self.operations[op].retries += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increment a named counter (e.g. listing cache hits)."""
+        with self._lock:
+            self.counters[name] += amount
+
+    def pr_timing(self, pr: str, phase: str, seconds: float) -> None:
+        """Add time spent on a PR in a phase (list, download, ...)."""
+        with self._lock:
+            self.pr_timings[pr][phase] += seconds
+
+    def gauge(self, name: str, read: Callable[[], int]) -> None:
+        """Register a gauge sampled on the timeline."""
+        self._gauges[name] = read
+
+    def _sample(self) -> None:
+        with self._lock:
+            total_bytes = sum(stats.total_bytes for stats in self.operations.values())
+            requests = sum(stats.count for stats in self.operations.values())
+        sample = {
+            "type": "sample",
+            "t": round(time.monotonic() - self._start, 3),
+            "bytes_per_s": round((total_bytes - self._sampled_bytes) / SAMPLE_INTERVAL),
+            "requests": requests,
+        }
+        self._sampled_bytes = total_bytes
+        for name, read in self._gauges.items():
+            sample[name] = read()
+        self.timeline.append(sample)
+
+    def _run_sampler(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def start(self) -> None:
+        self._sampler = threading.Thread(target=self._run_sampler, daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+            self._sample()
+
+    def print_summary(self) -> None:
+        """Print per-operation latencies, the throughput timeline and the slowest PRs."""
+        elapsed = time.monotonic() - self._start
+        print(f"{'Operation':<14} {'Count':>7} {'Errors':>6} {'Retries':>7} {'p50 ms':>8} "
+              f"{'p95 ms':>8} {'p99 ms':>8} {'Max ms':>8} {'MB':>8}")
+        for op, stats in sorted(self.operations.items()):
+            print(f"{op:<14} {stats.count:>7} {stats.errors:>6} {stats.retries:>7} "
+                  f"{stats.percentile(0.5) * 1000:>8.1f} {stats.percentile(0.95) * 1000:>8.1f} "
+                  f"{stats.percentile(0.99) * 1000:>8.1f} {max(stats.latencies, default=0) * 1000:>8.1f} "
+                  f"{stats.total_bytes / 1e6:>8.1f}")
+        for name, value in sorted(self.counters.items()):
+            print(f"{name}: {value}")
+
+        if self.timeline:
+            rates = [sample["bytes_per_s"] for sample in self.timeline]
+            total_bytes = sum(stats.total_bytes for stats in self.operations.values())
+            print(f"Throughput: {total_bytes / 1e6 / elapsed:.1f} MB/s average, "
+                  f"{max(rates) / 1e6:.1f} MB/s peak over {elapsed:.1f}s")
+            for name in self._gauges:
+                values = [sample[name] for sample in self.timeline]
+                print(f"{name}: {statistics.mean(values):.1f} average, {max(values)} max")
+
+        if self.pr_timings:
+            slowest = sorted(self.pr_timings.items(), key=lambda item: -sum(item[1].values()))[:5]
+            print("Slowest PRs: " + ", ".join(
+                f"#{pr} (" + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in phases.items()) + ")"
+                for pr, phases in slowest
+            ))
+
+    def write_jsonl(self, path: str) -> None:
+        """Write requests (if kept), timeline samples, per-PR timings and histograms as JSON lines."""
+        with open(path, "w") as f:
+            for record in sorted(self.events + self.timeline, key=lambda record: record["t"]):
+                f.write(json.dumps(record) + "\n")
+            for pr, phases in sorted(self.pr_timings.items()):
+                f.write(json.dumps({"type": "pr", "pr": pr, **{k: round(v, 3) for k, v in phases.items()}}) + "\n")
+            for op, stats in sorted(self.operations.items()):
+                f.write(json.dumps({
+                    "type": "histogram",
+                    "op": op,
+                    "buckets": {str(bound): n for bound, n in zip(LATENCY_BUCKETS, stats.buckets)},
+                    "count": stats.count,
+                    "sum_seconds": round(stats.total_seconds, 4),
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "bytes": stats.total_bytes,
+                }) + "\n")
+            for name, value in sorted(self.counters.items()):
+                f.write(json.dumps({"type": "counter", "name": name, "value": value}) + "\n")
+
+    def write_openmetrics(self, path: str) -> None:
+        """Write the final histograms, counters and gauge maxima in OpenMetrics text format."""
+        lines = [
+            "# TYPE gcs_request_duration_seconds histogram",
+            "# UNIT gcs_request_duration_seconds seconds",
+            "# HELP gcs_request_duration_seconds GCS request latency by operation.",
+        ]
+        for op, stats in sorted(self.operations.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'gcs_request_duration_seconds_bucket{{op="{op}",le="{le}"}} {cumulative}')
+            lines.append(f'gcs_request_duration_seconds_count{{op="{op}"}} {stats.count}')
+            lines.append(f'gcs_request_duration_seconds_sum{{op="{op}"}} {stats.total_seconds:.4f}')
+        for name, attr in (("errors", "errors"), ("retries", "retries"), ("bytes", "total_bytes")):
+            lines.append(f"# TYPE gcs_request_{name} counter")
+            for op, stats in sorted(self.operations.items()):
+                lines.append(f'gcs_request_{name}_total{{op="{op}"}} {getattr(stats, attr)}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}_total {value}")
+        for name in self._gauges:
+            lines.append(f"# TYPE {name}_max gauge")
+            lines.append(f"{name}_max {max((sample[name] for sample in self.timeline), default=0)}")
+        lines.append("# TYPE pr_phase_seconds gauge")
+        for pr, phases in sorted(self.pr_timings.items()):
+            for phase, seconds in sorted(phases.items()):
+                lines.append(f'pr_phase_seconds{{pr="{pr}",phase="{phase}"}} {seconds:.3f}')
+        lines.append("# EOF")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write(self, path: str, fmt: str) -> None:
+        if fmt == "openmetrics":
+            self.write_openmetrics(path)
+        else:
+            self.write_jsonl(path)
+
+
+def add_telemetry_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the telemetry options shared by the downloaders."""
+    parser.add_argument(
+        "--telemetry",
+        metavar="FILE",
+        default=None,
+        help="Write request latencies, throughput timeline, queue depth and per-PR timings to FILE",
+    )
+    parser.add_argument(
+        "--telemetry-format",
+        choices=TELEMETRY_FORMATS,
+        default="jsonl",
+        help="Format for --telemetry: JSON lines with every request, or an OpenMetrics snapshot (default: jsonl)",
+    )
@@ -1,67 +1,201 @@
 #!/usr/bin/env python3
-"""Extract all gzipped build-log.txt files, overwriting with decompressed content."""
-
-import gzip
+"""Extract compressed log files in place, overwriting them with decompressed content.
+
+Compressed files are detected by their magic bytes (gzip, or zstd as
+written by archive-logs.py --codec zstd), not by extension. Files are
+decompressed in parallel on a process pool, streamed in chunks into a
+temporary file that atomically replaces the original, so an interrupted
+run never leaves a truncated log. Path, glob and run filters limit the
+extraction to the runs being debugged.
+"""
+
+import argparse
+import fnmatch
 import os
-import subprocess
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from log_codecs import ARCHIVED_MARKER, detect_file_codec, open_decompressed
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_GLOBS = ["*.txt"]
 
 
-def find_gzipped_txt_files(directory: str) -> list[str]:
-    """Find all .txt files that are actually gzip compressed."""
-    gzipped_files = []
+def matches_filters(relative_path: str, globs: list[str], runs: set[str]) -> bool:
+    """Check a path (relative to the scanned directory) against the glob and run filters.
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            if filename.endswith(".txt"):
+    A glob matches either the file name or the whole relative path; a run
+    filter matches any directory in the path (e.g. a run ID or PR number).
+    """
+    parts = relative_path.split(os.sep)
+    if runs and not runs.intersection(parts[:-1]):
+        return False
+    return any(fnmatch.fnmatch(parts[-1], glob) or fnmatch.fnmatch(relative_path, glob) for glob in globs)
+
+
+def find_compressed_files(paths: list[str], globs: list[str], runs: set[str]) -> list[str]:
+    """Find compressed files below the given directories (or the given files) matching the filters."""
+    candidates = []
+    for path in paths:
+        if os.path.isfile(path):
+            candidates.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]  # dictionaries, object store
+            for filename in files:
+                if filename.startswith(".") or filename.endswith(".part"):
+                    continue  # bookkeeping or a download/compression in progress
                 filepath = os.path.join(root, filename)
-                try:
-                    result = subprocess.run(
-                        ["file", filepath],
-                        capture_output=True,
-                        text=True,
-                        check=True,
-                    )
-                    if "gzip" in result.stdout.lower():
-                        gzipped_files.append(filepath)
-                except subprocess.CalledProcessError:
-                    continue
-
-    return gzipped_files
-
-
-def extract_gzipped_file(filepath: str) -> bool:
-    """Extract a gzipped file, overwriting with decompressed content."""
+                if matches_filters(os.path.relpath(filepath, path), globs, runs):
+                    candidates.append(filepath)
+
+    return [filepath for filepath in candidates if detect_file_codec(filepath) is not None]
+
+
+def extract_file(filepath: str) -> tuple[bool, int, int, str | None]:
+    """
+    Decompress a file in place, keeping its name, mode and modification time.
+
+    Returns:
+        tuple of (success, compressed_size, extracted_size, error_message)
+    """
+    tmp_path = f"{filepath}.{os.getpid()}.part"
     try:
-        with gzip.open(filepath, "rb") as f:
-            decompressed_data = f.read()
+        compressed_size = os.path.getsize(filepath)
 
-        with open(filepath, "wb") as f:
-            f.write(decompressed_data)
+        with open_decompressed(filepath) as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        shutil.copystat(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
 
-        return True
+        return True, compressed_size, os.path.getsize(filepath), None
     except Exception as e:
-        print(f"Error extracting {filepath}: {e}")
-        return False
+        return False, 0, 0, str(e)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def clear_archived_markers(filepaths: list[str], roots: list[str]) -> int:
+    """Remove archive-logs.py's archived marker from the runs containing the given files.
+
+    Returns: number of markers removed
+    """
+    stop = {os.path.abspath(root) for root in roots}
+    seen = set()
+    removed = 0
+    for filepath in filepaths:
+        directory = os.path.dirname(os.path.abspath(filepath))
+        while directory not in seen:
+            seen.add(directory)
+            marker = os.path.join(directory, ARCHIVED_MARKER)
+            if os.path.exists(marker):
+                os.remove(marker)
+                removed += 1
+            parent = os.path.dirname(directory)
+            if directory in stop or parent == directory:
+                break
+            directory = parent
+    return removed
+
+
+def format_size(size_bytes: int) -> str:
+    """Format bytes as human-readable string."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} TB"
 
 
 def main():
-    directory = "ci-logs"
-
-    print(f"Scanning {directory} for gzipped .txt files...")
-    gzipped_files = find_gzipped_txt_files(directory)
-    print(f"Found {len(gzipped_files)} gzipped .txt files")
+    parser = argparse.ArgumentParser(
+        description="Extract compressed log files in place."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["ci-logs"],
+        help="Directories (e.g. a PR or run directory) or files to extract (default: ci-logs)",
+    )
+    parser.add_argument(
+        "--glob",
+        "-g",
+        action="append",
+        default=None,
+        help="Only extract files whose name or relative path matches (repeatable; default: *.txt, "
+             "use '*' for all files)",
+    )
+    parser.add_argument(
+        "--run",
+        "-r",
+        action="append",
+        default=[],
+        help="Only extract files below a directory with this name, e.g. a run ID or PR number (repeatable)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        "-n",
+        action="store_true",
+        help="Show what would be extracted without actually extracting",
+    )
+    parser.add_argument(
+        "--workers",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel extraction processes (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"Error: {path} does not exist")
+            sys.exit(1)
+    globs = args.glob or DEFAULT_GLOBS
+
+    print(f"Scanning {', '.join(args.paths)} for compressed files matching {', '.join(globs)}...")
+    compressed_files = find_compressed_files(args.paths, globs, set(args.run))
+    print(f"Found {len(compressed_files)} compressed files")
+
+    if not compressed_files:
+        return
+
+    if args.dry_run:
+        print("\nDry run - would extract:")
+        for filepath in compressed_files:
+            print(f"  {filepath} ({format_size(os.path.getsize(filepath))} compressed)")
+        return
 
     success_count = 0
     error_count = 0
-
-    for i, filepath in enumerate(gzipped_files, 1):
-        if extract_gzipped_file(filepath):
-            success_count += 1
-            print(f"[{i}/{len(gzipped_files)}] Extracted: {filepath}")
-        else:
-            error_count += 1
-
-    print(f"\nDone! Extracted: {success_count}, Errors: {error_count}")
+    total_extracted = 0
+    extracted = []
+
+    # Largest files first, so a big log doesn't end up alone at the end
+    compressed_files.sort(key=os.path.getsize, reverse=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(extract_file, filepath): filepath for filepath in compressed_files}
+        for i, future in enumerate(as_completed(futures), 1):
+            filepath = futures[future]
+            success, compressed_size, extracted_size, error = future.result()
+            if success:
+                success_count += 1
+                total_extracted += extracted_size
+                extracted.append(filepath)
+                print(
+                    f"[{i}/{len(compressed_files)}] Extracted: {filepath} "
+                    f"({format_size(compressed_size)} -> {format_size(extracted_size)})"
+                )
+            else:
+                print(f"Error extracting {filepath}: {error}")
+                error_count += 1
+
+    # Extracted runs need archiving again
+    clear_archived_markers(extracted, args.paths)
+
+    print(f"\nDone! Extracted: {success_count}, Errors: {error_count}, Size on disk: {format_size(total_extracted)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for the subset of the GCS API the downloaders use.
+
+Objects are served from a directory tree laid out as <root>/<bucket>/<object>.
+Point google-cloud-storage at it with STORAGE_EMULATOR_HOST:
+
+    python gcs_standin.py ./fake-bucket-root --port 9023
+    STORAGE_EMULATOR_HOST=http://127.0.0.1:9023 python download-ci-logs.py ./out
+
+Supported:
+- JSON API object listing with prefix, delimiter, startOffset/endOffset,
+  matchGlob, maxResults and page tokens
+- JSON API object metadata (blob.exists(), blob.reload())
+- JSON API media downloads (?alt=media) and XML API GET /<bucket>/<object>,
+  both honouring Range headers
+- Injected latency (fixed + jitter) and error responses (e.g. 429/503)
+- Request statistics per operation at GET /_stats (POST /_stats/reset)
+"""
+
+import argparse
+import base64
+import bisect
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+from listing_cache import glob_to_regex
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+class RequestStats:
+    """Thread-safe per-operation request counters and latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts: dict[str, int] = {}
+            self.errors: dict[str, int] = {}
+            self.bytes_sent = 0
+            self.latencies: dict[str, list[float]] = {}
+
+    def record(self, op: str, latency: float, nbytes: int = 0, error: bool = False) -> None:
+        with self._lock:
+            self.counts[op] = self.counts.get(op, 0) + 1
+            self.latencies.setdefault(op, []).append(latency)
+            self.bytes_sent += nbytes
+            if error:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+    def snapshot(self) -> dict:
+        """Return counts, error counts, bytes and p50/p95/max latency (ms) per operation."""
+        with self._lock:
+            ops = {}
+            for op, values in self.latencies.items():
+                ordered = sorted(values)
+                ops[op] = {
+                    "count": self.counts[op],
+                    "errors": self.errors.get(op, 0),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return {"bytes_sent": self.bytes_sent, "ops": ops}
+
+
+class StandInGCSServer(ThreadingHTTPServer):
+    """HTTP server holding the object index, fault injection settings and stats."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        root: Path,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ):
+        super().__init__((host, port), StandInGCSHandler)
+        self.root = Path(root)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_size = page_size
+        self.stats = RequestStats()
+        self.buckets: dict[str, list[str]] = {}
+        self.refresh()
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def refresh(self) -> None:
+        """Re-scan the root directory for buckets and objects."""
+        buckets = {}
+        if self.root.is_dir():
+            for bucket_dir in self.root.iterdir():
+                if not bucket_dir.is_dir():
+                    continue
+                names = []
+                for dirpath, _, files in os.walk(bucket_dir):
+                    for filename in files:
+                        full = Path(dirpath) / filename
+                        names.append(full.relative_to(bucket_dir).as_posix())
+                buckets[bucket_dir.name] = sorted(names)
+        self.buckets = buckets
+
+    def object_path(self, bucket: str, name: str) -> Path | None:
+        names = self.buckets.get(bucket)
+        if names is None:
+            return None
+        i = bisect.bisect_left(names, name)
+        if i < len(names) and names[i] == name:
+            return self.root / bucket / name
+        return None
+
+    def list_entries(self, bucket: str, prefix: str, delimiter: str,
+                     start_offset: str, end_offset: str, match_glob: str = "") -> list[tuple[str, bool]]:
+        """Return (key, is_prefix) entries in listing order."""
+        names = self.buckets.get(bucket, [])
+        lo = bisect.bisect_left(names, max(prefix, start_offset))
+        glob = glob_to_regex(match_glob) if match_glob else None
+        entries: list[tuple[str, bool]] = []
+        last_prefix = None
+        for name in names[lo:]:
+            if not name.startswith(prefix):
+                break
+            if end_offset and name >= end_offset:
+                break
+            if glob is not None and not glob.fullmatch(name):
+                continue
+            if delimiter:
+                cut = name.find(delimiter, len(prefix))
+                if cut != -1:
+                    sub_prefix = name[:cut + len(delimiter)]
+                    if sub_prefix != last_prefix:
+                        entries.append((sub_prefix, True))
+                        last_prefix = sub_prefix
+                    continue
+            entries.append((name, False))
+        return entries
+
+    def object_metadata(self, bucket: str, name: str, with_hash: bool = True) -> dict:
+        path = self.root / bucket / name
+        stat = path.stat()
+        updated = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(stat.st_mtime))
+        metadata = {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/1",
+            "name": name,
+            "bucket": bucket,
+            "generation": "1",
+            "metageneration": "1",
+            "contentType": "application/octet-stream",
+            "size": str(stat.st_size),
+            "timeCreated": updated,
+            "updated": updated,
+        }
+        if with_hash:  # skipped in listings to keep them cheap
+            metadata["md5Hash"] = base64.b64encode(hashlib.md5(path.read_bytes()).digest()).decode()
+        return metadata
+
+
+class StandInGCSHandler(BaseHTTPRequestHandler):
+    """Handles JSON/XML API requests against the server's directory tree."""
+
+    protocol_version = "HTTP/1.1"
+    server: StandInGCSServer
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json",
+              headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        self._send(status, json.dumps(payload).encode())
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"code": status, "message": message}})
+
+    def _inject_faults(self) -> bool:
+        """Sleep for the configured latency; return True if an error was sent instead."""
+        server = self.server
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send_error(server.error_status, "Injected error")
+            return True
+        return False
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/_stats/reset":
+            self.server.stats.reset()
+            self._send_json(200, {})
+        else:
+            self._send_error(404, "Not found")
+
+    def do_GET(self):
+        start = time.monotonic()
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path
+
+        if path == "/_stats":
+            self._send_json(200, self.server.stats.snapshot())
+            return
+
+        if match := re.fullmatch(r"(?:/download)?/storage/v1/b/([^/]+)/o/(.+)", path):
+            bucket, name = match.group(1), unquote(match.group(2))
+            op = "media" if query.get("alt") == "media" else "metadata"
+        elif match := re.fullmatch(r"/storage/v1/b/([^/]+)/o/?", path):
+            bucket, name, op = match.group(1), None, "list"
+        elif match := re.fullmatch(r"/([^/_][^/]*)/(.+)", path):
+            bucket, name, op = match.group(1), unquote(match.group(2)), "xml"
+        else:
+            self._send_error(404, f"Unsupported path: {path}")
+            return
+
+        if self._inject_faults():
+            self.server.stats.record(op, time.monotonic() - start, error=True)
+            return
+
+        nbytes = 0
+        if op == "list":
+            nbytes = self._handle_list(bucket, query)
+        elif self.server.object_path(bucket, name) is None:
+            self._send_error(404, f"No such object: {bucket}/{name}")
+        elif op == "metadata":
+            self._send_json(200, self.server.object_metadata(bucket, name))
+        else:
+            nbytes = self._handle_media(bucket, name)
+        self.server.stats.record(op, time.monotonic() - start, nbytes)
+
+    def _handle_list(self, bucket: str, query: dict[str, str]) -> int:
+        if bucket not in self.server.buckets:
+            self._send_error(404, f"No such bucket: {bucket}")
+            return 0
+        entries = self.server.list_entries(
+            bucket,
+            query.get("prefix", ""),
+            query.get("delimiter", ""),
+            query.get("startOffset", ""),
+            query.get("endOffset", ""),
+            query.get("matchGlob", ""),
+        )
+        page_size = min(int(query.get("maxResults", self.server.page_size)), self.server.page_size)
+        offset = int(query.get("pageToken", "0") or 0)
+        page = entries[offset:offset + page_size]
+
+        payload = {
+            "kind": "storage#objects",
+            "items": [
+                self.server.object_metadata(bucket, key, with_hash=False)
+                for key, is_prefix in page if not is_prefix
+            ],
+            "prefixes": [key for key, is_prefix in page if is_prefix],
+        }
+        if offset + page_size < len(entries):
+            payload["nextPageToken"] = str(offset + page_size)
+        body = json.dumps(payload).encode()
+        self._send(200, body)
+        return len(body)
+
+    def _handle_media(self, bucket: str, name: str) -> int:
+        data = (self.server.root / bucket / name).read_bytes()
+        size = len(data)
+        headers = {"Accept-Ranges": "bytes"}
+        range_header = self.headers.get("Range")
+        if range_header and (match := re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())):
+            first, last = match.groups()
+            if first == "":
+                start, end = max(0, size - int(last)), size - 1
+            else:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            if start >= size or start > end:
+                self._send(416, b"", headers={"Content-Range": f"bytes */{size}"})
+                return 0
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            body = data[start:end + 1]
+            self._send(206, body, "application/octet-stream", headers)
+            return len(body)
+        md5 = base64.b64encode(hashlib.md5(data).digest()).decode()
+        headers["X-Goog-Hash"] = f"md5={md5}"
+        self._send(200, data, "application/octet-stream", headers)
+        return size
+
+
+def start_server(root: Path, **kwargs) -> StandInGCSServer:
+    """Start a stand-in server on a background thread and return it."""
+    server = StandInGCSServer(root, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a local directory tree as a GCS stand-in (JSON/XML API subset)"
+    )
+    parser.add_argument("root", help="Directory laid out as <root>/<bucket>/<object>")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9023, help="Port (default: 9023)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency (0..N ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors (default: 503)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Maximum entries per listing page")
+    args = parser.parse_args()
+
+    server = StandInGCSServer(
+        Path(args.root),
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        page_size=args.page_size,
+    )
+    print(f"Serving {args.root} at {server.endpoint}")
+    print(f"Use: STORAGE_EMULATOR_HOST={server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
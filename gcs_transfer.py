@@ -0,0 +1,580 @@
+"""Shared transfer machinery for the GCS downloaders.
+
+AdaptiveConcurrency tunes the number of in-flight requests at runtime
+(AIMD on observed throughput, latency and 429/503 responses) within
+configured bounds, and TransferPool runs blob transfers on a shared thread
+pool gated by it, with per-transfer deadlines, optional hedged requests
+and a report of the transfers that failed.
+"""
+
+import heapq
+import http.client
+import itertools
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import requests
+import urllib3
+from google.api_core import exceptions as api_exceptions
+from google.api_core.retry import if_transient_error
+from google.cloud.storage.retry import DEFAULT_RETRY
+
+from download_telemetry import Telemetry
+
+# Status codes GCS uses to ask clients to slow down
+THROTTLE_STATUS_CODES = {429, 503}
+
+# What the storage client retries besides if_transient_error(): the other
+# transient status codes (also on media downloads, which fail with
+# InvalidResponse) and network errors at any layer
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NETWORK_ERRORS = (
+    ConnectionError,
+    requests.exceptions.Timeout,
+    http.client.BadStatusLine,
+    http.client.IncompleteRead,
+    http.client.ResponseNotReady,
+    urllib3.exceptions.PoolError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.SSLError,
+    urllib3.exceptions.TimeoutError,
+)
+
+# A request costs roughly as much as transferring this many bytes; used to
+# make throughput comparable between runs of tiny and large objects
+REQUEST_COST_BYTES = 64 * 1024
+
+MIN_WORKERS = 2
+
+# Per-transfer limits: total time including retries, and per request. The
+# deadline grows by one second per DEADLINE_MIN_THROUGHPUT bytes of the
+# object, so large files aren't cut off while still streaming
+DEFAULT_DEADLINE = 300.0
+DEADLINE_MIN_THROUGHPUT = 256 * 1024
+REQUEST_TIMEOUT = 60.0
+RETRY_INITIAL_DELAY = 0.5
+RETRY_MAX_DELAY = 10.0
+
+# Hedging needs this many completed transfers of similar size, and looks
+# at the most recent HEDGE_WINDOW of them
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+
+class TransferAbandoned(Exception):
+    """Raised by commit_file() in an attempt whose transfer is already over."""
+
+
+_current = threading.local()
+
+
+def commit_file(tmp_path, path) -> None:
+    """Rename a transfer's temporary file into place.
+
+    Transfer functions run by a TransferPool call this instead of
+    os.replace(): an attempt that is still running after its transfer failed
+    (deadline) or another attempt won (hedge) gets TransferAbandoned and
+    must discard its output, so a file reported as failed never appears
+    afterwards.
+    """
+    task = getattr(_current, "task", None)
+    if task is None:
+        os.replace(tmp_path, path)
+        return
+    with task.lock:
+        if task.committed or task.future.done():
+            raise TransferAbandoned(str(path))
+        os.replace(tmp_path, path)
+        task.committed = True
+
+
+def _status_code(exc: BaseException) -> int | None:
+    """Return the HTTP status of an API error or a failed media download."""
+    code = getattr(exc, "code", None)
+    if code is None and (response := getattr(exc, "response", None)) is not None:
+        code = getattr(response, "status_code", None)
+    return code
+
+
+def is_throttling_error(exc: BaseException) -> bool:
+    """Check if an exception is a 429/503 response from GCS."""
+    if isinstance(exc, (api_exceptions.TooManyRequests, api_exceptions.ServiceUnavailable)):
+        return True
+    return _status_code(exc) in THROTTLE_STATUS_CODES
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Check if an exception is transient: the errors the storage client retries by default."""
+    if if_transient_error(exc) or isinstance(exc, RETRYABLE_NETWORK_ERRORS):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of in-flight requests.
+
+    Every `interval` seconds the controller compares the effective
+    throughput (bytes/s plus REQUEST_COST_BYTES per completed request) with
+    the previous interval:
+
+    - a 429/503 response (including ones retried inside the client) halves
+      the limit (multiplicative decrease)
+    - median latency above `latency_factor` x the best median seen, without
+      a throughput gain, shrinks the limit by a quarter
+    - otherwise, if throughput didn't drop, the limit grows by one
+      (additive increase); if it dropped, it shrinks by one
+
+    Like TCP slow start, the limit doubles instead of growing by one until
+    the first interval without a gain, so short syncs ramp up quickly. The
+    limit always stays within [min_limit, max_limit].
+    """
+
+    def __init__(
+        self,
+        min_limit: int = MIN_WORKERS,
+        max_limit: int = 32,
+        initial: int | None = None,
+        interval: float = 1.0,
+        latency_factor: float = 2.0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial or self.min_limit))
+        self.interval = interval
+        self.latency_factor = latency_factor
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_requests = 0
+        self._window_latencies: list[float] = []
+        self._window_throttled = 0
+        self._last_throughput: float | None = None
+        self._best_latency: float | None = None
+        self._slow_start = True
+
+        self.throttled = 0
+        self.peak = self.limit
+        self.history: list[int] = [self.limit]
+
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight request slot for the duration of the block."""
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def record(self, latency: float, nbytes: int = 0) -> None:
+        """Record a completed request."""
+        with self._cond:
+            self._window_requests += 1
+            self._window_bytes += nbytes
+            self._window_latencies.append(latency)
+            self._maybe_adjust()
+
+    def record_throttled(self) -> None:
+        """Record a 429/503 response."""
+        with self._cond:
+            self.throttled += 1
+            self._window_throttled += 1
+            self._maybe_adjust()
+
+    def _maybe_adjust(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+
+        throughput = (self._window_bytes + self._window_requests * REQUEST_COST_BYTES) / elapsed
+        latency = statistics.median(self._window_latencies) if self._window_latencies else None
+        if latency is not None and (self._best_latency is None or latency < self._best_latency):
+            self._best_latency = latency
+        improved = self._last_throughput is None or throughput >= self._last_throughput * 0.95
+
+        if self._window_throttled:
+            new_limit = self.limit // 2
+        elif (latency is not None and self._best_latency
+              and latency > self._best_latency * self.latency_factor
+              and not throughput > (self._last_throughput or 0) * 1.05):
+            new_limit = self.limit - max(1, self.limit // 4)
+        elif improved:
+            new_limit = self.limit * 2 if self._slow_start else self.limit + 1
+        else:
+            new_limit = self.limit - 1
+        if new_limit <= self.limit:
+            self._slow_start = False
+
+        old_limit = self.limit
+        self.limit = min(self.max_limit, max(self.min_limit, new_limit))
+        self.peak = max(self.peak, self.limit)
+        self.history.append(self.limit)
+        if self.limit > old_limit:
+            self._cond.notify(self.limit - old_limit)
+
+        if self._window_requests:
+            self._last_throughput = throughput
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_requests = 0
+        self._window_latencies = []
+        self._window_throttled = 0
+
+    @property
+    def settled(self) -> int:
+        """The limit the controller settled on (median of the last intervals)."""
+        return int(statistics.median(self.history[-5:]))
+
+    def summary(self) -> str:
+        return (
+            f"Adaptive concurrency settled at {self.settled} in-flight requests "
+            f"(bounds {self.min_limit}-{self.max_limit}, peak {self.peak}, "
+            f"{self.throttled} throttled response(s))"
+        )
+
+
+@dataclass
+class TransferFailure:
+    """A blob transfer that failed for good."""
+    label: str
+    error: str
+    error_type: str
+    attempts: int  # requests made, including client-side retries and hedges
+    elapsed: float
+    hedged: bool
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Task:
+    """Bookkeeping for one submitted transfer and its attempts."""
+
+    def __init__(self, fn: Callable, args: tuple, label: str, size: int, op: str):
+        self.fn = fn
+        self.args = args
+        self.label = label
+        self.size = size
+        self.op = op
+        self.future: Future = Future()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.running = 0
+        self.hedged = False
+        self.committed = False  # an attempt renamed its output into place
+        self.started: float | None = None
+        self.last_error: BaseException | None = None
+
+
+class TransferPool:
+    """Runs blob transfers on a shared thread pool.
+
+    Without a controller, at most max_workers transfers run at once (like a
+    plain ThreadPoolExecutor). With one, each transfer holds a controller
+    slot, so the number of in-flight requests follows its limit.
+
+    Every transfer gets a deadline of `deadline` seconds plus the time its
+    size takes at DEADLINE_MIN_THROUGHPUT: its retries (truncated
+    exponential backoff with full jitter, as in the storage client) stop
+    once it has been running that long, and its future fails with
+    TimeoutError at that point even if a request is still hanging, so one
+    stuck object doesn't hold up the rest of the sync. With hedge=True, a
+    transfer still running past the p95 latency of completed transfers of
+    similar size gets a duplicate request on a small separate pool; the
+    first one to finish wins.
+
+    Transfer functions are called as fn(*args, retry=..., timeout=...) and
+    must be safe to run twice concurrently when hedging: they write to a
+    temporary file and rename it with commit_file(), which only lets the
+    first attempt of a transfer that hasn't failed yet through. They should return the number of bytes
+    transferred, or the downloaded bytes themselves; other results count
+    as requests without payload. Final failures are collected in
+    `failures`.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        controller: AdaptiveConcurrency | None = None,
+        deadline: float = DEFAULT_DEADLINE,
+        hedge: bool = False,
+        telemetry: Telemetry | None = None,
+    ):
+        self.controller = controller
+        self.deadline = deadline
+        self.hedge = hedge
+        self.telemetry = telemetry
+        # Transfers submitted but not started yet, and requests running
+        self.queued = 0
+        self.in_flight = 0
+        self.failures: list[TransferFailure] = []
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max(2, max_workers // 4)) if hedge else None
+        self._lock = threading.Lock()
+        self._latencies: dict[int, deque[float]] = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+        # Min-heap of (when, seq, kind, task) for the watchdog
+        self._timers: list[tuple[float, int, str, _Task]] = []
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+        self._watchdog.start()
+
+    def deadline_for(self, size: int) -> float:
+        """Return the deadline of a transfer of `size` bytes."""
+        return self.deadline + size / DEADLINE_MIN_THROUGHPUT
+
+    def _retry_for(self, task: _Task):
+        """Build the retry policy for one transfer.
+
+        The storage client retries 429/503 and connection errors internally,
+        so they are only visible through the retry predicate.
+        """
+        controller = self.controller
+
+        telemetry = self.telemetry
+
+        def observe(exc: Exception) -> bool:
+            retryable = is_retryable_error(exc)
+            if retryable:
+                with task.lock:
+                    task.requests += 1
+                if telemetry is not None:
+                    telemetry.retry(task.op)
+            if controller is not None and is_throttling_error(exc):
+                controller.record_throttled()
+            return retryable
+
+        return (
+            DEFAULT_RETRY.with_predicate(observe)
+            .with_delay(initial=RETRY_INITIAL_DELAY, maximum=RETRY_MAX_DELAY)
+            .with_timeout(self.deadline_for(task.size))
+        )
+
+    def _schedule(self, when: float, kind: str, task: _Task) -> None:
+        with self._wakeup:
+            heapq.heappush(self._timers, (when, next(self._seq), kind, task))
+            self._wakeup.notify()
+
+    def _hedge_delay(self, size: int) -> float | None:
+        """p95 latency of completed transfers of similar size, once there are enough."""
+        with self._lock:
+            samples = list(self._latencies[_size_bucket(size)])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return statistics.quantiles(samples, n=20)[-1]
+
+    def _attempt(self, task: _Task, hedge: bool) -> None:
+        if not hedge:
+            with self._lock:
+                self.queued -= 1
+        if task.future.done():
+            return
+        if self.controller is not None and not hedge:
+            # Time spent waiting for a slot doesn't count against the deadline
+            with self.controller.slot():
+                self._run_attempt(task, hedge)
+        else:
+            self._run_attempt(task, hedge)
+
+    def _run_attempt(self, task: _Task, hedge: bool) -> None:
+        if task.future.done():
+            return
+        start = time.monotonic()
+        with task.lock:
+            task.requests += 1
+            task.running += 1
+            first = task.started is None
+            if first:
+                task.started = start
+        if first:
+            self._schedule(start + self.deadline_for(task.size), "deadline", task)
+            if self.hedge and (delay := self._hedge_delay(task.size)) is not None:
+                self._schedule(start + delay, "hedge", task)
+
+        with self._lock:
+            self.in_flight += 1
+        _current.task = task
+        try:
+            result = self._call(task)
+        except TransferAbandoned:
+            # The transfer failed or another attempt committed; it settles the future
+            with self._lock:
+                self.in_flight -= 1
+            with task.lock:
+                task.running -= 1
+            return
+        except Exception as e:
+            with self._lock:
+                self.in_flight -= 1
+            if self.telemetry is not None:
+                self.telemetry.observe(task.op, time.monotonic() - start, error=True, label=task.label)
+            if self.controller is not None and is_throttling_error(e):
+                self.controller.record_throttled()
+            with task.lock:
+                task.running -= 1
+                task.last_error = e
+                last = task.running == 0
+            if last:
+                self._fail(task, e)
+            return
+        finally:
+            _current.task = None
+
+        latency = time.monotonic() - start
+        with self._lock:
+            self.in_flight -= 1
+        if isinstance(result, bytes):
+            nbytes = len(result)
+        else:
+            nbytes = result if isinstance(result, int) else 0
+        if self.telemetry is not None:
+            self.telemetry.observe(task.op, latency, nbytes, label=task.label)
+        try:
+            task.future.set_result(result)
+        except InvalidStateError:  # another attempt or the deadline got there first
+            return
+        finally:
+            # Only now, so a failing hedge can't fail the transfer in between
+            with task.lock:
+                task.running -= 1
+        if hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        else:
+            with self._lock:
+                self._latencies[_size_bucket(task.size)].append(latency)
+            if self.controller is not None:
+                self.controller.record(latency, nbytes)
+
+    def _call(self, task: _Task):
+        timeout = min(REQUEST_TIMEOUT, self.deadline_for(task.size))
+        return task.fn(*task.args, retry=self._retry_for(task), timeout=timeout)
+
+    def _fail(self, task: _Task, error: BaseException, deadline: bool = False) -> None:
+        with task.lock:
+            if deadline and task.committed:
+                return  # the output is in place, the attempt is about to finish
+            try:
+                task.future.set_exception(error)
+            except InvalidStateError:
+                return
+            elapsed = time.monotonic() - task.started if task.started is not None else 0.0
+            failure = TransferFailure(
+                label=task.label,
+                error=str(error) or error.__class__.__name__,
+                error_type=error.__class__.__name__,
+                attempts=task.requests,
+                elapsed=round(elapsed, 3),
+                hedged=task.hedged,
+            )
+        with self._lock:
+            self.failures.append(failure)
+
+    def _watch(self) -> None:
+        """Fire hedges and deadlines for running transfers."""
+        while True:
+            with self._wakeup:
+                while not self._closed and (not self._timers or self._timers[0][0] > time.monotonic()):
+                    timeout = self._timers[0][0] - time.monotonic() if self._timers else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+                _, _, kind, task = heapq.heappop(self._timers)
+            if task.future.done():
+                continue
+            if kind == "deadline":
+                self._fail(task, TimeoutError(
+                    f"deadline of {self.deadline_for(task.size):g}s exceeded"
+                    + (f" (last error: {task.last_error})" if task.last_error else "")
+                ), deadline=True)
+            elif kind == "hedge" and not task.hedged:
+                task.hedged = True
+                self.hedges += 1
+                self._hedge_executor.submit(self._attempt, task, True)
+
+    def submit(self, fn: Callable, *args, label: str | None = None, size: int = 0, op: str = "download") -> Future:
+        """Run fn(*args, retry=..., timeout=...) on the pool.
+
+        label names the transfer in the failure report; size (in bytes, if
+        known) groups it with transfers of similar size for hedging; op
+        names the operation in telemetry.
+        """
+        task = _Task(fn, args, label or getattr(fn, "__name__", "transfer"), size, op)
+        with self._lock:
+            self.queued += 1
+        self._executor.submit(self._attempt, task, False)
+        return task.future
+
+    def map(self, fn: Callable, items: list[tuple]) -> list:
+        """Run fn(*item) for each item; return per item its result or the exception raised."""
+        futures = [self.submit(fn, *item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def shutdown(self) -> None:
+        """Stop the pool without waiting for attempts still running.
+
+        Call it once every future is done. Attempts left over (past their
+        deadline, or losing hedges) finish in the background and discard
+        their output in commit_file().
+        """
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._executor.shutdown(wait=False, cancel_futures=False)
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+    def summary(self) -> str:
+        text = f"{len(self.failures)} transfer(s) failed"
+        if self.hedge:
+            text += f", {self.hedges} hedged request(s) ({self.hedge_wins} won)"
+        return text
+
+
+def _size_bucket(size: int) -> int:
+    """Group sizes by power of 4 (1 KB, 4 KB, 16 KB, ...) for hedging thresholds."""
+    return max(0, (size.bit_length() - 10) // 2)
+
+
+def write_failure_report(failures: list[TransferFailure], path: str) -> None:
+    """Write failures as JSON lines."""
+    with open(path, "w") as f:
+        for failure in sorted(failures, key=lambda failure: failure.label):
+            f.write(json.dumps(failure.to_dict()) + "\n")
+
+
+def print_failure_report(failures: list[TransferFailure], limit: int = 20) -> None:
+    """Print a table of failed transfers (the first `limit` by label)."""
+    if not failures:
+        return
+    print(f"Failed transfers ({len(failures)}):")
+    print(f"  {'Attempts':>8} {'Time s':>7} {'Hedged':>6}  {'Error':<20} Object")
+    for failure in sorted(failures, key=lambda failure: failure.label)[:limit]:
+        print(f"  {failure.attempts:>8} {failure.elapsed:>7.1f} {'yes' if failure.hedged else 'no':>6}  "
+              f"{failure.error_type:<20} {failure.label}")
+    if len(failures) > limit:
+        print(f"  ... and {len(failures) - limit} more")
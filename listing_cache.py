@@ -0,0 +1,344 @@
+"""Persistent cache of GCS bucket listings shared by the downloaders.
+
+Listings are stored in a SQLite file keyed by their parameters (API
+endpoint and bucket, prefix, delimiter, offsets, glob, max results) with the
+time they were fetched. Entries expire after a TTL, except for sealed prefixes:
+
+- a run directory is sealed once its finished.json exists (Prow writes it
+  when the run is over, so the run's listing won't change again)
+- a PR job directory is sealed once all its runs have finished.json and
+  the newest of them is older than SEAL_AGE (the PR has gone quiet)
+
+A complete listing of a sealed prefix answers every later listing below it
+(runs, max_results=1 existence checks, globs, offsets) without a request.
+Use --refresh-listings to ignore the cache, e.g. after /retest on an old PR.
+
+CachingClient wraps a storage.Client so existing list_blobs() call sites
+use the cache transparently.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from google.cloud import storage
+
+from download_telemetry import Telemetry
+
+DEFAULT_TTL = 3600.0
+SEAL_AGE = 7 * 86400.0
+DEFAULT_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "rhdh-ci-analyzer" / "listings.sqlite"
+)
+
+
+def glob_to_regex(glob: str) -> re.Pattern:
+    """Compile a GCS matchGlob pattern: ** crosses "/", * and ? don't."""
+    parts = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif glob[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif glob[i] == "[" and (end := glob.find("]", i + 1)) != -1:
+            parts.append("[" + glob[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(glob[i]))
+            i += 1
+    return re.compile("".join(parts))
+
+
+def filter_listing(
+    items: list[dict],
+    prefix: str,
+    delimiter: str | None = None,
+    start_offset: str | None = None,
+    end_offset: str | None = None,
+    match_glob: str | None = None,
+    max_results: int | None = None,
+) -> tuple[list[dict], list[str]]:
+    """Apply listing parameters to name-sorted blob resources, like GCS does.
+
+    Returns: (items, prefixes)
+    """
+    glob = glob_to_regex(match_glob) if match_glob else None
+    result: list[dict] = []
+    prefixes: list[str] = []
+    for item in items:
+        name = item["name"]
+        if not name.startswith(prefix):
+            continue
+        if start_offset and name < start_offset:
+            continue
+        if end_offset and name >= end_offset:
+            continue
+        if glob is not None and not glob.fullmatch(name):
+            continue
+        if delimiter and (cut := name.find(delimiter, len(prefix))) != -1:
+            sub_prefix = name[:cut + len(delimiter)]
+            if not prefixes or prefixes[-1] != sub_prefix:
+                prefixes.append(sub_prefix)
+            continue
+        result.append(item)
+        if max_results and len(result) >= max_results:
+            break
+    return result, prefixes
+
+
+def blob_to_item(blob: storage.Blob) -> dict:
+    """Return what the cache keeps of a listed blob (enough to download and schedule).
+
+    Properties are stored in their API representation, as in listings.
+    """
+    item = {"name": blob.name}
+    if blob.size is not None:
+        item["size"] = str(blob.size)
+    if blob.generation is not None:
+        item["generation"] = str(blob.generation)
+    if blob.updated is not None:
+        item["updated"] = blob.updated.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return item
+
+
+def item_to_blob(item: dict, bucket: storage.Bucket) -> storage.Blob:
+    """Rebuild a listed blob from its cached properties.
+
+    The client has no public way to create a Blob with server-side
+    properties; this does what its listing iterator does (Blob plus
+    _set_properties, checked against google-cloud-storage 3.17). The size
+    is checked so a client change fails loudly instead of yielding blobs
+    without metadata.
+    """
+    blob = storage.Blob(item["name"], bucket=bucket)
+    blob._set_properties(item)
+    if "size" in item and blob.size != int(item["size"]):
+        raise RuntimeError("cannot rebuild blobs from the listing cache with this google-cloud-storage version; "
+                           "use --no-listing-cache")
+    return blob
+
+
+def parse_rfc3339(value: str) -> float:
+    """Parse a GCS timestamp ("2026-01-10T08:00:00.123Z") into a Unix timestamp."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def is_sealed(prefix: str, items: list[dict], now: float, seal_age: float = SEAL_AGE) -> bool:
+    """Check whether a complete listing of prefix can't change any more."""
+    if any(item["name"] == f"{prefix}finished.json" for item in items):
+        return True  # a finished run
+
+    # A job directory: every run must be finished, the newest long enough ago
+    runs: dict[str, float | None] = {}
+    for item in items:
+        run_id, _, rest = item["name"][len(prefix):].partition("/")
+        if not run_id.isdigit():
+            continue
+        runs.setdefault(run_id, None)
+        if rest == "finished.json" and item.get("updated"):
+            runs[run_id] = parse_rfc3339(item["updated"])
+    if not runs or any(finished is None for finished in runs.values()):
+        return False
+    return now - max(runs.values()) > seal_age
+
+
+class CachedListing(list):
+    """A list of blobs with the listing's sub-prefixes, like the client's iterator."""
+
+    def __init__(self, blobs: list[storage.Blob], prefixes: list[str]):
+        super().__init__(blobs)
+        self.prefixes = set(prefixes)
+
+
+class ListingCache:
+    """SQLite-backed cache of listings (see the module docstring).
+
+    With path=None the cache is disabled and every listing goes to GCS.
+    With refresh=True cached entries are ignored but still updated.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = DEFAULT_CACHE_PATH,
+        ttl: float = DEFAULT_TTL,
+        refresh: bool = False,
+        telemetry: Telemetry | None = None,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.telemetry = telemetry
+        self.hits = 0
+        self.sealed_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                " key TEXT PRIMARY KEY, bucket TEXT, prefix TEXT, complete INTEGER,"
+                " sealed INTEGER, fetched_at REAL, items TEXT, prefixes TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS sealed_prefixes ON listings (bucket, prefix, sealed)")
+            self._db.commit()
+
+    def _lookup(self, source: str, key: str, prefix: str, params: dict) -> tuple[list[dict], list[str]] | None:
+        if self._db is None or self.refresh:
+            return None
+        # A sealed ancestor (or the prefix itself) answers any listing below it
+        ancestors = [prefix[:i + 1] for i in range(len(prefix)) if prefix[i] == "/"]
+        if prefix and not prefix.endswith("/"):
+            ancestors.append(prefix)
+        with self._lock:
+            if ancestors:
+                marks = ",".join("?" * len(ancestors))
+                row = self._db.execute(
+                    f"SELECT items FROM listings WHERE bucket = ? AND sealed = 1 AND prefix IN ({marks})"
+                    " ORDER BY length(prefix) DESC LIMIT 1",
+                    [source, *ancestors],
+                ).fetchone()
+                if row is not None:
+                    self.sealed_hits += 1
+                    return filter_listing(json.loads(row[0]), prefix, **params)
+            row = self._db.execute(
+                "SELECT fetched_at, items, prefixes FROM listings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is not None and time.time() - row[0] < self.ttl:
+            self.hits += 1
+            return json.loads(row[1]), json.loads(row[2])
+        return None
+
+    def _store(self, source: str, key: str, prefix: str, complete: bool,
+               items: list[dict], prefixes: list[str]) -> None:
+        if self._db is None:
+            return
+        sealed = complete and prefix.endswith("/") and is_sealed(prefix, items, time.time())
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, prefix, int(complete), int(sealed), time.time(),
+                 json.dumps(items, separators=(",", ":")), json.dumps(prefixes)),
+            )
+            self._db.commit()
+
+    def list_blobs(
+        self,
+        client: storage.Client,
+        bucket_name: str,
+        prefix: str = "",
+        delimiter: str | None = None,
+        start_offset: str | None = None,
+        end_offset: str | None = None,
+        match_glob: str | None = None,
+        max_results: int | None = None,
+    ) -> CachedListing:
+        """List blobs like client.list_blobs(), from the cache when possible."""
+        params = {
+            "delimiter": delimiter,
+            "start_offset": start_offset,
+            "end_offset": end_offset,
+            "match_glob": match_glob,
+            "max_results": max_results,
+        }
+        # The same bucket name on another endpoint (e.g. gcs_standin.py via
+        # STORAGE_EMULATOR_HOST) is a different bucket
+        source = f"{client.api_endpoint}/{bucket_name}"
+        key = json.dumps([source, prefix, params], sort_keys=True)
+        cached = self._lookup(source, key, prefix, params)
+        if cached is None:
+            self.misses += 1
+            start = time.monotonic()
+            try:
+                iterator = client.list_blobs(bucket_name, prefix=prefix, **params)
+                blobs = list(iterator)
+            except Exception:
+                if self.telemetry is not None:
+                    self.telemetry.observe("list", time.monotonic() - start, error=True, label=prefix)
+                raise
+            if self.telemetry is not None:
+                self.telemetry.observe("list", time.monotonic() - start, label=prefix)
+            items = [blob_to_item(blob) for blob in blobs]
+            prefixes = sorted(iterator.prefixes)
+            complete = not any(params.values())
+            self._store(source, key, prefix, complete, items, prefixes)
+            return CachedListing(blobs, prefixes)
+
+        items, prefixes = cached
+        if self.telemetry is not None:
+            self.telemetry.count("listing_cache_hits")
+        bucket = client.bucket(bucket_name)
+        return CachedListing([item_to_blob(item, bucket) for item in items], prefixes)
+
+    def summary(self) -> str:
+        if self._db is None:
+            return f"Listing cache disabled ({self.misses} listing(s))"
+        return (
+            f"Listing cache: {self.hits + self.sealed_hits} hit(s) "
+            f"({self.sealed_hits} from sealed prefixes), {self.misses} listing(s) from GCS"
+        )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+
+
+class CachingClient:
+    """A storage.Client whose list_blobs() goes through a ListingCache."""
+
+    def __init__(self, client: storage.Client, cache: ListingCache):
+        self._client = client
+        self.cache = cache
+
+    def list_blobs(self, bucket_or_name, prefix: str = "", **params) -> CachedListing:
+        bucket_name = getattr(bucket_or_name, "name", bucket_or_name)
+        return self.cache.list_blobs(self._client, bucket_name, prefix, **params)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def add_listing_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the listing cache options shared by the downloaders."""
+    parser.add_argument(
+        "--listing-cache",
+        metavar="PATH",
+        default=str(DEFAULT_CACHE_PATH),
+        help=f"Listing cache file (default: {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--no-listing-cache",
+        action="store_true",
+        help="Don't read or write the listing cache",
+    )
+    parser.add_argument(
+        "--listing-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help=f"Seconds before cached listings of unsealed prefixes expire (default: {DEFAULT_TTL:g})",
+    )
+    parser.add_argument(
+        "--refresh-listings",
+        action="store_true",
+        help="Ignore cached listings (including sealed ones) and list everything again",
+    )
+
+
+def open_listing_cache(args: argparse.Namespace, telemetry: Telemetry | None = None) -> ListingCache:
+    """Create the ListingCache configured by add_listing_cache_arguments."""
+    path = None if args.no_listing_cache else Path(args.listing_cache).expanduser()
+    return ListingCache(path, ttl=args.listing_ttl, refresh=args.refresh_listings, telemetry=telemetry)
@@ -0,0 +1,177 @@
+"""Per-job baselines of build log lines seen in successful runs.
+
+Most of a failed run's build log (cluster setup, image pulls, operator
+installs) is identical to what successful runs of the same job print. A
+baseline holds the lines of a job's TEST_SUCCESS runs, and novel_lines()
+returns the lines of another log that none of them printed, typically the
+failure and what led to it.
+
+Lines are compared after normalization (ANSI codes removed, digits and the
+hex strings around them masked, surrounding whitespace stripped), so
+timestamps, durations, counters and generated names don't make every line
+novel. Each normalized line is reduced to a 64-bit hash (blake2b), and a
+baseline is a sorted array of the hashes of lines found in at least
+min_runs runs: 8 bytes per line, looked up by binary search. A false match
+needs a 64-bit collision, so it doesn't happen in practice.
+
+Baselines are built by build-baselines.py and stored in BASELINES_DIR of
+the logs directory, one file per job.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from template_miner import ANSI_ESCAPE_PATTERN, ERROR_LINE_PATTERN
+
+BASELINES_DIR = ".baselines"
+BASELINE_SUFFIX = ".baseline"
+BASELINE_MAGIC = b"CIBASE1\n"
+HEADER = struct.Struct("<II")  # runs, min_runs
+DEFAULT_MIN_RUNS = 2
+EXCERPT_LINES = 15
+
+_VARIABLE = re.compile(r"[0-9a-fA-F]*[0-9][0-9a-fA-F]*")
+
+
+def normalized_lines(text: str) -> list[str]:
+    """Return the lines of a log as compared against baselines."""
+    text = _VARIABLE.sub("0", ANSI_ESCAPE_PATTERN.sub("", text))
+    return [line.strip() for line in text.split("\n")]
+
+
+def line_hash(line: str) -> int:
+    """Return the 64-bit hash of a normalized line."""
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8", "surrogateescape"), digest_size=8).digest(), "little")
+
+
+def log_hashes(text: str) -> set[int]:
+    """Return the hashes of the distinct non-empty lines of a log."""
+    return {line_hash(line) for line in set(normalized_lines(text)) if line}
+
+
+class Baseline:
+    """The line hashes of a job's successful runs, as a sorted array."""
+
+    def __init__(self, hashes: array, runs: int, min_runs: int):
+        self.hashes = hashes
+        self.runs = runs
+        self.min_runs = min_runs
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, value: int) -> bool:
+        index = bisect_left(self.hashes, value)
+        return index < len(self.hashes) and self.hashes[index] == value
+
+    def known_lines(self, text: str) -> list[bool]:
+        """Return for each line of a log whether the baseline has it (empty lines count as known)."""
+        return [not line or line_hash(line) in self for line in normalized_lines(text)]
+
+    def novel_lines(self, text: str) -> list[str]:
+        """Return the lines of a log not found in the baseline."""
+        return [line for line, known in zip(text.split("\n"), self.known_lines(text)) if not known]
+
+    def reduce(self, text: str, anchors: Iterable[int] = ()) -> tuple[str, list[int]]:
+        """Return a log without its known lines, and the anchors (offsets) moved along.
+
+        Lines containing an anchor are kept even if known.
+        """
+        anchors = sorted(anchors)
+        kept = []
+        moved = []
+        offset = 0  # of the current line in text
+        length = 0  # of the reduced text so far
+        next_anchor = 0
+        for line, known in zip(text.split("\n"), self.known_lines(text)):
+            end = offset + len(line) + 1
+            has_anchor = next_anchor < len(anchors) and anchors[next_anchor] < end
+            while next_anchor < len(anchors) and anchors[next_anchor] < end:
+                moved.append(length + anchors[next_anchor] - offset)
+                next_anchor += 1
+            if has_anchor or not known:
+                kept.append(line)
+                length += len(line) + 1
+            offset = end
+        return "\n".join(kept), moved
+
+    def save(self, path: Path) -> None:
+        """Write the baseline to a file (atomically)."""
+        hashes = array("Q", self.hashes)
+        if sys.byteorder == "big":
+            hashes.byteswap()
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+        with open(tmp_path, "wb") as f:
+            f.write(BASELINE_MAGIC)
+            f.write(HEADER.pack(self.runs, self.min_runs))
+            hashes.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "Baseline":
+        """Read a baseline written by save(); raises ValueError if the file isn't one."""
+        data = path.read_bytes()
+        if not data.startswith(BASELINE_MAGIC):
+            raise ValueError(f"{path}: not a baseline file")
+        runs, min_runs = HEADER.unpack_from(data, len(BASELINE_MAGIC))
+        hashes = array("Q")
+        body = data[len(BASELINE_MAGIC) + HEADER.size:]
+        if len(body) % hashes.itemsize:
+            raise ValueError(f"{path}: truncated baseline file")
+        hashes.frombytes(body)
+        if sys.byteorder == "big":
+            hashes.byteswap()
+        return cls(hashes, runs, min_runs)
+
+
+class BaselineBuilder:
+    """Counts in how many logs each line occurs, to build a Baseline."""
+
+    def __init__(self):
+        self.counts: Counter[int] = Counter()
+        self.runs = 0
+
+    def add_log(self, text: str) -> None:
+        self.counts.update(log_hashes(text))
+        self.runs += 1
+
+    def build(self, min_runs: int = DEFAULT_MIN_RUNS) -> Baseline:
+        """Return the baseline of the lines found in min_runs logs (or all logs, if fewer)."""
+        min_runs = max(1, min(min_runs, self.runs))
+        hashes = array("Q", sorted(h for h, count in self.counts.items() if count >= min_runs))
+        return Baseline(hashes, self.runs, min_runs)
+
+
+def baseline_path(logs_dir: Path, job_name: str) -> Path:
+    return logs_dir / BASELINES_DIR / f"{job_name}{BASELINE_SUFFIX}"
+
+
+class BaselineStore:
+    """The baselines of a logs directory, loaded on first use."""
+
+    def __init__(self, logs_dir: Path):
+        self.logs_dir = logs_dir
+        self._baselines: dict[str, Optional[Baseline]] = {}
+
+    def get(self, job_name: str) -> Optional[Baseline]:
+        """Return a job's baseline, or None if it has none (or an unreadable one)."""
+        if job_name not in self._baselines:
+            try:
+                self._baselines[job_name] = Baseline.load(baseline_path(self.logs_dir, job_name))
+            except (OSError, ValueError, struct.error):
+                self._baselines[job_name] = None
+        return self._baselines[job_name]
+
+
+def novel_excerpt(lines: list[str], limit: int = EXCERPT_LINES) -> list[str]:
+    """Return the last `limit` novel lines with error keywords, or the last ones if none has one."""
+    errors = [line for line in lines if ERROR_LINE_PATTERN.search(line)]
+    return [line.rstrip()[:300] for line in (errors or lines)[-limit:]]
@@ -0,0 +1,550 @@
+"""Compression codecs shared by the download, archive and classify scripts.
+
+Files keep their original names when compressed; the codec is detected from
+the magic bytes at the start of the file, never from the extension.
+
+zstd files may be compressed with a dictionary trained on similar files
+(see archive-logs.py --dictionary). Dictionaries are stored as
+<dict-id>.dict in a DICTIONARY_DIR next to the logs; readers take the
+dictionary ID from the frame header and look for the dictionary in the
+file's directory and its ancestors.
+
+Seekable files (see archive-logs.py --seekable) are split into independently
+compressed frames with a table of their sizes at the end, so
+RandomAccessReader can read a byte range or the tail by decompressing only
+the frames it overlaps:
+
+- zstd: the zstd seekable format (seek table in a trailing skippable frame)
+- gzip: one gzip member per frame, plus an empty final member whose extra
+  field holds the table (gzip readers still see a single stream)
+
+gzip is decompressed with the fastest implementation installed: isal
+(Intel ISA-L), then zlib-ng, then the standard library. The environment
+variable CI_LOGS_GZIP_BACKEND picks one explicitly (see bench-codecs.py).
+Files are written with the standard library either way.
+"""
+
+import functools
+import gzip
+import io
+import os
+import struct
+from bisect import bisect_right
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    from isal import igzip
+except ImportError:  # optional dependency
+    igzip = None
+
+try:
+    from zlib_ng import gzip_ng
+except ImportError:  # optional dependency
+    gzip_ng = None
+
+# Magic bytes
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+CODECS = ["gzip", "zstd"]
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+LEVEL_RANGES = {"gzip": (1, 9), "zstd": (1, 22)}
+
+# Extensions of formats that are already compressed (or compress so poorly
+# that it isn't worth the CPU). Matching is case-insensitive.
+COMPRESSED_EXTENSIONS = {
+    ".gz", ".gzip", ".tgz", ".zst", ".zip", ".bz2", ".xz",
+    ".webm", ".mp4", ".png", ".jpg", ".jpeg", ".gif",
+}
+
+# Written by archive-logs.py into a run directory once all its files are
+# compressed; the downloaders remove it when they add files to the run.
+ARCHIVED_MARKER = ".archived"
+
+# Directory holding trained zstd dictionaries, e.g. ci-logs/.zstd-dictionaries
+DICTIONARY_DIR = ".zstd-dictionaries"
+DEFAULT_DICTIONARY_SIZE = 112640  # zstd's default (110 KiB)
+ZSTD_FRAME_HEADER_SIZE = 18  # maximum size of a zstd frame header
+
+# Seekable files
+SEEKABLE_FRAME_SIZE = 1024 * 1024  # uncompressed bytes per frame
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_SEEK_FOOTER_SIZE = 9
+GZIP_INDEX_SUBFIELD = b"RI"
+GZIP_INDEX_MAGIC = b"GZRI"
+GZIP_INDEX_TRAILER_SIZE = 18  # entry count and magic, empty deflate block, CRC32 and ISIZE
+GZIP_MAX_EXTRA = 65535
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# gzip implementations with the gzip module's API, fastest first
+GZIP_BACKENDS = {"isal": igzip, "zlib-ng": gzip_ng, "zlib": gzip}
+GZIP_BACKEND_PACKAGES = {"isal": "isal", "zlib-ng": "zlib-ng"}
+GZIP_BACKEND_ENV = "CI_LOGS_GZIP_BACKEND"
+
+
+def codec_available(codec: str) -> bool:
+    """Check whether the Python package backing a codec is installed."""
+    if codec == "gzip":
+        return True
+    if codec == "zstd":
+        return zstandard is not None
+    return False
+
+
+class MissingDecoderError(OSError):
+    """A compressed file can't be read here: zstandard or the zstd dictionary is missing.
+
+    `missing` names what is missing independently of the file, so callers
+    can report each cause once instead of treating the files as absent.
+    """
+
+    def __init__(self, message: str, missing: str):
+        super().__init__(message)
+        self.missing = missing
+
+
+def codec_install_hint(codec: str) -> str:
+    """Return a human-readable hint for installing a codec's package."""
+    if codec == "zstd":
+        return "zstd support requires the zstandard package: pip install zstandard"
+    return f"Unknown codec: {codec}"
+
+
+def available_gzip_backends() -> list[str]:
+    """Return the installed gzip implementations, fastest first."""
+    return [name for name, module in GZIP_BACKENDS.items() if module is not None]
+
+
+def select_gzip_backend(name: Optional[str] = None) -> str:
+    """Select the gzip implementation used for decompression and return its name.
+
+    Without a name, the one in GZIP_BACKEND_ENV is used if it's installed,
+    otherwise the fastest one installed.
+    """
+    global _gzip_backend, _gzip_backend_name
+    if name is None:
+        name = os.environ.get(GZIP_BACKEND_ENV, "")
+        if name not in available_gzip_backends():
+            name = available_gzip_backends()[0]
+    elif name not in GZIP_BACKENDS:
+        raise ValueError(f"Unknown gzip backend: {name}")
+    elif GZIP_BACKENDS[name] is None:
+        raise ValueError(f"gzip backend {name} requires the {GZIP_BACKEND_PACKAGES[name]} package: "
+                         f"pip install {GZIP_BACKEND_PACKAGES[name]}")
+    _gzip_backend, _gzip_backend_name = GZIP_BACKENDS[name], name
+    return name
+
+
+def gzip_backend() -> str:
+    """Return the name of the gzip implementation in use."""
+    return _gzip_backend_name
+
+
+def is_compressible(filename: str) -> bool:
+    """Check whether a file name looks worth compressing (by extension)."""
+    _, ext = os.path.splitext(filename)
+    return ext.lower() not in COMPRESSED_EXTENSIONS
+
+
+def detect_codec(magic: bytes) -> Optional[str]:
+    """Return the codec name for the given leading bytes, or None if plain."""
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def detect_file_codec(filepath) -> Optional[str]:
+    """Return the codec a file is compressed with, or None if uncompressed."""
+    try:
+        with open(filepath, "rb") as f:
+            return detect_codec(f.read(4))
+    except (IOError, OSError):
+        return None
+
+
+def train_dictionary(samples: list[bytes], dict_size: int = DEFAULT_DICTIONARY_SIZE):
+    """Train a zstd dictionary on sample file contents."""
+    if zstandard is None:
+        raise RuntimeError(codec_install_hint("zstd"))
+    return zstandard.train_dictionary(dict_size, samples)
+
+
+def save_dictionary(directory, dictionary) -> Path:
+    """Store a trained dictionary in directory's DICTIONARY_DIR and return its path."""
+    dict_dir = Path(directory) / DICTIONARY_DIR
+    dict_dir.mkdir(parents=True, exist_ok=True)
+    path = dict_dir / f"{dictionary.dict_id()}.dict"
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+    tmp_path.write_bytes(dictionary.as_bytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def latest_dictionary(directory) -> Optional[Path]:
+    """Return the most recently trained dictionary stored for directory, if any."""
+    dict_dir = Path(directory) / DICTIONARY_DIR
+    if not dict_dir.is_dir():
+        return None
+    return max(dict_dir.glob("*.dict"), key=lambda path: path.stat().st_mtime, default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def load_dictionary(path):
+    """Load a dictionary file (cached, so each process reads it once)."""
+    if zstandard is None:
+        raise MissingDecoderError(codec_install_hint("zstd"), "zstandard package")
+    return zstandard.ZstdCompressionDict(Path(path).read_bytes())
+
+
+@functools.lru_cache(maxsize=None)
+def _find_dictionary_path(directory: Path, dict_id: int) -> Optional[Path]:
+    candidate = directory / DICTIONARY_DIR / f"{dict_id}.dict"
+    if candidate.exists():
+        return candidate
+    if directory.parent == directory:
+        return None
+    return _find_dictionary_path(directory.parent, dict_id)
+
+
+def find_dictionary(dict_id: int, filepath):
+    """Find the dictionary with the given ID for a file, searching upwards from it."""
+    path = _find_dictionary_path(Path(filepath).resolve().parent, dict_id)
+    if path is None:
+        raise MissingDecoderError(
+            f"zstd dictionary {dict_id} needed for {filepath} not found in a {DICTIONARY_DIR} directory",
+            f"zstd dictionary {dict_id}",
+        )
+    return load_dictionary(path)
+
+
+class SeekableWriter(io.RawIOBase):
+    """Writes a seekable gzip or zstd file (see the module docstring)."""
+
+    def __init__(self, filepath, codec: str, level: int, dictionary=None, frame_size: int = SEEKABLE_FRAME_SIZE):
+        super().__init__()
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError(codec_install_hint(codec))
+            self._compress = zstandard.ZstdCompressor(level=level, dict_data=dictionary).compress
+        elif codec == "gzip":
+            self._compress = functools.partial(gzip.compress, compresslevel=level, mtime=0)
+        else:
+            raise ValueError(f"Unknown codec: {codec}")
+        self.codec = codec
+        self.frame_size = frame_size
+        self.frames: list[tuple[int, int]] = []  # (compressed size, uncompressed size)
+        self._buffer = bytearray()
+        self._fh = open(filepath, "wb")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.frame_size:
+            self._write_frame(bytes(self._buffer[:self.frame_size]))
+            del self._buffer[:self.frame_size]
+        return len(data)
+
+    def _write_frame(self, chunk: bytes) -> None:
+        compressed = self._compress(chunk)
+        self._fh.write(compressed)
+        self.frames.append((len(compressed), len(chunk)))
+
+    def _seek_table(self) -> bytes:
+        entries = b"".join(struct.pack("<II", *frame) for frame in self.frames)
+        if self.codec == "zstd":
+            footer = struct.pack("<IBI", len(self.frames), 0, ZSTD_SEEKABLE_MAGIC)
+            return struct.pack("<II", ZSTD_SKIPPABLE_MAGIC, len(entries) + len(footer)) + entries + footer
+        data = entries + struct.pack("<I", len(self.frames)) + GZIP_INDEX_MAGIC
+        if len(data) + 4 > GZIP_MAX_EXTRA:
+            return b""  # too many frames for the extra field; readers fall back to streaming
+        header = b"\x1f\x8b\x08\x04" + b"\x00" * 5 + b"\xff"  # FEXTRA, no mtime, unknown OS
+        extra = GZIP_INDEX_SUBFIELD + struct.pack("<H", len(data)) + data
+        return header + struct.pack("<H", len(extra)) + extra + b"\x03\x00" + b"\x00" * 8
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self.frames:
+                self._write_frame(bytes(self._buffer))
+                self._buffer.clear()
+            self._fh.write(self._seek_table())
+        finally:
+            self._fh.close()
+            super().close()
+
+
+def read_seek_table(filepath, codec: str) -> Optional[list[tuple[int, int, int, int]]]:
+    """Return the frames of a seekable file, or None if it isn't seekable.
+
+    Each frame is (compressed offset, uncompressed offset, compressed size,
+    uncompressed size).
+    """
+    try:
+        with open(filepath, "rb") as f:
+            file_size = f.seek(0, os.SEEK_END)
+            if codec == "zstd":
+                if file_size < ZSTD_SEEK_FOOTER_SIZE:
+                    return None
+                f.seek(-ZSTD_SEEK_FOOTER_SIZE, os.SEEK_END)
+                count, descriptor, magic = struct.unpack("<IBI", f.read(ZSTD_SEEK_FOOTER_SIZE))
+                if magic != ZSTD_SEEKABLE_MAGIC:
+                    return None
+                entry_size = 12 if descriptor & 0x80 else 8  # optional checksums
+                table_size = count * entry_size
+                f.seek(file_size - ZSTD_SEEK_FOOTER_SIZE - table_size)
+                table = f.read(table_size)
+                sizes = [struct.unpack_from("<II", table, i * entry_size) for i in range(count)]
+            elif codec == "gzip":
+                if file_size < GZIP_INDEX_TRAILER_SIZE:
+                    return None
+                f.seek(-GZIP_INDEX_TRAILER_SIZE, os.SEEK_END)
+                trailer = f.read(GZIP_INDEX_TRAILER_SIZE)
+                if trailer[4:8] != GZIP_INDEX_MAGIC or trailer[8:] != b"\x03\x00" + b"\x00" * 8:
+                    return None
+                count = struct.unpack("<I", trailer[:4])[0]
+                f.seek(file_size - GZIP_INDEX_TRAILER_SIZE - count * 8)
+                table = f.read(count * 8)
+                sizes = list(struct.iter_unpack("<II", table))
+            else:
+                return None
+    except (OSError, struct.error):
+        return None
+
+    frames = []
+    compressed_offset = uncompressed_offset = 0
+    for compressed_size, uncompressed_size in sizes:
+        frames.append((compressed_offset, uncompressed_offset, compressed_size, uncompressed_size))
+        compressed_offset += compressed_size
+        uncompressed_offset += uncompressed_size
+    return frames
+
+
+class RangeReader:
+    """Byte and line ranges of some content; subclasses provide size and read_range()."""
+
+    size: int
+
+    def read_range(self, start: int, end: Optional[int] = None) -> bytes:
+        """Return bytes [start, end) of the content (end=None reads to the end)."""
+        raise NotImplementedError
+
+    def read_tail(self, nbytes: int) -> bytes:
+        """Return the last nbytes of the content."""
+        return self.read_range(max(0, self.size - nbytes))
+
+    def read_tail_lines(self, count: int) -> bytes:
+        """Return the last count lines of the content."""
+        size = self.size
+        start = size
+        block = TAIL_BLOCK_SIZE
+        data = b""
+        while start > 0:
+            new_start = max(0, start - block)
+            data = self.read_range(new_start, start) + data
+            start = new_start
+            # One extra newline: the content may end with one
+            if data.count(b"\n") > count:
+                break
+            block *= 2
+        lines = data.splitlines(keepends=True)
+        return b"".join(lines[-count:]) if count > 0 else b""
+
+    def read_lines_around(self, offset: int, before: int = 5, after: int = 5) -> bytes:
+        """Return the line containing offset with up to before/after lines of context."""
+        size = self.size
+        offset = min(max(0, offset), size)
+        window = TAIL_BLOCK_SIZE
+        while True:
+            start = max(0, offset - window)
+            end = min(size, offset + window)
+            data = self.read_range(start, end)
+            head, tail = data[:offset - start], data[offset - start:]
+            head_lines = head.split(b"\n")
+            tail_lines = tail.split(b"\n")
+            enough_before = start == 0 or len(head_lines) > before + 1
+            enough_after = end == size or len(tail_lines) > after + 1
+            if enough_before and enough_after:
+                break
+            window *= 2
+        # head_lines[-1] + tail_lines[0] is the line containing offset
+        lines = head_lines[-before - 1:-1] + [head_lines[-1] + tail_lines[0]] + tail_lines[1:after + 1]
+        return b"\n".join(lines)
+
+
+class BytesReader(RangeReader):
+    """A RangeReader over content already in memory."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+    def read_range(self, start: int, end: Optional[int] = None) -> bytes:
+        return self.data[start:end]
+
+
+class RandomAccessReader(RangeReader):
+    """Reads byte ranges of a file's (decompressed) content.
+
+    Seekable files only decompress the frames a range overlaps and plain
+    files are read directly. Other compressed files are decompressed from
+    the start once and kept in memory.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.codec = detect_file_codec(filepath)
+        self.frames = read_seek_table(filepath, self.codec) if self.codec else None
+        self._starts = [frame[1] for frame in self.frames] if self.frames else []
+        self._content: Optional[bytes] = None
+
+    @property
+    def seekable(self) -> bool:
+        return self.codec is None or bool(self.frames)
+
+    def _decompressed(self) -> bytes:
+        if self._content is None:
+            with open_decompressed(self.filepath) as f:
+                self._content = f.read()
+        return self._content
+
+    @property
+    def size(self) -> int:
+        """Size of the decompressed content."""
+        if self.codec is None:
+            return os.path.getsize(self.filepath)
+        if self.frames:
+            _, offset, _, size = self.frames[-1]
+            return offset + size
+        return len(self._decompressed())
+
+    def _decompress_frame(self, data: bytes) -> bytes:
+        if self.codec == "gzip":
+            return _gzip_backend.decompress(data)
+        if zstandard is None:
+            raise MissingDecoderError(codec_install_hint("zstd"), "zstandard package")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = find_dictionary(dict_id, self.filepath) if dict_id else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+
+    def read_range(self, start: int, end: Optional[int] = None) -> bytes:
+        """Return bytes [start, end) of the content (end=None reads to the end)."""
+        if self.codec is None:
+            with open(self.filepath, "rb") as f:
+                f.seek(start)
+                return f.read(-1 if end is None else max(0, end - start))
+        if not self.frames:
+            return self._decompressed()[start:end]
+
+        if end is None:
+            end = self.size
+        if start >= end:
+            return b""
+        parts = []
+        with open(self.filepath, "rb") as f:
+            for i in range(max(0, bisect_right(self._starts, start) - 1), len(self.frames)):
+                compressed_offset, offset, compressed_size, _ = self.frames[i]
+                if offset >= end:
+                    break
+                f.seek(compressed_offset)
+                data = self._decompress_frame(f.read(compressed_size))
+                parts.append(data[max(0, start - offset):end - offset])
+        return b"".join(parts)
+
+
+def open_compressed_writer(
+    filepath, codec: str, level: Optional[int] = None, dictionary=None, seekable: bool = False
+) -> BinaryIO:
+    """Open a binary file object that compresses everything written to it.
+
+    dictionary (zstd only) is a dictionary returned by load_dictionary().
+    With seekable=True the file is written in independently compressed
+    frames with a seek table (see RandomAccessReader).
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    if seekable:
+        return SeekableWriter(filepath, codec, level, dictionary)
+    if codec == "gzip":
+        return gzip.open(filepath, "wb", compresslevel=level)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(codec_install_hint(codec))
+        fh = open(filepath, "wb")
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+        return compressor.stream_writer(fh, closefd=True)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def open_decompressed(filepath) -> BinaryIO:
+    """Open a file for binary reading, transparently decompressing it."""
+    codec = detect_file_codec(filepath)
+    if codec == "gzip":
+        return _gzip_backend.open(filepath, "rb")
+    if codec == "zstd":
+        if zstandard is None:
+            raise MissingDecoderError(codec_install_hint(codec), "zstandard package")
+        fh = open(filepath, "rb")
+        dictionary = None
+        dict_id = zstandard.get_frame_parameters(fh.read(ZSTD_FRAME_HEADER_SIZE)).dict_id
+        fh.seek(0)
+        if dict_id:
+            dictionary = find_dictionary(dict_id, filepath)
+        # Seekable files consist of many frames (and a skippable seek table)
+        return zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(
+            fh, closefd=True, read_across_frames=True
+        )
+    return open(filepath, "rb")
+
+
+def read_decompressed(filepath) -> bytes:
+    """Read a whole file's (decompressed) content.
+
+    gzip files are read and decompressed in one call, which is faster than
+    streaming them through open_decompressed.
+    """
+    with open(filepath, "rb") as f:
+        data = f.read()
+    codec = detect_codec(data[:4])
+    if codec == "gzip":
+        return _gzip_backend.decompress(data)
+    if codec == "zstd":
+        with open_decompressed(filepath) as f:
+            return f.read()
+    return data
+
+
+def decompress_bytes(data: bytes, dictionary=None) -> bytes:
+    """Decompress an in-memory buffer if its magic bytes say it's compressed.
+
+    zstd data compressed with a dictionary needs that dictionary passed in.
+    """
+    codec = detect_codec(data[:4])
+    if codec == "gzip":
+        return _gzip_backend.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise MissingDecoderError(codec_install_hint(codec), "zstandard package")
+        if dictionary is None and (dict_id := zstandard.get_frame_parameters(data).dict_id):
+            raise MissingDecoderError("zstd data was compressed with a dictionary", f"zstd dictionary {dict_id}")
+        # Seekable content consists of many frames (and a skippable seek table)
+        reader = zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(
+            io.BytesIO(data), read_across_frames=True
+        )
+        return reader.read()
+    return data
+
+
+_gzip_backend, _gzip_backend_name = gzip, "zlib"
+select_gzip_backend()
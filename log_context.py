@@ -0,0 +1,109 @@
+"""Build log excerpts for the AI root cause analysis, within a token budget.
+
+Build logs run to hundreds of thousands of characters, mostly setup output
+and polling loops, while the failure is a few lines, not always at the end.
+Instead of a fixed head and tail, the log is cut into windows of
+WINDOW_LINES lines, each scored by:
+
+- proximity to the anchors, the offsets of the rule matches found by
+  analyze_build_log (timeout, error, interrupt and infra category), halving
+  with each window of distance,
+- the lines matching error keywords,
+- novelty: lines that occur once in the log score 1, lines repeated n times
+  (after masking digits) 1/n, so polling and retry loops rank low,
+
+with bonuses for the last window, where failed jobs usually end, and the
+first, which identifies the job and its setup. The best
+windows are packed greedily into the budget and returned in log order,
+gaps marked with the number of lines left out.
+"""
+
+import re
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from typing import Iterable
+
+from template_miner import ANSI_ESCAPE_PATTERN, ERROR_LINE_PATTERN
+
+DEFAULT_TOKEN_BUDGET = 4000
+CHARS_PER_TOKEN = 4  # rough estimate for English text and logs
+WINDOW_LINES = 12
+MAX_LINE_LENGTH = 400  # longer lines (JSON dumps, base64) are cut
+
+PROXIMITY_WEIGHT = 4.0
+KEYWORD_WEIGHT = 1.5
+NOVELTY_WEIGHT = 1.0
+LAST_WINDOW_BONUS = 2.0
+FIRST_WINDOW_BONUS = 1.0
+MAX_KEYWORD_LINES = 4  # keyword lines beyond this many per window don't add to the score
+
+_DIGITS = re.compile(r"\d+")
+# ERROR_LINE_PATTERN without IGNORECASE, for the lowercased log: several times faster
+_LOWERCASE_KEYWORDS = re.compile(ERROR_LINE_PATTERN.pattern)
+
+
+def estimate_tokens(text: str) -> int:
+    """Return a rough token count of a text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _gap(lines: int) -> str:
+    return f"... [{lines} lines omitted] ..."
+
+
+def select_context(text: str, anchors: Iterable[int] = (), token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Return the most relevant parts of a log that fit in token_budget tokens.
+
+    anchors are character offsets in text (e.g. regex match starts). Logs
+    within the budget are returned unchanged.
+    """
+    if estimate_tokens(text) <= token_budget:
+        return text
+    raw_lines = text.split("\n")
+    line_ends = list(accumulate(len(line) + 1 for line in raw_lines))
+    lines = [line if len(line) <= MAX_LINE_LENGTH else line[:MAX_LINE_LENGTH] + " [...]" for line in raw_lines]
+    anchor_windows = sorted({bisect_right(line_ends, offset) // WINDOW_LINES for offset in anchors})
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        matches = _LOWERCASE_KEYWORDS.finditer(lowered)
+    else:  # a few characters lowercase to two, shifting offsets
+        matches = ERROR_LINE_PATTERN.finditer(text)
+    keyword_lines = {bisect_right(line_ends, match.start()) for match in matches}
+
+    keys = [_DIGITS.sub("0", ANSI_ESCAPE_PATTERN.sub("", line)).strip() for line in lines]
+    counts = Counter(keys)
+
+    windows = []  # (score, index, first line, end line, tokens)
+    count = (len(lines) + WINDOW_LINES - 1) // WINDOW_LINES
+    for index in range(count):
+        start, end = index * WINDOW_LINES, min((index + 1) * WINDOW_LINES, len(lines))
+        window = lines[start:end]
+        keywords = sum(1 for line in range(start, end) if line in keyword_lines)
+        novelty = sum(1 / counts[key] for key in keys[start:end] if key) / len(window)
+        proximity = max((0.5 ** abs(index - anchor) for anchor in anchor_windows), default=0.0)
+        score = (PROXIMITY_WEIGHT * proximity
+                 + KEYWORD_WEIGHT * min(keywords, MAX_KEYWORD_LINES) / MAX_KEYWORD_LINES
+                 + NOVELTY_WEIGHT * novelty
+                 + (LAST_WINDOW_BONUS if index == count - 1 else 0.0)
+                 + (FIRST_WINDOW_BONUS if index == 0 else 0.0))
+        tokens = estimate_tokens("\n".join(window)) + estimate_tokens(_gap(len(lines)))
+        windows.append((score, index, start, end, tokens))
+
+    selected = []
+    remaining = token_budget
+    for score, index, start, end, tokens in sorted(windows, key=lambda w: (-w[0], -w[1])):
+        if tokens <= remaining:
+            selected.append((start, end))
+            remaining -= tokens
+
+    parts = []
+    position = 0
+    for start, end in sorted(selected):
+        if start > position:
+            parts.append(_gap(start - position))
+        parts.extend(lines[start:end])
+        position = end
+    if position < len(lines):
+        parts.append(_gap(len(lines) - position))
+    return "\n".join(parts)
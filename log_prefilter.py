@@ -0,0 +1,97 @@
+"""Literal prefilter for the regexes classify-failures.py runs over build logs.
+
+Most build logs contain none of the rare failure markers, yet a plain
+re.search scans the whole log for each of them. A LogPattern therefore
+names literals (matched case-insensitively) one of which occurs in every
+match of its regex. LogScan lowercases a log once and locates literals with
+str.find, which is several times faster than the regexes; a pattern's regex
+then only runs where its literals are:
+
+- line patterns (matches never cross a line break) on the lines containing
+  a literal, or from the first such line on if there are many
+- multiline patterns, whose literal starts every match, from the first
+  occurrence of a literal on
+
+Patterns without literals search the whole log.
+
+Either way the result is the first match in the log, exactly as
+re.search over the whole log would find it.
+"""
+
+import re
+from typing import Iterable, Optional
+
+# Up to this many lines with a literal are searched one by one; with more,
+# the pattern searches the rest of the log from the first one in one call
+MAX_WINDOWS = 32
+
+
+class LogPattern:
+    """A regex with the literals that locate its matches.
+
+    multiline=True is required if a match can cross a line break; its
+    literals must then be where every match starts.
+    """
+
+    def __init__(self, regex: str, literals: Iterable[str], flags: int = 0, multiline: bool = False):
+        self.regex = re.compile(regex, flags)
+        self.literals = tuple(literal.lower() for literal in literals)
+        self.multiline = multiline
+
+    def __repr__(self) -> str:
+        return f"LogPattern({self.regex.pattern!r})"
+
+
+class LogScan:
+    """One log, with the occurrences of literals looked up (and cached) on demand."""
+
+    def __init__(self, text: str):
+        self.text = text
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters lowercase to two; fall back to ASCII so
+            # offsets stay aligned with the text
+            lowered = text.translate(_ASCII_LOWER)
+        self._lowered = lowered
+        self._offsets: dict[str, list[int]] = {}
+
+    def offsets(self, literal: str) -> list[int]:
+        """Return the first MAX_WINDOWS + 1 offsets of a (lowercase) literal in the log."""
+        if literal not in self._offsets:
+            found = []
+            offset = self._lowered.find(literal)
+            while offset != -1 and len(found) <= MAX_WINDOWS:
+                found.append(offset)
+                offset = self._lowered.find(literal, offset + 1)
+            self._offsets[literal] = found
+        return self._offsets[literal]
+
+    def search(self, pattern: LogPattern) -> Optional[re.Match]:
+        """Return the first match of a pattern in the log, like pattern.regex.search(text)."""
+        if not pattern.literals:
+            return pattern.regex.search(self.text)
+        lists = [self.offsets(literal) for literal in pattern.literals]
+        offsets = sorted(offset for found in lists for offset in found)
+        if not offsets:
+            return None
+        text = self.text
+        if pattern.multiline:
+            return pattern.regex.search(text, offsets[0])
+        if any(len(found) > MAX_WINDOWS for found in lists):
+            return pattern.regex.search(text, text.rfind("\n", 0, offsets[0]) + 1)
+
+        searched = -1  # end of the last line searched
+        for offset in offsets:
+            if offset < searched:
+                continue
+            start = text.rfind("\n", 0, offset) + 1
+            end = text.find("\n", offset)
+            if end == -1:
+                end = len(text)
+            if match := pattern.regex.search(text, start, end):
+                return match
+            searched = end
+        return None
+
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""Retention and tiered storage for CI logs.
+
+Runs are demoted through retention tiers (see run_retention.py) as they age:
+
+  no-media      videos, screenshots, traces and tarballs are deleted
+  compressed    every remaining file is compressed, as archive-logs.py does
+  inputs-only   only the files classify-failures.py reads are kept
+  results-only  the run is classified once, the result is stored as
+                <run-id>.result.json and the run is deleted; classify-failures.py
+                reports the stored result from then on
+
+A run's age is counted from its start time (started.json). With --budget,
+runs are also demoted while the directory uses more disk space than that:
+every run loses its media before any run is compressed, and so on, and
+within a tier the least recently used runs go first (oldest start time, or
+oldest access time with --order access).
+
+Each demotion is recorded in the run directory, so the downloaders don't
+fetch the dropped files again. Bundled runs (archive-logs.py --bundle) are
+already compressed and can only be retired to results only.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from log_codecs import open_decompressed
+from run_bundle import BUNDLE_SUFFIX, RunBundle, bundle_path
+from run_retention import (
+    TIER_COMPRESSED,
+    TIER_FULL,
+    TIER_INPUTS_ONLY,
+    TIER_NAMES,
+    TIER_NO_MEDIA,
+    TIER_RESULTS_ONLY,
+    result_path,
+    retention_tier,
+    set_retention_tier,
+)
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DAY = 86400
+
+# Kept with the classifier inputs at the inputs-only tier, for the run's age
+KEEP_WITH_INPUTS = {"started.json"}
+
+
+def load_script(filename: str, module_name: str):
+    """Import one of the sibling scripts (their file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(module_name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+downloader = load_script("download-ci-logs.py", "download_ci_logs")
+archiver = load_script("archive-logs.py", "archive_logs")
+
+
+@dataclass
+class Run:
+    """A run directory (or bundle) below <directory>/<pr>/<job>/."""
+    run_dir: Path
+    pr: str
+    job_name: str
+    run_id: str
+    tier: int
+    bundled: bool
+    started: float  # start time (Unix), or the modification time if unknown
+    accessed: float  # latest access time of its files
+    size: int  # bytes on disk
+
+    @property
+    def label(self) -> str:
+        return f"{self.pr}/{self.job_name}/{self.run_id}"
+
+
+def file_usage(st: os.stat_result) -> int:
+    """Bytes a file occupies on disk, shared between its hardlinks (see archive-logs.py --dedup)."""
+    return st.st_blocks * 512 // max(st.st_nlink, 1)
+
+
+def run_files(run_dir: Path) -> list[tuple[Path, str]]:
+    """Return (path, run-relative path) of the files in a run directory, without bookkeeping files."""
+    files = []
+    for root, dirs, filenames in os.walk(run_dir):
+        for filename in filenames:
+            if filename.startswith(".") or filename.endswith(".part"):
+                continue
+            filepath = Path(root) / filename
+            files.append((filepath, filepath.relative_to(run_dir).as_posix()))
+    return files
+
+
+def measure(run_dir: Path) -> tuple[int, float]:
+    """Return (bytes on disk, latest access time) of a run directory and its bundle."""
+    size = 0
+    accessed = 0.0
+    paths = [Path(root) / name for root, _, names in os.walk(run_dir) for name in names]
+    paths.append(bundle_path(run_dir))
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        size += file_usage(st)
+        accessed = max(accessed, st.st_atime)
+    return size, accessed
+
+
+def read_started(run_dir: Path) -> float | None:
+    """Return a run's start time from its started.json (on disk or in its bundle)."""
+    path = run_dir / "started.json"
+    try:
+        if path.is_file():
+            with open_decompressed(path) as f:
+                data = f.read()
+        else:
+            bundle = RunBundle.open(run_dir)
+            if bundle is None:
+                return None
+            try:
+                data = bundle.read("started.json")
+            finally:
+                bundle.close()
+        return float(json.loads(data)["timestamp"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def find_runs(directory: Path) -> list[Run]:
+    """Find the run directories and bundles below <directory>/<pr>/<job>/."""
+    runs = []
+    for pr_dir in sorted(directory.iterdir()):
+        if not pr_dir.is_dir() or not pr_dir.name.isdigit():
+            continue
+        for job_dir in sorted(pr_dir.iterdir()):
+            if not job_dir.is_dir():
+                continue
+            run_ids = set()
+            for entry in job_dir.iterdir():
+                if entry.is_dir():
+                    run_ids.add(entry.name)
+                elif entry.name.endswith(BUNDLE_SUFFIX):
+                    run_ids.add(entry.name[:-len(BUNDLE_SUFFIX)])
+            for run_id in sorted(run_ids):
+                if not run_id.isdigit():
+                    continue
+                run_dir = job_dir / run_id
+                bundled = bundle_path(run_dir).is_file()
+                size, accessed = measure(run_dir)
+                started = read_started(run_dir)
+                if started is None:
+                    started = (bundle_path(run_dir) if bundled else run_dir).stat().st_mtime
+                runs.append(Run(
+                    run_dir=run_dir,
+                    pr=pr_dir.name,
+                    job_name=job_dir.name,
+                    run_id=run_id,
+                    tier=retention_tier(run_dir),
+                    bundled=bundled,
+                    started=started,
+                    accessed=accessed,
+                    size=size,
+                ))
+    return runs
+
+
+def remove_files(files: list[Path], dry_run: bool) -> int:
+    """Delete files, returning the bytes freed (or that would be freed)."""
+    freed = 0
+    for filepath in files:
+        try:
+            freed += file_usage(filepath.stat())
+            if not dry_run:
+                filepath.unlink()
+        except OSError as e:
+            print(f"  Error removing {filepath}: {e}")
+    return freed
+
+
+def remove_empty_directories(run_dir: Path) -> None:
+    for root, dirs, files in os.walk(run_dir, topdown=False):
+        if Path(root) != run_dir and not os.listdir(root):
+            os.rmdir(root)
+
+
+def drop_media(run: Run, dry_run: bool) -> int:
+    """Delete the media files the downloader skips with --exclude-media."""
+    files = [
+        filepath for filepath, relative_path in run_files(run.run_dir)
+        if downloader.should_exclude(relative_path, downloader.MEDIA_EXCLUDE_PATTERNS)
+    ]
+    return remove_files(files, dry_run)
+
+
+def compress_run(run: Run, codec: str, level: int, dry_run: bool) -> int:
+    """Compress the files of a run that aren't compressed yet and mark it archived."""
+    skip_extensions = archiver.COMPRESSED_EXTENSIONS | archiver.BINARY_EXTENSIONS
+    files = [
+        filepath for filepath, _ in run_files(run.run_dir)
+        if filepath.suffix.lower() not in skip_extensions and not archiver.is_compressed(str(filepath))
+    ]
+    if dry_run:
+        return 0  # unknown until compressed
+    freed = 0
+    for filepath in files:
+        success, original_size, compressed_size, error = archiver.compress_file(str(filepath), codec, level)
+        if success:
+            freed += original_size - compressed_size
+        else:
+            print(f"  Error compressing {filepath}: {error}")
+    archiver.mark_archived(str(run.run_dir))
+    return freed
+
+
+def keep_inputs(run: Run, dry_run: bool) -> int:
+    """Delete everything but the classifier inputs (and started.json)."""
+    files = [
+        filepath for filepath, relative_path in run_files(run.run_dir)
+        if not downloader.is_classifier_input(relative_path) and relative_path not in KEEP_WITH_INPUTS
+    ]
+    freed = remove_files(files, dry_run)
+    if not dry_run:
+        remove_empty_directories(run.run_dir)
+    return freed
+
+
+def retire_run(run: Run, classifier, dry_run: bool) -> int:
+    """Classify a run, store the result and delete the run directory and bundle."""
+    if dry_run:
+        return run.size
+    analysis = classifier.analyze_run(run.run_dir, run.pr, run.run_id, job_name=run.job_name)
+    classifier.save_run_result(analysis, result_path(run.run_dir))
+    shutil.rmtree(run.run_dir, ignore_errors=True)
+    bundle_path(run.run_dir).unlink(missing_ok=True)
+    return run.size
+
+
+def demote(run: Run, tier: int, codec: str, level: int, classifier, dry_run: bool) -> int:
+    """Demote a run to the given tier.
+
+    Files are deleted before the rest is compressed, and runs going to
+    results only are retired without the intermediate steps. Bundled runs
+    skip straight to results only (or stay as they are).
+
+    Returns: bytes freed (estimated without compression with dry_run)
+    """
+    if tier <= run.tier or (run.bundled and tier < TIER_RESULTS_ONLY):
+        return 0
+    previous = run.tier
+    if tier == TIER_RESULTS_ONLY:
+        freed = retire_run(run, classifier, dry_run)
+    else:
+        freed = 0
+        if previous < TIER_NO_MEDIA:
+            freed += drop_media(run, dry_run)
+        if tier >= TIER_INPUTS_ONLY:
+            freed += keep_inputs(run, dry_run)
+        if previous < TIER_COMPRESSED <= tier:
+            freed += compress_run(run, codec, level, dry_run)
+        if not dry_run:
+            set_retention_tier(run.run_dir, tier)
+    run.tier = tier
+    if not dry_run:
+        # Measure instead of adding up, for block rounding and hardlinks
+        size = measure(run.run_dir)[0]
+        if tier == TIER_RESULTS_ONLY:
+            size += file_usage(result_path(run.run_dir).stat())
+        freed = run.size - size
+    freed = min(freed, run.size)
+    run.size -= freed
+    action = "Would demote" if dry_run else "Demoted"
+    print(f"{action} {run.label}: {TIER_NAMES[previous]} -> {TIER_NAMES[tier]} ({format_size(freed)} freed)")
+    return freed
+
+
+def tree_usage(directory: Path) -> int:
+    """Bytes on disk below a directory, counting hardlinked files once."""
+    total = 0
+    seen = set()
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            try:
+                st = os.lstat(os.path.join(root, filename))
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_blocks * 512
+    return total
+
+
+def format_size(size_bytes: int) -> str:
+    """Format bytes as human-readable string."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Demote CI runs through retention tiers by age and disk budget."
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default="ci-logs",
+        help="Directory with downloaded logs (default: ci-logs)",
+    )
+    parser.add_argument(
+        "--media-days",
+        type=float,
+        default=None,
+        help="Delete videos, screenshots, traces and tarballs of runs older than this many days",
+    )
+    parser.add_argument(
+        "--compress-days",
+        type=float,
+        default=None,
+        help="Compress all files of runs older than this many days",
+    )
+    parser.add_argument(
+        "--inputs-days",
+        type=float,
+        default=None,
+        help="Keep only the classifier inputs of runs older than this many days",
+    )
+    parser.add_argument(
+        "--results-days",
+        type=float,
+        default=None,
+        help="Replace runs older than this many days with their stored classification result",
+    )
+    parser.add_argument(
+        "--budget",
+        type=downloader.parse_size,
+        default=None,
+        metavar="SIZE",
+        help="Demote runs, least recently used first, until the directory uses at most SIZE on disk (e.g. 50G)",
+    )
+    parser.add_argument(
+        "--order",
+        choices=["age", "access"],
+        default="age",
+        help="What least recently used means for --budget: oldest start time or oldest file access "
+             "(default: age)",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=archiver.CODECS,
+        default="gzip",
+        help="Compression codec for the compressed tier (default: gzip)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        "-n",
+        action="store_true",
+        help="Show what would be demoted without changing anything (compression savings are not estimated)",
+    )
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Error: {directory} is not a directory")
+        sys.exit(1)
+    age_tiers = [
+        (TIER_NO_MEDIA, args.media_days),
+        (TIER_COMPRESSED, args.compress_days),
+        (TIER_INPUTS_ONLY, args.inputs_days),
+        (TIER_RESULTS_ONLY, args.results_days),
+    ]
+    age_tiers = [(tier, days) for tier, days in age_tiers if days is not None]
+    if not age_tiers and args.budget is None:
+        print("Error: give at least one of --media-days, --compress-days, --inputs-days, --results-days or --budget")
+        sys.exit(1)
+    if not archiver.codec_available(args.codec):
+        print(f"Error: {archiver.codec_install_hint(args.codec)}")
+        sys.exit(1)
+    level = archiver.PRESETS[archiver.DEFAULT_PRESET][args.codec]
+
+    # Only needed to retire runs; imported lazily as it's the heaviest
+    classifier = None
+
+    def demote_run(run: Run, tier: int) -> int:
+        nonlocal classifier
+        if tier == TIER_RESULTS_ONLY and classifier is None and not args.dry_run:
+            classifier = load_script("classify-failures.py", "classify_failures")
+        return demote(run, tier, args.codec, level, classifier, args.dry_run)
+
+    print(f"Scanning {directory} for runs...")
+    runs = find_runs(directory)
+    by_tier = [sum(1 for run in runs if run.tier == tier) for tier in range(len(TIER_NAMES))]
+    print(f"Found {len(runs)} runs ({', '.join(f'{n} {name}' for n, name in zip(by_tier, TIER_NAMES) if n)})")
+
+    store = directory / archiver.OBJECT_DIR
+
+    def measure_usage() -> int:
+        """Disk usage after pruning the dedup store.
+
+        Objects of deduplicated files (archive-logs.py --dedup) whose last
+        link was deleted take space until pruned.
+        """
+        if store.is_dir():
+            archiver.store_summary(str(store))
+        return tree_usage(directory)
+
+    initial_usage = 0 if args.dry_run else tree_usage(directory)
+    freed = 0
+    now = time.time()
+    for run in runs:
+        age_days = (now - run.started) / DAY
+        tier = max((tier for tier, days in age_tiers if age_days >= days), default=TIER_FULL)
+        freed += demote_run(run, tier)
+
+    if args.budget is not None:
+        # Per-run savings are estimates: a file sharing its content with
+        # others (--dedup) frees nothing until its last link is gone. For a
+        # real run, measure again before deciding the budget is met.
+        usage = tree_usage(directory) - freed if args.dry_run else measure_usage()
+        exact = True
+        print(f"Disk usage: {format_size(usage)} of {format_size(args.budget)} budget")
+        lru_key = (lambda run: run.started) if args.order == "age" else (lambda run: run.accessed)
+        candidates = sorted((run for run in runs if run.tier < TIER_RESULTS_ONLY), key=lru_key)
+        for tier in range(TIER_NO_MEDIA, TIER_RESULTS_ONLY + 1):
+            for run in candidates:
+                if usage <= args.budget and not exact:
+                    usage, exact = measure_usage(), True
+                if usage <= args.budget:
+                    break
+                saved = demote_run(run, tier)
+                usage -= saved
+                freed += saved
+                exact = args.dry_run
+        if not exact:
+            usage = measure_usage()
+        if usage > args.budget:
+            print(f"Warning: still {format_size(usage - args.budget)} over budget")
+
+    if not args.dry_run:
+        freed = initial_usage - measure_usage()
+
+    print(f"\nDone! {'Would free' if args.dry_run else 'Freed'}: {format_size(freed)}")
+
+
+if __name__ == "__main__":
+    main()
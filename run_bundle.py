@@ -0,0 +1,144 @@
+"""Per-run bundles: a whole run directory packed into one indexed file.
+
+A bundle is a ZIP archive next to the run directory it replaces
+(<job-dir>/<run-id>.bundle.zip). Members are the run's files under their
+run-relative paths, stored decompressed-then-deflated (or as-is for media
+and other already-compressed formats), and the ZIP central directory is the
+table of contents, so single members can be read without unpacking and
+standard unzip tools still work.
+
+Files downloaded into a bundled run later go into the run directory as
+usual; readers look in the directory first and fall back to the bundle,
+and re-bundling merges both.
+"""
+
+import os
+import shutil
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from log_codecs import ARCHIVED_MARKER, is_compressible, open_decompressed
+
+BUNDLE_SUFFIX = ".bundle.zip"
+CHUNK_SIZE = 1024 * 1024
+
+
+def bundle_path(run_dir) -> Path:
+    """Return where the bundle of a run directory lives."""
+    run_dir = Path(run_dir)
+    return run_dir.with_name(run_dir.name + BUNDLE_SUFFIX)
+
+
+def run_dir_of(path) -> Path:
+    """Return the run directory a bundle path stands for (other paths are returned unchanged)."""
+    path = Path(path)
+    if path.name.endswith(BUNDLE_SUFFIX):
+        return path.with_name(path.name[:-len(BUNDLE_SUFFIX)])
+    return path
+
+
+class RunBundle:
+    """Read access to the members of a bundle."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._zip = zipfile.ZipFile(self.path)
+        self.names = set(self._zip.namelist())
+
+    @classmethod
+    def open(cls, run_dir) -> Optional["RunBundle"]:
+        """Open the bundle of a run directory, or return None if there is none."""
+        path = bundle_path(run_dir)
+        if not path.is_file():
+            return None
+        try:
+            return cls(path)
+        except (OSError, zipfile.BadZipFile):
+            return None
+
+    def read(self, relative_path: str) -> Optional[bytes]:
+        """Return a member's content, or None if it's not in the bundle."""
+        if relative_path not in self.names:
+            return None
+        return self._zip.read(relative_path)
+
+    def exists(self, relative_path: str) -> bool:
+        """Check if a member, or a directory containing members, is in the bundle."""
+        prefix = relative_path.rstrip("/") + "/"
+        return relative_path in self.names or any(name.startswith(prefix) for name in self.names)
+
+    def list(self, relative_dir: str = "") -> list[str]:
+        """Return the members below a run-relative directory."""
+        prefix = relative_dir.rstrip("/") + "/" if relative_dir else ""
+        return sorted(name for name in self.names if name.startswith(prefix))
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+def bundled_files(run_dir) -> set[str]:
+    """Return the run-relative paths held in a run's bundle (empty if not bundled)."""
+    bundle = RunBundle.open(run_dir)
+    if bundle is None:
+        return set()
+    try:
+        return bundle.names
+    finally:
+        bundle.close()
+
+
+@dataclass
+class BundleResult:
+    files: int  # members written
+    original_size: int  # bytes of the run directory's files on disk before bundling
+    bundle_size: int
+
+
+def write_bundle(run_dir, level: int = 6) -> BundleResult:
+    """Pack a run directory into its bundle and remove the directory.
+
+    Members of an existing bundle are kept unless the directory has a newer
+    copy. The bundle is written to a temporary file that atomically replaces
+    the old one before the directory is removed, so an interruption never
+    loses files.
+    """
+    run_dir = Path(run_dir)
+    path = bundle_path(run_dir)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+    previous = RunBundle.open(run_dir)
+    files = 0
+    original_size = 0
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+            written = set()
+            for root, dirs, filenames in os.walk(run_dir):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    if filename == ARCHIVED_MARKER or filename.endswith(".part"):
+                        continue
+                    filepath = Path(root) / filename
+                    relative_path = filepath.relative_to(run_dir).as_posix()
+                    original_size += filepath.stat().st_size
+                    if is_compressible(filename):
+                        with open_decompressed(filepath) as src, zf.open(relative_path, "w", force_zip64=True) as dst:
+                            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                    else:
+                        zf.write(filepath, relative_path, compress_type=zipfile.ZIP_STORED)
+                    written.add(relative_path)
+                    files += 1
+            if previous is not None:
+                for relative_path in sorted(previous.names - written):
+                    info = previous._zip.getinfo(relative_path)
+                    with previous._zip.open(info) as src, zf.open(info, "w", force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                    files += 1
+        os.replace(tmp_path, path)
+    finally:
+        if previous is not None:
+            previous.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+    shutil.rmtree(run_dir)
+    return BundleResult(files, original_size, path.stat().st_size)
@@ -0,0 +1,61 @@
+"""Retention tiers of runs in ci-logs (see retain-logs.py).
+
+retain-logs.py demotes runs through these tiers as they age or the disk
+budget runs out. A demoted run records its tier in a RETENTION_MARKER file
+in the run directory (kept in its bundle if it's bundled), so the
+downloaders don't fetch the dropped files again. A run retired to results
+only is replaced by <job-dir>/<run-id>.result.json, the classification
+classify-failures.py saved for it.
+"""
+
+import json
+from pathlib import Path
+
+from run_bundle import RunBundle
+
+RETENTION_MARKER = ".retention"
+RESULT_SUFFIX = ".result.json"
+
+TIER_FULL = 0  # everything that was downloaded
+TIER_NO_MEDIA = 1  # videos, screenshots, traces and tarballs dropped
+TIER_COMPRESSED = 2  # and every file compressed
+TIER_INPUTS_ONLY = 3  # only the files the classifier reads
+TIER_RESULTS_ONLY = 4  # only the stored classification result
+TIER_NAMES = ["full", "no-media", "compressed", "inputs-only", "results-only"]
+
+
+def result_path(run_dir) -> Path:
+    """Return where the stored classification result of a run lives."""
+    run_dir = Path(run_dir)
+    return run_dir.with_name(run_dir.name + RESULT_SUFFIX)
+
+
+def retention_tier(run_dir) -> int:
+    """Return the tier a run has been demoted to (TIER_FULL if it never was)."""
+    run_dir = Path(run_dir)
+    marker = run_dir / RETENTION_MARKER
+    if marker.is_file():
+        data = marker.read_bytes()
+    elif not run_dir.is_dir() and result_path(run_dir).is_file():
+        return TIER_RESULTS_ONLY
+    else:
+        bundle = RunBundle.open(run_dir)
+        if bundle is None:
+            return TIER_FULL
+        try:
+            data = bundle.read(RETENTION_MARKER)
+        finally:
+            bundle.close()
+        if data is None:
+            return TIER_FULL
+    try:
+        return int(json.loads(data)["tier"])
+    except (ValueError, KeyError, TypeError):
+        return TIER_FULL
+
+
+def set_retention_tier(run_dir, tier: int) -> None:
+    """Record the tier of a run directory."""
+    with open(Path(run_dir) / RETENTION_MARKER, "w") as f:
+        json.dump({"tier": tier, "name": TIER_NAMES[tier]}, f)
+        f.write("\n")
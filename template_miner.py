@@ -0,0 +1,199 @@
+"""Online log template mining (Drain) for failures no rule explains.
+
+Lines near errors in the build logs of uncategorized infrastructure failures
+are clustered into templates: "Error from server (NotFound): pods <*> not
+found" stands for every line that differs only where the template has <*>.
+Templates seen in several runs are candidates for new infra rules in
+classifier-rules.toml.
+
+The miner follows Drain (He et al., "Drain: An Online Log Parsing Approach
+with Fixed Depth Tree", ICWS 2017): lines are routed through a fixed-depth
+tree by token count and their first tokens to a handful of clusters, and
+join the most similar one or start a new one, so each line costs a few
+dictionary lookups and comparisons. Logs are fed one at a time and only the
+clusters are kept, at most max_clusters of them (the smallest, least
+recently seen are dropped), so memory stays bounded over thousands of logs.
+"""
+
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+WILDCARD = "<*>"
+
+# Lines worth mining: errors and the lines around them
+ERROR_LINE_PATTERN = re.compile(
+    r"error|fail|fatal|panic|exception|timed? ?out|refused|denied|forbidden|cannot|unable|not found|❌",
+    re.IGNORECASE,
+)
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+# Variable parts replaced before tokenizing, most specific first
+MASK_PATTERNS = [
+    re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b"),  # timestamps
+    re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE),  # UUIDs
+    re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),  # IPv4 addresses
+    re.compile(r"\b(?:sha256:)?[0-9a-f]{12,}\b", re.IGNORECASE),  # hashes, image digests
+]
+
+MAX_LINE_LENGTH = 500
+DEFAULT_CONTEXT = 1
+DEFAULT_LINES_PER_LOG = 200
+EXAMPLE_RUNS = 3
+
+
+def error_lines(text: str, context: int = DEFAULT_CONTEXT, limit: int = DEFAULT_LINES_PER_LOG) -> list[str]:
+    """Return the lines matching ERROR_LINE_PATTERN and `context` lines around each.
+
+    Only the last `limit` of them are kept: a failed setup usually ends with
+    the error, and a few noisy logs shouldn't dominate the templates.
+    """
+    lines = text.splitlines()
+    selected: deque[int] = deque(maxlen=limit)
+    last = -1
+    for i, line in enumerate(lines):
+        if ERROR_LINE_PATTERN.search(line):
+            for j in range(max(i - context, last + 1), min(i + context + 1, len(lines))):
+                selected.append(j)
+                last = j
+    return [lines[i] for i in selected if lines[i].strip()]
+
+
+def tokenize(line: str) -> list[str]:
+    """Split a log line into tokens, tokens with variable parts (or digits) replaced by WILDCARD."""
+    line = ANSI_ESCAPE_PATTERN.sub("", line)[:MAX_LINE_LENGTH]
+    for pattern in MASK_PATTERNS:
+        line = pattern.sub(WILDCARD, line)
+    return [WILDCARD if WILDCARD in token or any(c.isdigit() for c in token) else token for token in line.split()]
+
+
+@dataclass
+class LogCluster:
+    """A template and the lines it stands for."""
+    cluster_id: int
+    template: list[str]
+    lines: int = 0
+    runs: int = 0
+    example_runs: list[str] = field(default_factory=list)
+    example_line: str = ""
+    last_run: Optional[str] = None
+    last_seen: int = 0
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.template)
+
+    def similarity(self, tokens: list[str]) -> float:
+        """Fraction of positions where the tokens equal the template's (wildcards excluded)."""
+        same = sum(1 for a, b in zip(self.template, tokens) if a == b and a != WILDCARD)
+        return same / len(tokens)
+
+    def merge(self, tokens: list[str]) -> None:
+        self.template = [a if a == b else WILDCARD for a, b in zip(self.template, tokens)]
+
+
+class TemplateMiner:
+    """Clusters log lines into templates with a Drain parse tree."""
+
+    def __init__(
+        self,
+        depth: int = 4,
+        similarity: float = 0.4,
+        max_children: int = 100,
+        max_clusters: int = 1000,
+    ):
+        self.depth = depth
+        self.similarity_threshold = similarity
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        # token count -> first tokens (nested dicts, depth - 2 levels) -> cluster IDs
+        self.tree: dict[int, dict] = {}
+        self.clusters: dict[int, LogCluster] = {}
+        self._leaves: dict[int, list[int]] = {}  # cluster ID -> its leaf in the tree
+        self.next_id = 0
+        self.lines_seen = 0
+        self.logs_seen = 0
+        self.evicted = 0
+
+    def _leaf(self, tokens: list[str]) -> list[int]:
+        node = self.tree.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            if token not in node and len(node) >= self.max_children:
+                # Full nodes send new tokens to the wildcard child
+                token = WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    def add_line(self, line: str, run: str) -> Optional[LogCluster]:
+        """Add one line (of the given run) and return its cluster."""
+        tokens = tokenize(line)
+        if not tokens:
+            return None
+        self.lines_seen += 1
+        leaf = self._leaf(tokens)
+        best, best_similarity = None, -1.0
+        for cluster_id in leaf:
+            cluster = self.clusters[cluster_id]
+            similarity = cluster.similarity(tokens)
+            if similarity > best_similarity:
+                best, best_similarity = cluster, similarity
+        if best is not None and best_similarity >= self.similarity_threshold:
+            best.merge(tokens)
+        else:
+            if len(self.clusters) >= self.max_clusters:
+                self._evict()
+            best = LogCluster(self.next_id, tokens, example_line=line.strip()[:MAX_LINE_LENGTH])
+            self.next_id += 1
+            self.clusters[best.cluster_id] = best
+            leaf.append(best.cluster_id)
+            self._leaves[best.cluster_id] = leaf
+        best.lines += 1
+        best.last_seen = self.lines_seen
+        if best.last_run != run:
+            best.last_run = run
+            best.runs += 1
+            if len(best.example_runs) < EXAMPLE_RUNS:
+                best.example_runs.append(run)
+        return best
+
+    def add_log(self, text: str, run: str, context: int = DEFAULT_CONTEXT, limit: int = DEFAULT_LINES_PER_LOG) -> None:
+        """Mine the error lines of one log."""
+        self.logs_seen += 1
+        for line in error_lines(text, context, limit):
+            self.add_line(line, run)
+
+    def _evict(self) -> None:
+        """Drop the smallest, least recently seen cluster."""
+        victim = min(self.clusters.values(), key=lambda cluster: (cluster.runs, cluster.lines, cluster.last_seen))
+        del self.clusters[victim.cluster_id]
+        self._leaves.pop(victim.cluster_id).remove(victim.cluster_id)
+        self.evicted += 1
+
+    def templates(self, min_runs: int = 1) -> list[LogCluster]:
+        """Return the clusters seen in at least min_runs runs, most widespread first."""
+        clusters = [cluster for cluster in self.clusters.values() if cluster.runs >= min_runs]
+        return sorted(clusters, key=lambda cluster: (cluster.runs, cluster.lines), reverse=True)
+
+
+def candidate_rule(cluster: LogCluster, name: str) -> Optional[str]:
+    """Return an infra rule for classifier-rules.toml matching a template's lines, as TOML.
+
+    Returns None for context lines (templates without an error keyword) and
+    templates without a constant token to anchor a rule on.
+    """
+    constants = [token for token in cluster.template if token != WILDCARD]
+    if not constants or not ERROR_LINE_PATTERN.search(cluster.text):
+        return None
+    regex = r"[ \t]+".join(r"\S+" if token == WILDCARD else re.escape(token) for token in cluster.template)
+    literal = max(constants, key=len).lower()
+    return "\n".join([
+        "[[infra]]",
+        f'name = "{name}"',
+        'category = "UNKNOWN"  # pick or add a category',
+        f"regex = '''{regex}'''",
+        f"literals = [{_toml_string(literal)}]",
+    ])
+
+
+def _toml_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'